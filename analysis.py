@@ -1,17 +1,13 @@
-import sqlite3
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error
-
-DB_NAME = "SmartHome.db"
+from data_access import get_connection
 
 def load_data():
     """Load measures from DB into a Pandas DataFrame."""
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql_query("SELECT * FROM measures", conn)
-    conn.close()
-    return df
+    conn = get_connection()
+    return pd.read_sql_query("SELECT * FROM measures", conn)
 
 def train_model():
     """Simple example: train a regression model on the measures data."""
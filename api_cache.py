@@ -0,0 +1,127 @@
+"""
+Pooled, cached client for the external APIs called from request handlers.
+
+Responses are kept for a short TTL. Past it, the stale response is served while
+a background thread refreshes it, and a request with nothing cached waits for
+the upstream call at most for a time budget, so a slow upstream never holds a
+Flask worker for long.
+"""
+
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+# (connect, read) timeouts of upstream requests, in seconds
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Seconds a response is served without refreshing it
+DEFAULT_TTL = 60
+
+# Seconds a response may still be served (while refreshing) after its TTL
+DEFAULT_STALE_TTL = 3600
+
+# Seconds a request waits for an upstream call when nothing is cached
+DEFAULT_BUDGET = 2.0
+
+# Upstream calls running at the same time
+DEFAULT_WORKERS = 4
+
+
+class UpstreamTimeout(Exception):
+    """Raised when an upstream call did not answer within the budget (it keeps running in the background)."""
+
+
+class ApiCache:
+    """
+    TTL cache with stale-while-refresh in front of a pooled requests.Session.
+
+    Upstream calls run on a small thread pool; concurrent requests for the same
+    key share a single call.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, stale_ttl=DEFAULT_STALE_TTL, budget=DEFAULT_BUDGET,
+                 timeout=DEFAULT_TIMEOUT, workers=DEFAULT_WORKERS):
+        """
+        Initialize the client.
+
+        Args:
+            ttl (float): Seconds a response is fresh
+            stale_ttl (float): Seconds a response may be served stale after its TTL
+            budget (float): Seconds a request waits for an upstream call when nothing is cached
+            timeout (float or tuple): requests timeout of upstream calls
+            workers (int): Upstream calls running at the same time
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.budget = budget
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-cache')
+        self._lock = threading.Lock()
+        self._entries = {}   # key -> (stored at, value)
+        self._pending = {}   # key -> Future of the running upstream call
+
+    def _fetch_json(self, url, params):
+        """Call the upstream and store its JSON response."""
+        key = self.make_key(url, params)
+        try:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            value = response.json()
+            with self._lock:
+                self._entries[key] = (time.monotonic(), value)
+            return value
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    @staticmethod
+    def make_key(url, params):
+        """Build the cache key of a request."""
+        return url, tuple(sorted((params or {}).items()))
+
+    def _submit(self, url, params):
+        """Start an upstream call for a key, or return the one already running (call with the lock held)."""
+        key = self.make_key(url, params)
+        future = self._pending.get(key)
+        if future is None:
+            future = self._executor.submit(self._fetch_json, url, params)
+            self._pending[key] = future
+        return future
+
+    def get_json(self, url, params=None):
+        """
+        Return the JSON response of a GET request.
+
+        Fresh responses are returned directly; stale ones are returned while a
+        refresh runs in the background.
+
+        Returns:
+            tuple: (value, age of the value in seconds)
+
+        Raises:
+            UpstreamTimeout: Nothing usable is cached and the upstream did not answer within the budget
+            requests.RequestException: Nothing usable is cached and the upstream call failed
+        """
+        key = self.make_key(url, params)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] < self.ttl:
+                return entry[1], now - entry[0]
+            if entry and now - entry[0] < self.ttl + self.stale_ttl:
+                self._submit(url, params)
+                return entry[1], now - entry[0]
+            future = self._submit(url, params)
+
+        try:
+            return future.result(timeout=self.budget), 0.0
+        except FutureTimeoutError:
+            raise UpstreamTimeout(f"{url} did not answer within {self.budget:g}s")
@@ -2,15 +2,21 @@ import os
 import re
 import json
 import datetime
-import sqlite3
 import traceback
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-import requests
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response
 from dotenv import load_dotenv
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from werkzeug.security import generate_password_hash, check_password_hash
 import pandas as pd
+from bulk_ingest import MeasureBulkIngestor
+from data_access import get_connection, reset_connections, resolve_path
+from api_cache import ApiCache, UpstreamTimeout, DEFAULT_TTL, DEFAULT_STALE_TTL, DEFAULT_BUDGET
+from history_schema import ensure_history_schema, write_history, WEATHER_TYPES, NON_DEVICE_TYPES
+from history_rollups import read_daily_rollup
+from history_summaries import rollup_frame, weather_matrix, weather_days, weather_summary, device_stats, device_summary
+from job_queue import JobQueue, WorkerPool, DEFAULT_JOBS_DB, DEFAULT_WORKERS, QUEUED, RUNNING, DONE, FAILED
+from timeseries import load_measure_series, query_series, parse_bound, DEFAULT_MAX_POINTS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 # Load environment variables from .env file
 load_dotenv()
@@ -24,6 +30,20 @@ app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///smarthome.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = 'mysecretkey'  # Use environment variable in production
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'uploads')
+app.config['CSV_PROCESS_WORKERS'] = int(os.getenv('CSV_PROCESS_WORKERS', os.cpu_count() or 1))
+app.config['DASHBOARD_MAX_POINTS'] = int(os.getenv('DASHBOARD_MAX_POINTS', DEFAULT_MAX_POINTS))
+app.config['DASHBOARD_DOWNSAMPLING'] = os.getenv('DASHBOARD_DOWNSAMPLING', 'lttb')  # 'lttb' or 'minmax'
+app.config['HISTORY_DB'] = resolve_path()  # Database holding the history table (SQLITE_DB or SmartHome.db)
+app.config['WEATHER_API_URL'] = os.getenv('WEATHER_API_URL', "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/")
+app.config['WEATHER_API_KEY'] = os.getenv('WEATHER_API_KEY', "JA8HYFV9Y52AAS4GGQ4QME87P")
+app.config['WEATHER_CITY'] = os.getenv('WEATHER_CITY', "Tours,FR")
+app.config['JEEDOM_URL'] = os.getenv('JEEDOM_URL', "https://h2o.eu.jeedom.link/")
+app.config['JEEDOM_API_KEY'] = os.getenv('JEEDOM_API_KEY', "AnxyTteWw8DlvZqHQ1rnVFYuRR7NbXN0")
+app.config['EXTERNAL_API_TTL'] = float(os.getenv('EXTERNAL_API_TTL', DEFAULT_TTL))  # Seconds a response is fresh
+app.config['EXTERNAL_API_STALE_TTL'] = float(os.getenv('EXTERNAL_API_STALE_TTL', DEFAULT_STALE_TTL))  # Seconds it is then served while refreshing
+app.config['EXTERNAL_API_BUDGET'] = float(os.getenv('EXTERNAL_API_BUDGET', DEFAULT_BUDGET))  # Seconds a page waits for an upstream
+app.config['JOBS_DB'] = DEFAULT_JOBS_DB  # SQLite file of the background job queue (JOBS_DB)
+app.config['JOB_WORKERS'] = DEFAULT_WORKERS  # Job worker processes started by `python app.py`, 0 to run them apart (JOB_WORKERS)
 
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
@@ -31,6 +51,21 @@ if not os.path.exists(app.config['UPLOAD_FOLDER']):
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
+# Client shared by the routes calling external APIs
+api_cache = ApiCache(
+    ttl=app.config['EXTERNAL_API_TTL'],
+    stale_ttl=app.config['EXTERNAL_API_STALE_TTL'],
+    budget=app.config['EXTERNAL_API_BUDGET']
+)
+
+# Queue of the long-running routes (fetching, processing, rendering), see job_queue.py and app_jobs.py
+job_queue = JobQueue(app.config['JOBS_DB'])
+
+@app.teardown_appcontext
+def reset_history_connections(exception=None):
+    """Roll back what a failed request left uncommitted on the pooled history connection of its thread."""
+    reset_connections()
+
 # -----------------------------
 # ORM Models
 # -----------------------------
@@ -47,7 +82,7 @@ class User(db.Model):
 
 class Measure(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, index=True)
     value = db.Column(db.Float, nullable=False)
     # Add additional columns (e.g., sensor_id, energy, occupancy) as needed
 
@@ -106,20 +141,132 @@ def logout():
 # -----------------------------
 # Dashboard & Visualization
 # -----------------------------
+def load_chart_data():
+    """
+    Load the dashboard chart series and the most recent measures.
+    
+    The series is read straight from SQLite for the window given by the optional
+    'start'/'end' query parameters and downsampled server-side to at most
+    'points' points (LTTB or min/max buckets, see the 'downsample' parameter).
+    An invalid bound is reported with a flash message and ignored.
+    
+    Returns:
+        tuple: (JSON labels, JSON values, list of the 5 most recent Measure objects)
+    """
+    max_points = max(request.args.get('points', app.config['DASHBOARD_MAX_POINTS'], type=int) or 0, 3)
+    method = request.args.get('downsample', app.config['DASHBOARD_DOWNSAMPLING'])
+    if method not in ('lttb', 'minmax'):
+        method = app.config['DASHBOARD_DOWNSAMPLING']
+    
+    window = {}
+    for name in ('start', 'end'):
+        value = request.args.get(name)
+        if value:
+            try:
+                parse_bound(value, name)
+                window[name] = value
+            except ValueError as e:
+                flash(f"{e}, showing the chart without it", 'danger')
+    
+    with db.engine.connect() as conn:
+        series = load_measure_series(conn, window.get('start'), window.get('end'), max_points, method)
+    
+    labels = series['timestamp'].dt.strftime("%Y-%m-%d %H:%M:%S").tolist()
+    values = series['value'].tolist()
+    
+    # The template only lists the last few measures
+    recent = Measure.query.order_by(Measure.timestamp.desc()).limit(5).all()[::-1]
+    
+    return json.dumps(labels), json.dumps(values), recent
+
 @app.route('/dashboard')
 def dashboard():
     if 'user_id' not in session:
         flash("Please login first")
         return redirect(url_for('login'))
     
-    measures = Measure.query.order_by(Measure.timestamp.asc()).all()
-    labels = [m.timestamp.strftime("%Y-%m-%d %H:%M:%S") for m in measures]
-    values = [m.value for m in measures]
+    labels, values, measures = load_chart_data()
 
-    return render_template('dashboard.html', labels=json.dumps(labels), values=json.dumps(values), measures=measures)
+    return render_template('dashboard.html', labels=labels, values=values, measures=measures)
 
 
 
+# -----------------------------
+# Measures API
+# -----------------------------
+@app.route('/api/measures')
+def api_measures():
+    """
+    Time-series API for measures and history rows.
+    
+    Query parameters:
+        source: 'measure' (default) or 'history'
+        bat, type: Filters on the history table ('type' can be repeated)
+        start, end: Window bounds (a date-only end includes the whole day)
+        bucket: 'raw' (default), '1min', '1h' or '1d' (aggregated in SQL, per bat
+            and type for the history)
+        cursor: Cursor returned with the previous page
+        limit: Rows per page (at most MAX_PAGE_SIZE)
+        format: 'columnar' (default JSON) or 'ndjson'
+    
+    History rows also have 'bat' and 'type' columns telling their series apart.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Please login first'}), 401
+    
+    source = request.args.get('source', 'measure')
+    bucket = request.args.get('bucket', 'raw')
+    output_format = request.args.get('format', 'columnar')
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int) or 1, 1), MAX_PAGE_SIZE)
+    
+    if output_format not in ('columnar', 'ndjson'):
+        return jsonify({'error': f"Unknown format: {output_format}"}), 400
+    
+    filters = {}
+    if source == 'history':
+        if request.args.get('bat'):
+            filters['BAT'] = [request.args.get('bat')]
+        if request.args.getlist('type'):
+            filters['Type'] = request.args.getlist('type')
+    
+    try:
+        if source == 'history':
+            conn = get_connection(app.config['HISTORY_DB'])
+        else:
+            conn = db.engine.raw_connection()
+        try:
+            columns, rows, next_cursor = query_series(
+                conn, source,
+                start=request.args.get('start'),
+                end=request.args.get('end'),
+                bucket=bucket,
+                cursor=request.args.get('cursor'),
+                limit=limit,
+                filters=filters
+            )
+        finally:
+            # The pooled history connection stays open for the next requests
+            if source != 'history':
+                conn.close()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if output_format == 'ndjson':
+        def generate():
+            for row in rows:
+                yield json.dumps(dict(zip(columns, row))) + '\n'
+        
+        response = Response(generate(), mimetype='application/x-ndjson')
+        response.headers['X-Next-Cursor'] = next_cursor or ''
+        return response
+    
+    return jsonify({
+        'source': source,
+        'bucket': bucket,
+        'columns': {col: [row[i] for row in rows] for i, col in enumerate(columns)},
+        'next_cursor': next_cursor
+    })
+
 # -----------------------------
 # CSV Import Route (Multiple CSV Files)
 # -----------------------------
@@ -143,14 +290,10 @@ def import_csv():
             file.save(filepath)
             try:
                 # Assume CSV has at least columns: 'timestamp' and 'value'
-                df = pd.read_csv(filepath)
-                for _, row in df.iterrows():
-                    ts = pd.to_datetime(row['timestamp'])
-                    value = float(row['value'])
-                    measure = Measure(timestamp=ts, value=value)
-                    db.session.add(measure)
-                db.session.commit()
-                flash(f"Imported {file.filename} successfully")
+                ingestor = MeasureBulkIngestor(db.session, Measure.__table__)
+                stats = ingestor.ingest(filepath)
+                flash(f"Imported {file.filename} successfully "
+                      f"({stats['rows']} rows, {stats['rows_per_sec']:.0f} rows/s)")
             except Exception as e:
                 flash(f"Error processing {file.filename}: {e}")
         return redirect(url_for('dashboard'))
@@ -198,34 +341,12 @@ def process_csv():
         viz_dir = os.path.join(os.path.dirname(__file__), 'static', 'visualizations')
         os.makedirs(viz_dir, exist_ok=True)
         
-        try:
-            # Import the CSV processor
-            from csv_processor import CSVProcessor
-            
-            # Process the selected CSV files
-            processor = CSVProcessor(selected_file_paths)
-            cleaned_data = processor.process_all(viz_dir)
-            
-            # Get list of generated visualization files
-            viz_files = []
-            for root, _, files in os.walk(viz_dir):
-                for file in files:
-                    if file.endswith(('.png', '.html')):
-                        rel_path = os.path.join('visualizations', file)
-                        viz_files.append({
-                            'name': file,
-                            'path': rel_path,
-                            'is_html': file.endswith('.html')
-                        })
-            
-            flash("CSV processing completed successfully!")
-            return render_template('visualizations.html', visualizations=viz_files)
-            
-        except Exception as e:
-            error_details = traceback.format_exc()
-            print(f"Error processing CSV files: {str(e)}\n{error_details}")
-            flash(f"Error processing CSV files: {str(e)}")
-            return redirect(url_for('process_csv'))
+        # Process the selected CSV files in the background (see app_jobs.process_csv)
+        job_id, queued = job_queue.submit('process_csv', file_paths=sorted(selected_file_paths), viz_dir=viz_dir,
+                                          workers=app.config['CSV_PROCESS_WORKERS'])
+        if not queued:
+            flash("These files are already being processed")
+        return redirect(url_for('job_status', job_id=job_id))
     
     return render_template('process_csv.html', csv_files=[os.path.basename(f) for f in csv_files])
 
@@ -239,32 +360,32 @@ def get_weather():
         return redirect(url_for('login'))
 
     # Retrieve measures for visualization
-    measures = Measure.query.order_by(Measure.timestamp.asc()).all()
-    labels = [m.timestamp.strftime("%Y-%m-%d %H:%M:%S") for m in measures]
-    values = [m.value for m in measures]
+    labels, values, measures = load_chart_data()
     
     # Use the date range from the measures table, if available
-    first_measure = Measure.query.order_by(Measure.timestamp.asc()).first()
-    last_measure = Measure.query.order_by(Measure.timestamp.desc()).first()
-    if first_measure and last_measure:
-        start_date = first_measure.timestamp.strftime('%Y-%m-%d')
-        end_date = last_measure.timestamp.strftime('%Y-%m-%d')
+    first_timestamp, last_timestamp = db.session.query(
+        db.func.min(Measure.timestamp), db.func.max(Measure.timestamp)
+    ).one()
+    if first_timestamp and last_timestamp:
+        start_date = first_timestamp.strftime('%Y-%m-%d')
+        end_date = last_timestamp.strftime('%Y-%m-%d')
     else:
         start_date = end_date = datetime.datetime.now().strftime('%Y-%m-%d')
     
-    WEATHER_URL = "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/"
-    WEATHER_API_KEY = "JA8HYFV9Y52AAS4GGQ4QME87P"
-    CITY = "Tours,FR"
-    url = f"{WEATHER_URL}{CITY}/{start_date}/{end_date}?key={WEATHER_API_KEY}"
+    url = f"{app.config['WEATHER_API_URL']}{app.config['WEATHER_CITY']}/{start_date}/{end_date}"
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        weather_data = response.json()
+        weather_data, age = api_cache.get_json(url, {'key': app.config['WEATHER_API_KEY']})
+    except UpstreamTimeout:
+        flash("Weather data is still loading, please refresh in a moment")
+        return redirect(url_for('dashboard'))
     except Exception as e:
         flash(f"Error fetching weather data: {e}")
         return redirect(url_for('dashboard'))
     
-    return render_template('dashboard.html', labels=json.dumps(labels), values=json.dumps(values), measures=measures, weather=weather_data)
+    if age > app.config['EXTERNAL_API_TTL']:
+        flash(f"Showing weather data from {int(age)}s ago while it refreshes")
+    
+    return render_template('dashboard.html', labels=labels, values=values, measures=measures, weather=weather_data)
 
 
 # -----------------------------
@@ -277,34 +398,43 @@ def get_jeedom():
         return redirect(url_for('login'))
     
     # Retrieve measures for visualization
-    measures = Measure.query.order_by(Measure.timestamp.asc()).all()
-    labels = [m.timestamp.strftime("%Y-%m-%d %H:%M:%S") for m in measures]
-    values = [m.value for m in measures]
-    
-    JEEDOM_URL = "https://h2o.eu.jeedom.link/"
-    JEEDOM_API_KEY = "AnxyTteWw8DlvZqHQ1rnVFYuRR7NbXN0"
-    endpoint = f"{JEEDOM_URL}/core/api/jeeApi.php"
-    params = {"apikey": JEEDOM_API_KEY, "type": "cmd", "id": "1"}
+    labels, values, measures = load_chart_data()
+    
+    endpoint = f"{app.config['JEEDOM_URL'].rstrip('/')}/core/api/jeeApi.php"
+    params = {"apikey": app.config['JEEDOM_API_KEY'], "type": "cmd", "id": "1"}
     try:
-        response = requests.get(endpoint, params=params)
-        response.raise_for_status()
-        jeedom_data = response.json()
+        jeedom_data, age = api_cache.get_json(endpoint, params)
+    except UpstreamTimeout:
+        flash("Jeedom data is still loading, please refresh in a moment")
+        return redirect(url_for('dashboard'))
     except Exception as e:
         flash(f"Error fetching Jeedom data: {e}")
         return redirect(url_for('dashboard'))
     
-    return render_template('dashboard.html', labels=json.dumps(labels), values=json.dumps(values), measures=measures, jeedom=jeedom_data)
+    if age > app.config['EXTERNAL_API_TTL']:
+        flash(f"Showing Jeedom data from {int(age)}s ago while it refreshes")
+    
+    return render_template('dashboard.html', labels=labels, values=values, measures=measures, jeedom=jeedom_data)
 
 # -----------------------------
 # Historical Weather Data Route
 # -----------------------------
+def historical_weather_params(ville_name, start_date, end_date):
+    """Parameters of the historical_weather job of a city and date range."""
+    return {
+        'ville_name': ville_name,
+        'start_date': start_date,
+        'end_date': end_date,
+        'db_path': app.config['HISTORY_DB'],
+        'viz_dir': 'static/visualizations',
+    }
+
 @app.route('/historical_weather', methods=['GET', 'POST'])
 def historical_weather():
     """
     Route for fetching and displaying historical weather data.
     """
     # Import required modules
-    from weather_data_fetcher import WeatherDataFetcher
     from datetime import datetime
     
     # Use hardcoded list of cities instead of querying database
@@ -336,61 +466,28 @@ def historical_weather():
             ville_name = ville
             print(f"Using ville_name: {ville_name}")
             
+            params = historical_weather_params(ville_name, start_date, end_date)
+            
             # Create data directory if it doesn't exist
             os.makedirs('data', exist_ok=True)
             
             # Create visualizations directory if it doesn't exist
-            viz_dir = 'static/visualizations'
-            os.makedirs(viz_dir, exist_ok=True)
-            
-            # Create weather data fetcher
-            fetcher = WeatherDataFetcher()
-            
-            # Fetch weather data
-            print(f"Calling fetch_weather_data with ville_name={ville_name}, start_date={start_date}, end_date={end_date}")
-            success = fetcher.fetch_weather_data(
-                ville_name=ville_name,
-                start_date=start_date,
-                end_date=end_date
-            )
-            
-            if not success:
-                print("fetch_weather_data returned False")
-                # Check if start date is after end date
-                from datetime import datetime
-                try:
-                    start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
-                    end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
-                    if start_date_obj > end_date_obj:
-                        flash('Start date must be before or equal to end date.', 'danger')
-                    else:
-                        flash('Failed to fetch weather data. Please try again.', 'danger')
-                except ValueError:
-                    flash('Invalid date format. Please use YYYY-MM-DD format.', 'danger')
-                
-                return redirect(url_for('historical_weather'))
-            
-            # Process weather data
-            file_path = f"data/{ville_name}_{start_date}_{end_date}.csv"
-            print(f"Calling process_weather_data with ville_name={ville_name}, file_path={file_path}")
-            success = fetcher.process_weather_data(ville_name, file_path)
-            
-            if not success:
-                print("process_weather_data returned False")
-                flash('Failed to process weather data. Please try again.', 'danger')
-                return redirect(url_for('historical_weather'))
+            os.makedirs(params['viz_dir'], exist_ok=True)
             
-            # Generate visualizations
-            print(f"Calling generate_visualizations with ville_name={ville_name}, viz_dir={viz_dir}")
-            df = fetcher.generate_visualizations(ville_name, viz_dir)
-            
-            if df.empty:
-                print("generate_visualizations returned empty DataFrame")
-                flash('No data was processed. Please try again.', 'danger')
+            # Check the dates before queuing
+            try:
+                if datetime.strptime(start_date, '%Y-%m-%d') > datetime.strptime(end_date, '%Y-%m-%d'):
+                    flash('Start date must be before or equal to end date.', 'danger')
+                    return redirect(url_for('historical_weather'))
+            except ValueError:
+                flash('Invalid date format. Please use YYYY-MM-DD format.', 'danger')
                 return redirect(url_for('historical_weather'))
             
-            # Redirect to weather display page
-            return redirect(url_for('display_weather', ville_name=ville_name, start_date=start_date, end_date=end_date))
+            # Fetch, process and plot in the background (see app_jobs.historical_weather)
+            job_id, queued = job_queue.submit('historical_weather', **params)
+            if not queued:
+                flash('This weather data is already being processed.', 'info')
+            return redirect(url_for('job_status', job_id=job_id))
         except Exception as e:
             print(f"Exception in historical_weather route: {e}")
             flash(f'An error occurred: {str(e)}', 'danger')
@@ -404,9 +501,19 @@ def check_weather_status(ville_name, start_date, end_date):
     Check weather data processing status for a given city and date range.
     """
     try:
+        # Status of the job processing this range, if one was submitted
+        job = job_queue.find('historical_weather', **historical_weather_params(ville_name, start_date, end_date))
+        if job:
+            status = {QUEUED: 'pending', RUNNING: 'pending', DONE: 'complete', FAILED: 'error'}[job['status']]
+            return jsonify({
+                'status': status,
+                'message': job['error'] or f"Weather data {job['status']}",
+                'job': job_json(job)
+            })
+        
         # Convert string dates to datetime objects
-        start_date = datetime.strptime(start_date, '%Y-%m-%d')
-        end_date = datetime.strptime(end_date, '%Y-%m-%d')
+        start_date = datetime.datetime.strptime(start_date, '%Y-%m-%d')
+        end_date = datetime.datetime.strptime(end_date, '%Y-%m-%d')
         
         # Check if weather data exists for this range
         weather_data = db.session.query(WeatherData).filter(
@@ -433,127 +540,83 @@ def check_weather_status(ville_name, start_date, end_date):
             'traceback': traceback.format_exc()
         }), 500
 
+# -----------------------------
+# Background Jobs
+# -----------------------------
+# Message and title of the result page of each job kind
+JOB_RESULT_PAGES = {
+    'process_csv': ("CSV processing completed successfully!", None),
+    'sample_weather': ("Sample weather data processed successfully!", "Sample Weather Data Visualizations"),
+}
+
+def job_json(job):
+    """Status of a job as reported to the browser, with the page to open once it is done."""
+    data = {key: job[key] for key in ('id', 'kind', 'status', 'stage', 'progress', 'timings', 'result', 'error',
+                                      'submitted_at', 'started_at', 'finished_at')}
+    data['next_url'] = None
+    if job['status'] == DONE:
+        if job['kind'] == 'historical_weather':
+            result = job['result']
+            data['next_url'] = url_for('display_weather', ville_name=result['ville_name'],
+                                       start_date=result['start_date'], end_date=result['end_date'])
+        else:
+            data['next_url'] = url_for('job_visualizations', job_id=job['id'])
+    return data
+
+@app.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    """
+    Progress page of a background job, or its status as JSON with ?format=json.
+    """
+    job = job_queue.get(job_id)
+    if request.args.get('format') == 'json':
+        if job is None:
+            return jsonify({'status': 'error', 'message': f'No job {job_id}'}), 404
+        return jsonify(job_json(job))
+    
+    if job is None:
+        flash(f'No job {job_id}.', 'danger')
+        return redirect(url_for('dashboard'))
+    return render_template('job_status.html', job=job_json(job))
+
+@app.route('/jobs/<int:job_id>/visualizations')
+def job_visualizations(job_id):
+    """
+    Visualizations produced by a finished background job.
+    """
+    job = job_queue.get(job_id)
+    if job is None or job['status'] != DONE:
+        return redirect(url_for('job_status', job_id=job_id))
+    
+    message, title = JOB_RESULT_PAGES.get(job['kind'], (None, None))
+    if message:
+        flash(message)
+    return render_template('visualizations.html', visualizations=job['result'].get('files', []), title=title)
+
 @app.route('/display_weather/<ville_name>/<start_date>/<end_date>')
 def display_weather(ville_name, start_date, end_date):
     """
     Route for displaying weather data.
     """
-    import pandas as pd
-    import sqlite3
-    
     try:
         # Connect to database
-        conn = sqlite3.connect('smarthome.db')
+        conn = get_connection(app.config['HISTORY_DB'])
+        ensure_history_schema(conn, app.config['HISTORY_DB'])
         
-        # Query for weather data
-        query = """
-            SELECT Datetime, Type, Value
-            FROM history
-            WHERE BAT = ?
-            AND Type IN ('TEMPERATURE', 'TEMPERATURE_MIN', 'TEMPERATURE_MAX', 'PRECIPITATION', 'WIND_SPEED')
-            ORDER BY Datetime
-        """
+        # Daily aggregates of the weather and device data within the window (see history_rollups.py)
+        weather_rows = read_daily_rollup(conn, ville_name, types=WEATHER_TYPES, start=start_date, end=end_date)
+        device_rows = read_daily_rollup(conn, ville_name, exclude_types=NON_DEVICE_TYPES,
+                                        start=start_date, end=end_date)
         
-        # Execute query
-        df = pd.read_sql_query(query, conn, params=(ville_name,))
-        
-        # Query for device consumption data
-        device_query = """
-            SELECT Datetime, Type, Value
-            FROM history
-            WHERE BAT = ?
-            AND (Type LIKE 'DEVICE%' OR Type NOT IN ('TEMPERATURE', 'TEMPERATURE_MIN', 'TEMPERATURE_MAX', 
-                                                  'PRECIPITATION', 'WIND_SPEED', 'HUMIDITY', 
-                                                  'ELECTRICITY', 'GAS', 'WATER', 'INDOOR_TEMP'))
-            ORDER BY Datetime
-        """
-        
-        # Execute device query
-        device_df = pd.read_sql_query(device_query, conn, params=(ville_name,))
-        
-        # Close connection
-        conn.close()
-        
-        if df.empty:
+        if not weather_rows:
             flash('No weather data found.', 'danger')
             return redirect(url_for('historical_weather'))
         
-        # Convert datetime to pandas datetime
-        df['Datetime'] = pd.to_datetime(df['Datetime'])
-        df['Date'] = df['Datetime'].dt.date
-        
-        # Organize data by date
-        weather_data = {}
-        summary = {
-            'avg_temp': 0,
-            'max_temp': -100,
-            'total_precip': 0,
-            'avg_wind': 0
-        }
-        
-        temp_values = []
-        wind_values = []
-        
-        # Process each row
-        for _, row in df.iterrows():
-            date_str = str(row['Date'])
-            data_type = row['Type']
-            value = row['Value']
-            
-            if date_str not in weather_data:
-                weather_data[date_str] = {
-                    'temp': 0,
-                    'temp_min': 0,
-                    'temp_max': 0,
-                    'precipitation': 0,
-                    'wind_speed': 0
-                }
-            
-            if data_type == 'TEMPERATURE':
-                weather_data[date_str]['temp'] = value
-                temp_values.append(value)
-                if value > summary['max_temp']:
-                    summary['max_temp'] = value
-            elif data_type == 'TEMPERATURE_MIN':
-                weather_data[date_str]['temp_min'] = value
-            elif data_type == 'TEMPERATURE_MAX':
-                weather_data[date_str]['temp_max'] = value
-            elif data_type == 'PRECIPITATION':
-                weather_data[date_str]['precipitation'] = value
-                summary['total_precip'] += value
-            elif data_type == 'WIND_SPEED':
-                weather_data[date_str]['wind_speed'] = value
-                wind_values.append(value)
-        
-        # Calculate summary statistics
-        if temp_values:
-            summary['avg_temp'] = sum(temp_values) / len(temp_values)
-        
-        if wind_values:
-            summary['avg_wind'] = sum(wind_values) / len(wind_values)
-        
-        # Sort weather data by date
-        weather_data = {k: weather_data[k] for k in sorted(weather_data.keys())}
-        
-        # Process device consumption data
-        device_data = {}
-        
-        if not device_df.empty:
-            device_df['Datetime'] = pd.to_datetime(device_df['Datetime'])
-            
-            # Get total consumption across all devices
-            total_consumption = device_df['Value'].sum()
-            
-            # Process each device type
-            for device_type in device_df['Type'].unique():
-                device_values = device_df[device_df['Type'] == device_type]['Value']
-                
-                device_data[device_type.replace('DEVICE_', '').title()] = {
-                    'total': device_values.sum(),
-                    'avg': device_values.mean(),
-                    'max': device_values.max(),
-                    'percentage': (device_values.sum() / total_consumption * 100) if total_consumption > 0 else 0
-                }
+        # Weather matrix and device statistics (see history_summaries.py)
+        matrix = weather_matrix(rollup_frame(weather_rows))
+        weather_data = weather_days(matrix)
+        summary = weather_summary(matrix)
+        device_data = device_summary(device_stats(rollup_frame(device_rows))) if device_rows else {}
         
         return render_template(
             'weather_display.html',
@@ -596,45 +659,12 @@ def process_sample_weather():
         viz_dir = os.path.join(os.path.dirname(__file__), 'static', 'visualizations')
         os.makedirs(viz_dir, exist_ok=True)
         
-        # Import the weather data fetcher
-        from weather_data_fetcher import WeatherDataFetcher
-        
-        # Create fetcher
-        fetcher = WeatherDataFetcher()
-        
-        # Process the sample data
-        ville_name = "SampleCity"
-        
-        # Process the data
-        fetcher.process_weather_data(ville_name, sample_file)
-        
-        # Generate visualizations
-        df = fetcher.generate_visualizations(ville_name, viz_dir)
-        
-        if df.empty:
-            flash("No data was processed from the sample file.")
-            return redirect(url_for('historical_weather'))
-        
-        # Get list of generated visualization files for this city
-        viz_files = []
-        for root, _, files in os.walk(viz_dir):
-            for file in files:
-                if file.startswith(f"{ville_name}_") and file.endswith(('.png', '.html')):
-                    rel_path = os.path.join('visualizations', file)
-                    viz_files.append({
-                        'name': file,
-                        'path': rel_path,
-                        'is_html': file.endswith('.html')
-                    })
-        
-        if not viz_files:
-            flash("No visualizations could be generated from the sample data.")
-            return redirect(url_for('historical_weather'))
-        
-        flash(f"Sample weather data processed successfully!")
-        return render_template('visualizations.html', 
-                              visualizations=viz_files, 
-                              title=f"Sample Weather Data Visualizations")
+        # Process and plot the sample data in the background (see app_jobs.sample_weather)
+        job_id, queued = job_queue.submit('sample_weather', sample_file=sample_file, ville_name="SampleCity",
+                                          db_path=app.config['HISTORY_DB'], viz_dir=viz_dir)
+        if not queued:
+            flash("The sample data is already being processed")
+        return redirect(url_for('job_status', job_id=job_id))
         
     except Exception as e:
         error_details = traceback.format_exc()
@@ -651,7 +681,6 @@ def import_sample_device_data():
     Import sample device data from CSV file.
     """
     import pandas as pd
-    import sqlite3
     import os
     
     try:
@@ -665,37 +694,13 @@ def import_sample_device_data():
         df = pd.read_csv(sample_file)
         
         # Connect to database
-        conn = sqlite3.connect('smarthome.db')
-        cursor = conn.cursor()
+        conn = get_connection(app.config['HISTORY_DB'])
         
-        # Create table if not exists
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                Datetime TEXT,
-                BAT TEXT,
-                Type TEXT,
-                Value REAL
-            )
-        ''')
+        # Create table and indexes if they don't exist
+        ensure_history_schema(conn, app.config['HISTORY_DB'])
         
-        # Insert data
-        for _, row in df.iterrows():
-            cursor.execute('''
-                INSERT INTO history (Datetime, BAT, Type, Value)
-                VALUES (?, ?, ?, ?)
-            ''', (
-                row['Datetime'],
-                row['BAT'],
-                row['Type'],
-                row['Value']
-            ))
-        
-        # Commit changes
-        conn.commit()
-        
-        # Close connection
-        conn.close()
+        # Insert or update data in a single transaction
+        write_history(conn, df)
         
         flash('Sample device data imported successfully!', 'success')
         return redirect(url_for('dashboard'))
@@ -713,7 +718,6 @@ def import_sample_data():
     Import sample weather data from CSV file.
     """
     import pandas as pd
-    import sqlite3
     import os
     
     try:
@@ -727,25 +731,20 @@ def import_sample_data():
         df = pd.read_csv(sample_file)
         
         # Connect to database
-        conn = sqlite3.connect('smarthome.db')
-        cursor = conn.cursor()
-        
-        # Create table if not exists
-        cursor.execute('''CREATE TABLE IF NOT EXISTS weather_data
-                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        timestamp DATETIME NOT NULL,
-                        temperature REAL NOT NULL,
-                        humidity REAL NOT NULL)''')
-        
-        # Insert data
-        for _, row in df.iterrows():
-            cursor.execute('''INSERT INTO weather_data (timestamp, temperature, humidity)
-                            VALUES (?, ?, ?)''',
-                         (row['timestamp'], row['temperature'], row['humidity']))
-        
-        # Commit and close
-        conn.commit()
-        conn.close()
+        conn = get_connection(app.config['HISTORY_DB'])
+        
+        with conn:
+            # Create table if not exists
+            conn.execute('''CREATE TABLE IF NOT EXISTS weather_data
+                            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            timestamp DATETIME NOT NULL,
+                            temperature REAL NOT NULL,
+                            humidity REAL NOT NULL)''')
+            
+            # Insert data with a single prepared statement, committed with the block
+            conn.executemany('''INSERT INTO weather_data (timestamp, temperature, humidity)
+                                VALUES (?, ?, ?)''',
+                             df[['timestamp', 'temperature', 'humidity']].itertuples(index=False, name=None))
         
         flash('Sample weather data imported successfully!', 'success')
         return redirect(url_for('dashboard'))
@@ -758,4 +757,14 @@ def import_sample_data():
 # Main Entry Point
 # -----------------------------
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
+    # Start the job workers with the app. Under `flask run` or a WSGI server this block does
+    # not run: start them apart with `python job_queue.py --workers N` (see job_queue.py).
+    # With the reloader (USE_RELOADER=0 to disable it) this block also runs in the watcher
+    # process, which serves nothing, so the workers are only started in the serving one.
+    use_reloader = os.getenv('USE_RELOADER', '1') != '0'
+    reloader_watcher = use_reloader and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+    if app.config['JOB_WORKERS'] > 0 and not reloader_watcher:
+        import atexit
+        job_workers = WorkerPool(app.config['JOBS_DB'], app.config['JOB_WORKERS']).start()
+        atexit.register(job_workers.stop)
+    app.run(debug=True, use_reloader=use_reloader, port=5001)
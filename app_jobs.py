@@ -0,0 +1,90 @@
+"""
+Background jobs of the web app, run by the job_queue workers.
+
+Each handler does what its route used to do within the request: fetching,
+parsing, database writes and rendering. It reports its stages as it goes and
+returns what the result page needs.
+"""
+
+import os
+from job_queue import handler, JobError
+from weather_data_fetcher import WeatherDataFetcher
+
+
+def list_visualizations(viz_dir, prefix=''):
+    """
+    Rendered files of a visualization directory.
+
+    Args:
+        viz_dir (str): Directory under static/ holding the files
+        prefix (str): Only the files whose name starts with this
+
+    Returns:
+        list: {name, path (relative to static/), is_html} dicts, sorted by name
+    """
+    files = []
+    for root, _, names in os.walk(viz_dir):
+        for name in names:
+            if name.startswith(prefix) and name.endswith(('.png', '.html')):
+                files.append({
+                    'name': name,
+                    'path': os.path.join('visualizations', name),
+                    'is_html': name.endswith('.html')
+                })
+    return sorted(files, key=lambda file: file['name'])
+
+
+def _visualize(job, fetcher, ville_name, viz_dir, start_date=None, end_date=None):
+    """Generate the visualizations of a city as the 'visualize' stage, with its own breakdown in the timings."""
+    with job.stage('visualize', progress=1.0):
+        df = fetcher.generate_visualizations(ville_name, viz_dir, start_date=start_date, end_date=end_date)
+    for name, seconds in getattr(fetcher, 'viz_timings', {}).items():
+        job.timings[f'visualize/{name}'] = seconds
+    if df.empty:
+        raise JobError('No data was processed. Please try again.')
+    return len(df)
+
+
+@handler('historical_weather')
+def historical_weather(job, ville_name, start_date, end_date, db_path, viz_dir):
+    """Fetch, store and plot the weather of a city over a date range."""
+    fetcher = WeatherDataFetcher(db_path=db_path)
+
+    with job.stage('fetch', progress=0.5):
+        if not fetcher.fetch_weather_data(ville_name=ville_name, start_date=start_date, end_date=end_date):
+            raise JobError('Failed to fetch weather data. Please try again.')
+
+    with job.stage('process', progress=0.7):
+        file_path = f"data/{ville_name}_{start_date}_{end_date}.csv"
+        if not fetcher.process_weather_data(ville_name, file_path):
+            raise JobError('Failed to process weather data. Please try again.')
+
+    rows = _visualize(job, fetcher, ville_name, viz_dir, start_date, end_date)
+    return {'ville_name': ville_name, 'start_date': start_date, 'end_date': end_date, 'rows': rows}
+
+
+@handler('sample_weather')
+def sample_weather(job, sample_file, ville_name, db_path, viz_dir):
+    """Store and plot the sample weather file."""
+    fetcher = WeatherDataFetcher(db_path=db_path)
+
+    with job.stage('process', progress=0.5):
+        fetcher.process_weather_data(ville_name, sample_file)
+
+    rows = _visualize(job, fetcher, ville_name, viz_dir)
+    files = list_visualizations(viz_dir, prefix=f"{ville_name}_")
+    if not files:
+        raise JobError('No visualizations could be generated from the sample data.')
+    return {'ville_name': ville_name, 'rows': rows, 'files': files}
+
+
+@handler('process_csv')
+def process_csv(job, file_paths, viz_dir, workers):
+    """Clean, summarize and plot uploaded CSV files."""
+    # Imported here: the CSV pipeline pulls in plotly, which only this job needs
+    from csv_processor import CSVProcessor
+
+    with job.stage('process', progress=1.0):
+        CSVProcessor(file_paths).process_all(viz_dir, workers=workers)
+
+    return {'files': list_visualizations(viz_dir)}
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark history/measure query latency before and after the time series indexes.
+
+Builds a synthetic database, times the queries used by display_weather,
+generate_visualizations and the measures API without indexes, then creates the
+indexes from history_schema.py (and ix_measure_timestamp) and times them again.
+
+Usage: python benchmark_history_indexes.py --rows 10000000
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from history_schema import ensure_history_schema
+
+BATS = ['Paris', 'Tours', 'Roland', 'Lyon', 'Nantes', 'Lille', 'Nice', 'Bordeaux', 'Toulouse', 'Marseille']
+TYPES = ['TEMPERATURE', 'TEMPERATURE_MIN', 'TEMPERATURE_MAX', 'PRECIPITATION', 'WIND_SPEED', 'HUMIDITY',
+         'ELECTRICITY', 'GAS', 'WATER', 'INDOOR_TEMP', 'DEVICE_REFRIGERATOR', 'DEVICE_OVEN']
+
+QUERIES = {
+    'display_weather (BAT + weather Types)': ('''
+        SELECT Datetime, Type, Value
+        FROM history
+        WHERE BAT = ?
+        AND Type IN ('TEMPERATURE', 'TEMPERATURE_MIN', 'TEMPERATURE_MAX', 'PRECIPITATION', 'WIND_SPEED')
+        ORDER BY Datetime
+    ''', ('Tours',)),
+    'history one Type, one month': ('''
+        SELECT Datetime, Value
+        FROM history
+        WHERE BAT = ? AND Type = ? AND Datetime >= ? AND Datetime < ?
+        ORDER BY Datetime
+    ''', ('Tours', 'TEMPERATURE', '2021-03-01 00:00:00', '2021-04-01 00:00:00')),
+    'measure one day': ('''
+        SELECT timestamp, value
+        FROM measure
+        WHERE timestamp >= ? AND timestamp < ?
+        ORDER BY timestamp
+    ''', ('2021-03-01 00:00:00.000000', '2021-03-02 00:00:00.000000')),
+}
+
+
+def build_database(db_path, rows):
+    """Fill history (and measure with a tenth as many rows) with synthetic data."""
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            BAT TEXT, Datetime TEXT, Objet TEXT, Commande TEXT, Name TEXT,
+            Type TEXT, Value REAL, Unit TEXT, Timestamp INTEGER
+        )
+    ''')
+    conn.execute('CREATE TABLE measure (id INTEGER PRIMARY KEY, timestamp DATETIME NOT NULL, value FLOAT NOT NULL)')
+
+    start = datetime(2020, 1, 1)
+    per_hour = len(BATS) * len(TYPES)
+
+    def history_rows():
+        for i in range(rows):
+            hour, slot = divmod(i, per_hour)
+            moment = start + timedelta(hours=hour)
+            yield (BATS[slot % len(BATS)], moment.strftime('%Y-%m-%d %H:%M:%S'),
+                   TYPES[slot // len(BATS)], float(slot), int(moment.timestamp()))
+
+    def measure_rows():
+        for i in range(rows // 10):
+            moment = start + timedelta(minutes=i)
+            yield (moment.strftime('%Y-%m-%d %H:%M:%S.%f'), float(i % 100))
+
+    conn.executemany('INSERT INTO history (BAT, Datetime, Type, Value, Timestamp) VALUES (?, ?, ?, ?, ?)',
+                     history_rows())
+    conn.executemany('INSERT INTO measure (timestamp, value) VALUES (?, ?)', measure_rows())
+    conn.commit()
+    return conn
+
+
+def time_queries(conn, repeat):
+    """Return the best latency in milliseconds of each query."""
+    results = {}
+    for name, (query, params) in QUERIES.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(query, params).fetchall()
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = best
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the history/measure time series indexes.')
+    parser.add_argument('--rows', type=int, default=10_000_000, help='Number of history rows (defaults to 10M)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per query, the best one is kept')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    print(f"Building {args.rows} history rows in {db_path}...")
+    start = time.perf_counter()
+    conn = build_database(db_path, args.rows)
+    print(f"Built in {time.perf_counter() - start:.1f}s")
+
+    before = time_queries(conn, args.repeat)
+
+    start = time.perf_counter()
+    ensure_history_schema(conn)
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_measure_timestamp ON measure (timestamp)')
+    conn.commit()
+    print(f"Indexes created in {time.perf_counter() - start:.1f}s")
+
+    after = time_queries(conn, args.repeat)
+    conn.close()
+    os.remove(db_path)
+
+    print(f"\n{'Query':<42}{'Before (ms)':>14}{'After (ms)':>14}{'Speedup':>10}")
+    for name in QUERIES:
+        print(f"{name:<42}{before[name]:>14.1f}{after[name]:>14.1f}{before[name] / max(after[name], 1e-6):>9.0f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
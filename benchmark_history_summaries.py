@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Benchmark the display_weather summaries on synthetic history rows.
+
+Compares the previous row loop (iterrows over the weather rows, one boolean
+mask per device type) with history_summaries.py (one pivot_table for the
+weather matrix, one groupby-agg for the device statistics), on raw rows and on
+the daily partials the history_daily rollup would hold, and checks that both
+give the same summary and device statistics.
+
+Usage: python benchmark_history_summaries.py --rows 1000000
+"""
+
+import sys
+import math
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from history_schema import WEATHER_TYPES
+from history_summaries import (to_partials, weather_matrix, weather_days, weather_summary,
+                               device_stats, device_summary, PARTIAL_COLUMNS)
+
+
+def synthetic_history(rows, devices=20, seed=0):
+    """Hourly history rows split between the weather Types and devices DEVICE_0..N."""
+    rng = np.random.default_rng(seed)
+    types = WEATHER_TYPES + [f'DEVICE_{i}' for i in range(devices)]
+    hours = -(-rows // len(types))
+    datetimes = pd.date_range('2020-01-01', periods=hours, freq='h').strftime('%Y-%m-%d %H:%M:%S')
+    df = pd.DataFrame({
+        'Datetime': np.repeat(datetimes.to_numpy(), len(types))[:rows],
+        'Type': np.tile(types, hours)[:rows],
+        'Value': rng.normal(10, 8, rows).round(2),
+    })
+    is_weather = df['Type'].isin(WEATHER_TYPES)
+    return df[is_weather].reset_index(drop=True), df[~is_weather].reset_index(drop=True)
+
+
+def loop_summaries(df, device_df):
+    """The previous display_weather computation."""
+    df = df.copy()
+    df['Datetime'] = pd.to_datetime(df['Datetime'])
+    df['Date'] = df['Datetime'].dt.date
+
+    weather_data = {}
+    summary = {'avg_temp': 0, 'max_temp': -100, 'total_precip': 0, 'avg_wind': 0}
+    temp_values = []
+    wind_values = []
+    for _, row in df.iterrows():
+        date_str = str(row['Date'])
+        data_type = row['Type']
+        value = row['Value']
+        if date_str not in weather_data:
+            weather_data[date_str] = {'temp': 0, 'temp_min': 0, 'temp_max': 0, 'precipitation': 0, 'wind_speed': 0}
+        if data_type == 'TEMPERATURE':
+            weather_data[date_str]['temp'] = value
+            temp_values.append(value)
+            if value > summary['max_temp']:
+                summary['max_temp'] = value
+        elif data_type == 'TEMPERATURE_MIN':
+            weather_data[date_str]['temp_min'] = value
+        elif data_type == 'TEMPERATURE_MAX':
+            weather_data[date_str]['temp_max'] = value
+        elif data_type == 'PRECIPITATION':
+            weather_data[date_str]['precipitation'] = value
+            summary['total_precip'] += value
+        elif data_type == 'WIND_SPEED':
+            weather_data[date_str]['wind_speed'] = value
+            wind_values.append(value)
+    if temp_values:
+        summary['avg_temp'] = sum(temp_values) / len(temp_values)
+    if wind_values:
+        summary['avg_wind'] = sum(wind_values) / len(wind_values)
+
+    device_data = {}
+    total_consumption = device_df['Value'].sum()
+    for device_type in device_df['Type'].unique():
+        device_values = device_df[device_df['Type'] == device_type]['Value']
+        device_data[device_type.replace('DEVICE_', '').title()] = {
+            'total': device_values.sum(),
+            'avg': device_values.mean(),
+            'max': device_values.max(),
+            'percentage': (device_values.sum() / total_consumption * 100) if total_consumption > 0 else 0
+        }
+    return weather_data, summary, device_data
+
+
+def vectorized_summaries(weather_partials, device_partials):
+    """The history_summaries.py computation."""
+    matrix = weather_matrix(weather_partials)
+    return weather_days(matrix), weather_summary(matrix), device_summary(device_stats(device_partials))
+
+
+def daily_partials(partials):
+    """Group partials per day, as the history_daily rollup stores them."""
+    return partials.groupby(['Period', 'Type'], as_index=False).agg(
+        Sum=('Sum', 'sum'), Count=('Count', 'sum'), Min=('Min', 'min'), Max=('Max', 'max'))[PARTIAL_COLUMNS]
+
+
+def same(a, b):
+    """Compare nested dicts of floats."""
+    if isinstance(a, dict):
+        return list(a) == list(b) and all(same(a[k], b[k]) for k in a)
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+
+
+def timed(function, *args, repeat=1):
+    """Best wall time of a call, and its result."""
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the display_weather summaries.')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Synthetic history rows (weather and devices)')
+    parser.add_argument('--baseline-rows', type=int, default=100_000,
+                        help='Rows summarized by the row loop (it is much slower), its time is scaled to --rows')
+    parser.add_argument('--devices', type=int, default=20, help='Device Types among the rows')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of the vectorized summaries, the best is kept')
+    args = parser.parse_args()
+
+    weather_df, device_df = synthetic_history(args.rows, args.devices)
+    sample_weather, sample_devices = synthetic_history(min(args.baseline_rows, args.rows), args.devices)
+
+    loop_time, (_, loop_summary, loop_devices) = timed(loop_summaries, sample_weather, sample_devices)
+    loop_scaled = loop_time * args.rows / min(args.baseline_rows, args.rows)
+
+    _, sample_summary, sample_device_data = vectorized_summaries(to_partials(sample_weather), to_partials(sample_devices))
+    if not (same(loop_summary, sample_summary) and same(loop_devices, sample_device_data)):
+        print("Vectorized summaries differ from the row loop")
+        return 1
+
+    raw_time, (days, _, devices) = timed(
+        lambda: vectorized_summaries(to_partials(weather_df), to_partials(device_df)), repeat=args.repeat)
+
+    weather_daily = daily_partials(to_partials(weather_df))
+    device_daily = daily_partials(to_partials(device_df))
+    rollup_time, _ = timed(vectorized_summaries, weather_daily, device_daily, repeat=args.repeat)
+
+    print(f"{len(weather_df)} weather and {len(device_df)} device rows, {len(days)} days, {len(devices)} devices")
+    print(f"{'Summaries':<36}{'Rows':>10}{'Seconds':>10}")
+    print(f"{'row loop':<36}{args.rows:>10}{loop_scaled:>10.3f}"
+          f"  (measured {loop_time:.3f}s on {min(args.baseline_rows, args.rows)} rows)")
+    print(f"{'pivot_table + groupby-agg (raw)':<36}{args.rows:>10}{raw_time:>10.3f}  ({loop_scaled / raw_time:.0f}x)")
+    print(f"{'pivot_table + groupby-agg (daily)':<36}{len(weather_daily) + len(device_daily):>10}{rollup_time:>10.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Kafka measures consumer against an in-process fake message source.
+
+Compares the previous behaviour (one connection, insert and commit per message)
+with the batched consumer of kafkaReadMeasures.py (executemany per poll on a WAL
+connection, offsets committed after each database commit) and with its
+MeasurePipeline (decoding and group-committing writer thread separated by a
+bounded queue), using each available JSON parser.
+
+Usage: python benchmark_kafka_consumer.py --messages 200000
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+from collections import namedtuple
+from datetime import datetime, timedelta
+import data_access
+import kafkaReadMeasures as consumer_module
+
+Message = namedtuple('Message', ['topic', 'partition', 'offset', 'value'])
+TopicPartition = namedtuple('TopicPartition', ['topic', 'partition'])
+
+
+class FakeConsumer:
+    """Stands in for KafkaConsumer: serves pre-encoded messages round-robin over partitions."""
+
+    def __init__(self, count, partitions=3):
+        start = datetime(2024, 1, 1)
+        self.partitions = [TopicPartition(consumer_module.KAFKA_TOPIC, p) for p in range(partitions)]
+        self.messages = [
+            json.dumps({'timestamp': (start + timedelta(seconds=i)).isoformat(sep=' '), 'value': i % 1000 / 10}).encode('utf-8')
+            for i in range(count)
+        ]
+        self.cursor = 0
+        self.committed = 0
+        self.commits = 0
+        self.paused = set()
+        self.pauses = 0
+
+    def __iter__(self):
+        while self.cursor < len(self.messages):
+            yield self._message(self.cursor)
+            self.cursor += 1
+
+    def _message(self, i):
+        tp = self.partitions[i % len(self.partitions)]
+        return Message(tp.topic, tp.partition, i // len(self.partitions), self.messages[i])
+
+    def poll(self, timeout_ms=0, max_records=None, update_offsets=True):
+        if self.paused:
+            return {}
+        end = min(self.cursor + (max_records or len(self.messages)), len(self.messages))
+        records = {}
+        for i in range(self.cursor, end):
+            message = self._message(i)
+            records.setdefault(self.partitions[message.partition], []).append(message)
+        self.cursor = end
+        return records
+
+    def commit(self, offsets=None):
+        if offsets is None:
+            self.committed = self.cursor
+        else:
+            # Messages are spread round-robin, so the committed position is the lowest partition's
+            self.committed = min(offset.offset * len(self.partitions) + tp.partition for tp, offset in offsets.items())
+        self.commits += 1
+
+    def assignment(self):
+        return set(self.partitions)
+
+    def pause(self, *partitions):
+        self.paused.update(partitions)
+        self.pauses += 1
+
+    def resume(self, *partitions):
+        self.paused.difference_update(partitions)
+
+    def highwater(self, partition):
+        return -(-(len(self.messages) - partition.partition) // len(self.partitions))
+
+    def position(self, partition):
+        return -(-(self.cursor - partition.partition) // len(self.partitions))
+
+
+class SlowConnection(sqlite3.Connection):
+    """Connection whose writes take an extra delay, to simulate a slow disk."""
+
+    delay = 0.0
+
+    def executemany(self, *args):
+        time.sleep(self.delay)
+        return super().executemany(*args)
+
+
+def slow_db_connection(delay):
+    """Return a get_db_connection replacement opening SlowConnections."""
+    def connect(db_name=consumer_module.DB_NAME):
+        conn = data_access.connect(db_name, factory=SlowConnection)
+        conn.delay = delay
+        conn.execute(consumer_module.MEASURES_TABLE_SQL)
+        conn.commit()
+        return conn
+    return connect
+
+
+def consume_per_message(consumer, db_path):
+    """Previous behaviour: a connection, an insert and a commit per message."""
+    for message in consumer:
+        data = json.loads(message.value.decode('utf-8'))
+        conn = sqlite3.connect(db_path)
+        cur = conn.cursor()
+        cur.execute(consumer_module.INSERT_SQL, (data.get("timestamp"), data.get("value")))
+        conn.commit()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Kafka measures consumer.')
+    parser.add_argument('--messages', type=int, default=200_000, help='Messages consumed by the batched consumer')
+    parser.add_argument('--baseline-messages', type=int, default=5_000,
+                        help='Messages consumed by the per-message baseline (it is much slower)')
+    parser.add_argument('--max-records', type=int, default=consumer_module.MAX_RECORDS, help='Messages per poll')
+    parser.add_argument('--write-delay-ms', type=float, default=0,
+                        help='Extra delay per pipeline transaction, to show the partitions being paused on a slow disk')
+    parser.add_argument('--queue-size', type=int, default=consumer_module.QUEUE_SIZE, help='Batches queued by the pipeline')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+
+    baseline_db = os.path.join(directory, 'baseline.db')
+    consumer_module.get_db_connection(baseline_db).close()
+    with sqlite3.connect(baseline_db) as conn:
+        conn.execute("PRAGMA journal_mode=DELETE")
+    start = time.perf_counter()
+    consume_per_message(FakeConsumer(args.baseline_messages), baseline_db)
+    baseline_rate = args.baseline_messages / (time.perf_counter() - start)
+
+    batched_db = os.path.join(directory, 'batched.db')
+    conn = consumer_module.get_db_connection(batched_db)
+    fake = FakeConsumer(args.messages)
+    batches = -(-args.messages // args.max_records)
+    start = time.perf_counter()
+    stats = consumer_module.consume_kafka_messages(fake, conn, args.max_records, max_batches=batches)
+    batched_rate = stats['rows'] / (time.perf_counter() - start)
+    stored = conn.execute("SELECT COUNT(*) FROM measures").fetchone()[0]
+    conn.close()
+
+    print(f"{'Consumer':<36}{'Messages':>10}{'Msgs/s':>12}")
+    print(f"{'per-message commit':<36}{args.baseline_messages:>10}{baseline_rate:>12.0f}")
+    print(f"{'batched (max_records=' + str(args.max_records) + ')':<36}{stats['rows']:>10}{batched_rate:>12.0f}"
+          f"  ({stored} rows stored, offsets committed {fake.commits} times up to message {fake.committed})")
+
+    if args.write_delay_ms:
+        consumer_module.get_db_connection = slow_db_connection(args.write_delay_ms / 1000)
+
+    parsers = ['json'] + (['orjson'] if consumer_module.orjson else [])
+    for parser_name in parsers:
+        pipeline_db = os.path.join(directory, f'pipeline_{parser_name}.db')
+        fake = FakeConsumer(args.messages)
+        pipeline = consumer_module.MeasurePipeline(fake, pipeline_db, args.max_records, queue_size=args.queue_size,
+                                                   parser=parser_name, metrics_interval=0)
+        start = time.perf_counter()
+        metrics = pipeline.run(max_batches=batches)
+        rate = metrics['written'] / (time.perf_counter() - start)
+        label = f"pipeline ({parser_name}, queue={args.queue_size})"
+        print(f"{label:<36}{metrics['written']:>10}{rate:>12.0f}"
+              f"  ({metrics['transactions']} transactions, {metrics['pauses']} pauses, "
+              f"batch latency avg {metrics['batch_latency_avg_ms']:.1f} ms / max {metrics['batch_latency_max_ms']:.1f} ms, "
+              f"committed up to message {fake.committed}, kafka lag {metrics['kafka_lag']})")
+
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import time
+import pandas as pd
+from sqlalchemy import insert
+
+# Number of CSV rows parsed and inserted per round trip
+DEFAULT_CHUNKSIZE = 50000
+
+
+class MeasureBulkIngestor:
+    def __init__(self, session, table, chunksize=DEFAULT_CHUNKSIZE):
+        """
+        Initialize the bulk ingestor.
+
+        Args:
+            session: SQLAlchemy session used for the inserts
+            table (sqlalchemy.Table): Target table (e.g. Measure.__table__)
+            chunksize (int): Number of rows read and inserted per chunk
+        """
+        self.session = session
+        self.table = table
+        self.chunksize = chunksize
+
+    def _prepare_chunk(self, chunk):
+        """Convert a CSV chunk into a list of insert parameter dicts."""
+        # Parse the whole column at once instead of one row at a time
+        timestamps = pd.to_datetime(chunk['timestamp']).dt.to_pydatetime()
+        values = chunk['value'].astype(float).tolist()
+
+        return [
+            {'timestamp': ts, 'value': value}
+            for ts, value in zip(timestamps, values)
+        ]
+
+    def ingest(self, source):
+        """
+        Stream a CSV file into the measure table.
+
+        The file is read in chunks of ``chunksize`` rows and each chunk is
+        written with a single executemany insert, so memory stays flat no
+        matter how big the file is. Everything is committed in one
+        transaction at the end.
+
+        Args:
+            source (str or file-like): CSV with at least 'timestamp' and 'value' columns
+
+        Returns:
+            dict: Number of rows inserted, elapsed seconds and rows per second
+        """
+        start = time.perf_counter()
+        total_rows = 0
+
+        try:
+            reader = pd.read_csv(source, usecols=['timestamp', 'value'], chunksize=self.chunksize)
+            for chunk in reader:
+                records = self._prepare_chunk(chunk)
+                if records:
+                    self.session.execute(insert(self.table), records)
+                    total_rows += len(records)
+
+            self.session.commit()
+        except Exception:
+            # Don't leave half a file pending in the session
+            self.session.rollback()
+            raise
+
+        elapsed = time.perf_counter() - start
+        rows_per_sec = total_rows / elapsed if elapsed > 0 else 0.0
+
+        print(f"Inserted {total_rows} measures in {elapsed:.2f}s ({rows_per_sec:.0f} rows/s)")
+        return {
+            'rows': total_rows,
+            'seconds': elapsed,
+            'rows_per_sec': rows_per_sec
+        }
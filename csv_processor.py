@@ -6,24 +6,275 @@ import numpy as np
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import seaborn as sns
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from pandas.api.types import union_categoricals
+from render_cache import RenderCache
 import re
+import sys
 from datetime import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 # Set style for matplotlib
 plt.style.use('ggplot')
 sns.set(style="whitegrid")
 
+# Default number of rows per chunk in streaming mode
+DEFAULT_CHUNKSIZE = 100000
+
+# Processes rendering the plots of visualize_data (1 renders in the calling process)
+# Starting a spawn worker (importing pandas, matplotlib, seaborn and plotly) takes seconds, more than
+# rendering the dozen plots of a typical file, so the pool is only used when this is set above 1
+# and at least RENDER_POOL_MIN_JOBS plots have to be rendered
+RENDER_WORKERS = int(os.getenv('CSV_RENDER_WORKERS', 1))
+RENDER_POOL_MIN_JOBS = int(os.getenv('CSV_RENDER_POOL_MIN_JOBS', 40))
+
+# Number of rows sampled to infer the schema of an export layout
+SCHEMA_SAMPLE_ROWS = 1000
+
+# Text columns with at most this ratio of distinct values in the sample are read as categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+# Repeated-label columns of the Jeedom long-format exports, always read as categoricals
+JEEDOM_LABEL_COLUMNS = ['Objet', 'Équipement', 'Commande', 'Type Générique', 'Unité']
+
+# Float columns are downcast to float32 only if every value is below this magnitude
+# (float32 represents integers exactly up to 2**24) and survives the round trip
+FLOAT32_MAX_MAGNITUDE = 2 ** 24
+FLOAT32_RTOL = 1e-6
+
+# Date formats tried, in order, when inferring the schema
+DATE_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%d',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y',
+]
+
+# Inferred schemas, keyed by header signature (delimiter and column names)
+_SCHEMA_CACHE = {}
+
+
+def _is_date_column(col):
+    """Guess from its name whether a column holds dates."""
+    return 'date' in col.lower() or 'time' in col.lower()
+
+
+def _object_memory(series):
+    """Memory a categorical column would use as a plain object column."""
+    counts = series.value_counts(sort=False, dropna=False)
+    sizes = np.array([sys.getsizeof(value) for value in counts.index])
+    # One pointer per row plus the size of each referenced string
+    return len(series) * 8 + int((counts.values * sizes).sum())
+
+
+def _concat_chunks(chunks):
+    """Concatenate chunks, keeping categorical columns categorical."""
+    for col in chunks[0].select_dtypes(include=['category']).columns:
+        if not all(col in chunk.columns and chunk[col].dtype == 'category' for chunk in chunks):
+            continue
+        categories = union_categoricals([chunk[col] for chunk in chunks], sort_categories=True).categories
+        for chunk in chunks:
+            chunk[col] = chunk[col].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _infer_date_format(values):
+    """Return the first known format that parses every value, or None."""
+    for date_format in DATE_FORMATS:
+        parsed = pd.to_datetime(values, format=date_format, errors='coerce')
+        if parsed.notna().all():
+            return date_format
+    return None
+
+
+class RunningStats:
+    """
+    Summary statistics (count, mean, std, min, max) accumulated chunk by chunk.
+    
+    Chunks are merged with the parallel variance formula, so the result is the
+    same as calling describe() on the concatenated data, without keeping it.
+    """
+    
+    def __init__(self):
+        self.count = None
+        self.mean = None
+        self.m2 = None
+        self.min = None
+        self.max = None
+        # Columns that were not numeric in at least one chunk
+        self.non_numeric = set()
+    
+    def update(self, df):
+        """Merge the numeric columns of a chunk into the running statistics."""
+        numeric_cols = df.select_dtypes(include=[np.number]).columns
+        self.non_numeric.update(col for col in df.columns if col not in numeric_cols)
+        if len(numeric_cols) == 0:
+            return
+        
+        values = df[numeric_cols].astype(float)
+        count = values.count()
+        mean = values.mean()
+        m2 = ((values - mean) ** 2).sum()
+        
+        if self.count is None:
+            self.count, self.mean, self.m2 = count, mean.fillna(0), m2
+            self.min, self.max = values.min(), values.max()
+            return
+        
+        # Align on the union of columns seen so far
+        columns = self.count.index.union(count.index, sort=False)
+        n_a = self.count.reindex(columns, fill_value=0)
+        n_b = count.reindex(columns, fill_value=0)
+        mean_a = self.mean.reindex(columns, fill_value=0)
+        mean_b = mean.reindex(columns).fillna(0)
+        total = n_a + n_b
+        
+        delta = mean_b - mean_a
+        weight = (n_b / total).fillna(0)
+        self.mean = mean_a + delta * weight
+        self.m2 = (self.m2.reindex(columns, fill_value=0) + m2.reindex(columns, fill_value=0)
+                   + (delta ** 2 * n_a * weight))
+        self.count = total
+        self.min = pd.concat([self.min.reindex(columns), values.min().reindex(columns)], axis=1).min(axis=1)
+        self.max = pd.concat([self.max.reindex(columns), values.max().reindex(columns)], axis=1).max(axis=1)
+    
+    def to_frame(self):
+        """Return the statistics in the same layout as DataFrame.describe()."""
+        if self.count is None:
+            return pd.DataFrame()
+        
+        columns = [col for col in self.count.index if col not in self.non_numeric]
+        count = self.count[columns]
+        mean = self.mean[columns].where(count > 0)
+        std = np.sqrt(self.m2[columns] / (count - 1)).where(count > 1)
+        
+        return pd.DataFrame({
+            'count': count.astype(float),
+            'mean': mean,
+            'std': std,
+            'min': self.min[columns],
+            'max': self.max[columns]
+        }).T
+
+
 class CSVProcessor:
     def __init__(self, file_paths):
         """Initialize with a list of CSV file paths."""
         self.file_paths = file_paths
         self.dataframes = {}
         self.cleaned_dataframes = {}
+        self.summary_statistics = {}
+        self.schemas = {}
+        self.memory_reports = {}
+        
+    def _detect_delimiter(self, file_path):
+        """Detect the delimiter (assuming it's either comma or semicolon)."""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            first_line = f.readline()
+        return ';' if ';' in first_line else ','
+
+    def _infer_schema(self, file_path, delimiter):
+        """
+        Work out the column types of a file from a sample of its rows.
+        
+        Args:
+            file_path (str): Path of the CSV file
+            delimiter (str): Field delimiter
+            
+        Returns:
+            dict: 'dates' (column -> format or None), 'comma_decimals',
+                'dot_decimals' and 'categoricals' (lists of columns)
+        """
+        sample = pd.read_csv(file_path, delimiter=delimiter, encoding='utf-8',
+                             nrows=SCHEMA_SAMPLE_ROWS, dtype=str)
+        
+        schema = {'dates': {}, 'comma_decimals': [], 'dot_decimals': [], 'categoricals': []}
+        for col in sample.columns:
+            values = sample[col].dropna()
+            
+            if _is_date_column(col):
+                schema['dates'][col] = _infer_date_format(values) if len(values) else None
+                continue
+            
+            if values.empty:
+                continue
+            
+            if pd.to_numeric(values, errors='coerce').notna().all():
+                if values.str.contains('.', regex=False).any():
+                    schema['dot_decimals'].append(col)
+            elif (values.str.contains(',', regex=False).any()
+                  and pd.to_numeric(values.str.replace(',', '.'), errors='coerce').notna().all()):
+                schema['comma_decimals'].append(col)
+            elif (col in JEEDOM_LABEL_COLUMNS
+                  or values.nunique() <= len(values) * CATEGORY_MAX_UNIQUE_RATIO):
+                schema['categoricals'].append(col)
+        
+        return schema
+    
+    def _dates_match(self, file_path, delimiter, schema):
+        """Check that the date formats of a schema parse the sample rows of a file."""
+        date_formats = {col: fmt for col, fmt in schema['dates'].items() if fmt}
+        if not date_formats:
+            return True
+        sample = pd.read_csv(file_path, delimiter=delimiter, encoding='utf-8', nrows=SCHEMA_SAMPLE_ROWS,
+                             usecols=list(date_formats), dtype=str)
+        return all(
+            pd.to_datetime(sample[col].dropna(), format=fmt, errors='coerce').notna().all()
+            for col, fmt in date_formats.items()
+        )
+    
+    def _get_schema(self, file_path, delimiter):
+        """
+        Return the schema for a file, inferring it once per header signature.
+        
+        A cached schema is only reused if its date formats also parse the
+        file's sample rows; otherwise (same header, different date spelling)
+        the schema of this file is inferred again.
+        """
+        with open(file_path, 'r', encoding='utf-8') as f:
+            header = f.readline().strip()
+        
+        key = (delimiter, header)
+        if key not in _SCHEMA_CACHE:
+            _SCHEMA_CACHE[key] = self._infer_schema(file_path, delimiter)
+        elif not self._dates_match(file_path, delimiter, _SCHEMA_CACHE[key]):
+            return self._infer_schema(file_path, delimiter)
+        return _SCHEMA_CACHE[key]
+    
+    def _read_csv(self, file_path, chunksize=None):
+        """
+        Read a CSV file straight into typed columns using its cached schema.
+        
+        Returns:
+            tuple: (DataFrame or chunk iterator, schema)
+        """
+        delimiter = self._detect_delimiter(file_path)
+        schema = self._get_schema(file_path, delimiter)
+        
+        read_args = {
+            'delimiter': delimiter,
+            'encoding': 'utf-8',
+            'dtype': {col: 'category' for col in schema['categoricals']},
+        }
         
+        # Let the parser handle decimal commas, unless another column uses a decimal point
+        if schema['comma_decimals'] and not schema['dot_decimals'] and delimiter != ',':
+            read_args['decimal'] = ','
+        
+        date_formats = {col: fmt for col, fmt in schema['dates'].items() if fmt}
+        if date_formats:
+            read_args['parse_dates'] = list(date_formats)
+            read_args['date_format'] = date_formats
+        
+        return pd.read_csv(file_path, chunksize=chunksize, **read_args), schema
+
     def import_csv_files(self):
         """Import all CSV files."""
         for file_path in self.file_paths:
@@ -35,16 +286,12 @@ class CSVProcessor:
                 # Get the file name without extension
                 file_name = os.path.basename(file_path).split('.')[0]
                 
-                # Detect the delimiter (assuming it's either comma or semicolon)
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    first_line = f.readline()
-                    delimiter = ';' if ';' in first_line else ','
-                
-                # Read the CSV file
-                df = pd.read_csv(file_path, delimiter=delimiter, encoding='utf-8')
+                # Read the CSV file with the schema of its export layout
+                df, schema = self._read_csv(file_path)
                 
                 # Store the dataframe
                 self.dataframes[file_name] = df
+                self.schemas[file_name] = schema
                 print(f"Successfully imported: {file_name}")
                 print(f"Shape: {df.shape}")
                 print(f"Columns: {df.columns.tolist()}")
@@ -52,50 +299,119 @@ class CSVProcessor:
             except Exception as e:
                 print(f"Error importing {file_path}: {str(e)}")
     
+    def _clean_frame(self, df, name, comma_columns=None, schema=None):
+        """
+        Clean a single dataframe (a whole file or one chunk of it).
+        
+        Args:
+            df (pandas.DataFrame): Raw dataframe, modified in place
+            name (str): Name of the file, used in messages
+            comma_columns (set): If given, columns found to use a comma as decimal
+                separator are added to it, and columns already in it are converted
+                even when this frame has no comma (used to keep chunks consistent)
+            schema (dict): Schema the frame was read with, if any
+            
+        Returns:
+            pandas.DataFrame: The cleaned dataframe
+        """
+        date_formats = schema['dates'] if schema else {}
+        
+        # Convert date columns to datetime (columns parsed at read time are skipped)
+        date_columns = [col for col in df.columns if _is_date_column(col)]
+        for col in date_columns:
+            if pd.api.types.is_datetime64_any_dtype(df[col]):
+                continue
+            try:
+                df[col] = pd.to_datetime(df[col], format=date_formats.get(col), errors='coerce')
+            except:
+                print(f"Could not convert {col} to datetime in {name}")
+        
+        # Handle numeric values with comma as decimal separator
+        # (categorical and already numeric columns are not scanned)
+        numeric_columns = df.select_dtypes(include=['object']).columns
+        for col in numeric_columns:
+            # Check if column contains numeric values with comma as decimal separator
+            known = comma_columns is not None and col in comma_columns
+            if known or df[col].str.contains(',', regex=False).any():
+                try:
+                    # Replace comma with dot and convert to float
+                    df[col] = df[col].str.replace(',', '.').astype(float)
+                    if comma_columns is not None:
+                        comma_columns.add(col)
+                except:
+                    print(f"Could not convert {col} with comma to float in {name}")
+        
+        # Drop rows with all NaN values
+        return df.dropna(how='all')
+    
+    def _compact_frame(self, df):
+        """Downcast float columns to float32 where no precision that matters is lost."""
+        for col in df.select_dtypes(include=['float64']).columns:
+            values = df[col]
+            if not values.abs().max() < FLOAT32_MAX_MAGNITUDE:
+                continue
+            downcast = values.astype('float32')
+            if np.allclose(downcast, values, rtol=FLOAT32_RTOL, atol=0, equal_nan=True):
+                df[col] = downcast
+        return df
+    
+    def _report_memory(self, name, df):
+        """
+        Record and print the memory used by a cleaned dataframe, compared with the
+        same data held as object and float64 columns.
+        """
+        after = int(df.memory_usage(index=True, deep=True).sum())
+        before = after
+        for col in df.columns:
+            if df[col].dtype == 'category':
+                before += _object_memory(df[col]) - int(df[col].memory_usage(index=False, deep=True))
+            elif df[col].dtype == 'float32':
+                before += len(df) * 4
+        
+        rows = max(len(df), 1)
+        self.memory_reports[name] = {'rows': len(df), 'before': before, 'after': after}
+        print(f"Memory for {name}: {before / 1e6:.2f} MB -> {after / 1e6:.2f} MB "
+              f"({before / rows:.1f} -> {after / rows:.1f} bytes/row)")
+    
     def clean_data(self):
         """Clean all imported dataframes."""
         for name, df in self.dataframes.items():
             try:
-                # Create a copy to avoid modifying the original
-                cleaned_df = df.copy()
-                
-                # Convert date columns to datetime
-                date_columns = [col for col in cleaned_df.columns if 'date' in col.lower() or 'time' in col.lower()]
-                for col in date_columns:
-                    try:
-                        cleaned_df[col] = pd.to_datetime(cleaned_df[col], errors='coerce')
-                    except:
-                        print(f"Could not convert {col} to datetime in {name}")
-                
-                # If there's a column named 'Date' but not detected above
-                if 'Date' in cleaned_df.columns and 'Date' not in date_columns:
-                    try:
-                        cleaned_df['Date'] = pd.to_datetime(cleaned_df['Date'], errors='coerce')
-                    except:
-                        print(f"Could not convert Date to datetime in {name}")
-                
-                # Handle numeric values with comma as decimal separator
-                numeric_columns = cleaned_df.select_dtypes(include=['object']).columns
-                for col in numeric_columns:
-                    # Check if column contains numeric values with comma as decimal separator
-                    if cleaned_df[col].str.contains(',', regex=False).any():
-                        try:
-                            # Replace comma with dot and convert to float
-                            cleaned_df[col] = cleaned_df[col].str.replace(',', '.').astype(float)
-                        except:
-                            print(f"Could not convert {col} with comma to float in {name}")
-                
-                # Drop rows with all NaN values
-                cleaned_df = cleaned_df.dropna(how='all')
+                # Clean a copy to avoid modifying the original
+                cleaned_df = self._clean_frame(df.copy(), name, schema=self.schemas.get(name))
+                cleaned_df = self._compact_frame(cleaned_df)
                 
                 # Store the cleaned dataframe
                 self.cleaned_dataframes[name] = cleaned_df
                 print(f"Successfully cleaned: {name}")
                 print(f"Original shape: {df.shape}, Cleaned shape: {cleaned_df.shape}")
+                self._report_memory(name, cleaned_df)
                 print("-" * 50)
             except Exception as e:
                 print(f"Error cleaning {name}: {str(e)}")
     
+    def iter_cleaned_chunks(self, file_path, chunksize=DEFAULT_CHUNKSIZE):
+        """
+        Stream a CSV file as cleaned chunks.
+        
+        Only one chunk is held in memory at a time, and no raw copy is kept.
+        
+        Args:
+            file_path (str): Path of the CSV file
+            chunksize (int): Number of rows per chunk
+            
+        Yields:
+            pandas.DataFrame: Cleaned chunk
+        """
+        name = os.path.basename(file_path).split('.')[0]
+        
+        # Decimal-comma columns seen so far, so later chunks are converted the same way
+        comma_columns = set()
+        
+        reader, schema = self._read_csv(file_path, chunksize=chunksize)
+        for chunk in reader:
+            yield self._clean_frame(chunk, name, comma_columns, schema)
+    
     def generate_summary_statistics(self):
         """Generate summary statistics for all cleaned dataframes."""
         for name, df in self.cleaned_dataframes.items():
@@ -108,6 +424,7 @@ class CSVProcessor:
                 if numeric_cols:
                     # Calculate statistics for numeric columns
                     stats = df[numeric_cols].describe()
+                    self.summary_statistics[name] = stats
                     print(stats)
                 else:
                     print("No numeric columns found.")
@@ -116,109 +433,322 @@ class CSVProcessor:
             except Exception as e:
                 print(f"Error generating statistics for {name}: {str(e)}")
     
-    def visualize_data(self, output_dir="visualizations"):
-        """Create visualizations for the cleaned data."""
-        # Create output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
+    def stream_data(self, chunksize=DEFAULT_CHUNKSIZE, keep_cleaned=False):
+        """
+        Import, clean and compute statistics chunk by chunk.
         
-        for name, df in self.cleaned_dataframes.items():
+        Peak memory is bounded by the chunk size rather than the file size.
+        Quantiles are not computed in this mode since they need the whole column.
+        
+        Args:
+            chunksize (int): Number of rows per chunk
+            keep_cleaned (bool): Also assemble the cleaned chunks into
+                cleaned_dataframes (needed for visualize_data)
+        """
+        for file_path in self.file_paths:
+            if not os.path.exists(file_path):
+                print(f"File not found: {file_path}")
+                continue
+            
+            name = os.path.basename(file_path).split('.')[0]
             try:
-                print(f"Creating visualizations for {name}...")
+                stats = RunningStats()
+                cleaned_chunks = []
+                rows = 0
                 
-                # Identify date columns and numeric columns
-                date_cols = df.select_dtypes(include=['datetime64']).columns.tolist()
-                numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+                for chunk in self.iter_cleaned_chunks(file_path, chunksize):
+                    stats.update(chunk)
+                    rows += len(chunk)
+                    if keep_cleaned:
+                        cleaned_chunks.append(chunk)
                 
-                # If we have date and numeric columns, create time series plots
-                if date_cols and numeric_cols:
-                    for date_col in date_cols:
-                        for numeric_col in numeric_cols[:5]:  # Limit to first 5 numeric columns to avoid too many plots
-                            try:
-                                # Create a time series plot using matplotlib
-                                plt.figure(figsize=(12, 6))
-                                plt.plot(df[date_col], df[numeric_col])
-                                plt.title(f'{numeric_col} over time')
-                                plt.xlabel(date_col)
-                                plt.ylabel(numeric_col)
-                                plt.xticks(rotation=45)
-                                plt.tight_layout()
-                                plt.savefig(f"{output_dir}/{name}_{numeric_col}_timeseries.png")
-                                plt.close()
-                                
-                                # Create an interactive time series plot using plotly
-                                fig = px.line(df, x=date_col, y=numeric_col, 
-                                             title=f'{numeric_col} over time')
-                                fig.update_layout(xaxis_title=date_col, yaxis_title=numeric_col)
-                                fig.write_html(f"{output_dir}/{name}_{numeric_col}_timeseries.html")
-                            except Exception as e:
-                                print(f"Error creating time series plot for {numeric_col}: {str(e)}")
+                self.summary_statistics[name] = stats.to_frame()
+                print(f"Successfully streamed: {name} ({rows} cleaned rows)")
                 
-                # Create distribution plots for numeric columns
-                for col in numeric_cols[:5]:  # Limit to first 5 numeric columns
-                    try:
-                        # Create a histogram using matplotlib
-                        plt.figure(figsize=(10, 6))
-                        sns.histplot(df[col].dropna(), kde=True)
-                        plt.title(f'Distribution of {col}')
-                        plt.xlabel(col)
-                        plt.ylabel('Frequency')
-                        plt.tight_layout()
-                        plt.savefig(f"{output_dir}/{name}_{col}_distribution.png")
-                        plt.close()
-                        
-                        # Create an interactive histogram using plotly
-                        fig = px.histogram(df, x=col, marginal="box", 
-                                          title=f'Distribution of {col}')
-                        fig.update_layout(xaxis_title=col, yaxis_title='Frequency')
-                        fig.write_html(f"{output_dir}/{name}_{col}_distribution.html")
-                    except Exception as e:
-                        print(f"Error creating distribution plot for {col}: {str(e)}")
-                
-                # Create correlation heatmap if there are multiple numeric columns
-                if len(numeric_cols) > 1:
-                    try:
-                        # Calculate correlation matrix
-                        corr_matrix = df[numeric_cols].corr()
-                        
-                        # Create a heatmap using seaborn
-                        plt.figure(figsize=(12, 10))
-                        sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', vmin=-1, vmax=1)
-                        plt.title(f'Correlation Matrix for {name}')
-                        plt.tight_layout()
-                        plt.savefig(f"{output_dir}/{name}_correlation_heatmap.png")
-                        plt.close()
-                        
-                        # Create an interactive heatmap using plotly
-                        fig = go.Figure(data=go.Heatmap(
-                            z=corr_matrix.values,
-                            x=corr_matrix.columns,
-                            y=corr_matrix.index,
-                            colorscale='RdBu_r',
-                            zmin=-1, zmax=1,
-                            text=corr_matrix.round(2).values,
-                            texttemplate="%{text}",
-                            textfont={"size":10}
-                        ))
-                        fig.update_layout(title=f'Correlation Matrix for {name}')
-                        fig.write_html(f"{output_dir}/{name}_correlation_heatmap.html")
-                    except Exception as e:
-                        print(f"Error creating correlation heatmap: {str(e)}")
-                
-                print(f"Visualizations for {name} saved to {output_dir}")
+                if keep_cleaned and cleaned_chunks:
+                    cleaned_df = self._compact_frame(_concat_chunks(cleaned_chunks))
+                    self.cleaned_dataframes[name] = cleaned_df
+                    self._report_memory(name, cleaned_df)
+                print(f"Summary statistics for {name}:")
+                if self.summary_statistics[name].empty:
+                    print("No numeric columns found.")
+                else:
+                    print(self.summary_statistics[name])
                 print("-" * 50)
+            except Exception as e:
+                print(f"Error streaming {file_path}: {str(e)}")
+    
+    def _plot_jobs(self, name, df, output_dir):
+        """
+        Build the list of plot jobs for a cleaned dataframe.
+        
+        Jobs are keyed by output path, so plots that would overwrite each other
+        (e.g. the same time series against several date columns) are rendered once.
+        """
+        jobs = {}
+        
+        # Identify date columns and numeric columns
+        date_cols = df.select_dtypes(include=['datetime64']).columns.tolist()
+        numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+        
+        # If we have date and numeric columns, create time series plots
+        if date_cols and numeric_cols:
+            for date_col in date_cols:
+                for numeric_col in numeric_cols[:5]:  # Limit to first 5 numeric columns to avoid too many plots
+                    path = f"{output_dir}/{name}_{numeric_col}_timeseries"
+                    # The last date column wins, as when files were overwritten
+                    jobs[path] = {
+                        'kind': 'timeseries',
+                        'path': path,
+                        'data': df[[date_col, numeric_col]],
+                        'x': date_col,
+                        'y': numeric_col
+                    }
+        
+        # Create distribution plots for numeric columns
+        for col in numeric_cols[:5]:  # Limit to first 5 numeric columns
+            path = f"{output_dir}/{name}_{col}_distribution"
+            jobs[path] = {'kind': 'distribution', 'path': path, 'data': df[[col]], 'x': col}
+        
+        # Create correlation heatmap if there are multiple numeric columns
+        if len(numeric_cols) > 1:
+            path = f"{output_dir}/{name}_correlation_heatmap"
+            jobs[path] = {
+                'kind': 'correlation',
+                'path': path,
+                'data': df[numeric_cols].corr(),
+                'name': name
+            }
+        
+        return list(jobs.values())
+    
+    def visualize_data(self, output_dir="visualizations", workers=None):
+        """
+        Create visualizations for the cleaned data.
+        
+        Args:
+            output_dir (str): Directory to save visualizations
+            workers (int): Rendering processes, 1 renders in this process (if None,
+                RENDER_WORKERS when at least RENDER_POOL_MIN_JOBS plots are rendered, else 1)
+        """
+        # Create output directory if it doesn't exist
+        os.makedirs(output_dir, exist_ok=True)
+        
+        jobs = []
+        for name, df in self.cleaned_dataframes.items():
+            try:
+                print(f"Creating visualizations for {name}...")
+                jobs.extend(self._plot_jobs(name, df, output_dir))
             except Exception as e:
                 print(f"Error visualizing {name}: {str(e)}")
+        
+        # Skip plots whose data and parameters have not changed since the last render
+        cache = RenderCache(output_dir)
+        pending = []
+        for job in jobs:
+            params = {k: v for k, v in job.items() if k not in ('data', 'path')}
+            job['key'] = RenderCache.make_key(job['data'], **params)
+            if not cache.is_fresh(job['path'], job['key']):
+                pending.append(job)
+        jobs = pending
+        
+        if not jobs:
+            cache.save()
+            return
+        
+        if workers is None:
+            workers = RENDER_WORKERS if len(jobs) >= RENDER_POOL_MIN_JOBS else 1
+        workers = min(workers, len(jobs))
+        if workers > 1:
+            # Use spawn so workers start from a clean interpreter with the Agg backend
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                errors = list(executor.map(_render_job, jobs))
+        else:
+            errors = [_render_job(job) for job in jobs]
+        
+        for job, error in zip(jobs, errors):
+            if error:
+                print(error)
+            else:
+                cache.store(job['path'], job['key'], [f"{job['path']}.png", f"{job['path']}.html"])
+        cache.save()
+        
+        print(f"Rendered {len(jobs)} visualizations to {output_dir} with {workers} worker(s)")
+        print("-" * 50)
+    
+    def prepare_data(self, chunksize=None):
+        """
+        Import, clean and summarize the files, without rendering.
+        
+        Args:
+            chunksize (int): If given, run in streaming mode and only keep the
+                cleaned data (no raw copy)
+        """
+        if chunksize:
+            self.stream_data(chunksize, keep_cleaned=True)
+        else:
+            self.import_csv_files()
+            self.clean_data()
+            self.generate_summary_statistics()
     
-    def process_all(self, output_dir="visualizations"):
-        """Run the complete processing pipeline."""
-        self.import_csv_files()
-        self.clean_data()
-        self.generate_summary_statistics()
-        self.visualize_data(output_dir)
+    def _process_parallel(self, chunksize, workers):
+        """Fan the preparation of the files out across a process pool and merge the results in input order."""
+        # If two paths share a file name, the last one wins but the name keeps the place
+        # of its first path (as in sequential mode), so no two workers prepare the same name
+        unique_paths = {}
+        for file_path in self.file_paths:
+            name = os.path.basename(file_path).split('.')[0]
+            unique_paths[name] = file_path
+        
+        # Use spawn so workers start from a clean interpreter with the Agg backend
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [
+                executor.submit(_process_file, file_path, chunksize)
+                for file_path in unique_paths.values()
+            ]
+            results = [future.result() for future in futures]
+        
+        # Merge back in the order the files were given
+        for name, cleaned_df, stats in results:
+            if cleaned_df is not None:
+                self.cleaned_dataframes[name] = cleaned_df
+            if stats is not None:
+                self.summary_statistics[name] = stats
+    
+    def process_all(self, output_dir="visualizations", chunksize=None, workers=None, render_workers=None):
+        """
+        Run the complete processing pipeline.
+        
+        Args:
+            output_dir (str): Directory to save visualizations
+            chunksize (int): If given, import, clean and statistics run in streaming
+                mode and only the cleaned data is kept (no raw copy)
+            workers (int): If greater than 1, prepare files in parallel with this
+                many worker processes, one file each (the plots are then rendered
+                once, here, for all of them)
+            render_workers (int): Rendering processes for visualize_data (see its workers)
+        """
+        if workers and workers > 1 and len(self.file_paths) > 1:
+            self._process_parallel(chunksize, workers)
+        else:
+            self.prepare_data(chunksize)
+        self.visualize_data(output_dir, workers=render_workers)
         
         return self.cleaned_dataframes
 
 
+def _save_plotly_html(fig, path):
+    """Write a plotly figure that loads plotly.min.js from its own directory."""
+    # 'directory' writes plotly.min.js once next to the HTML files instead of
+    # embedding the whole bundle in every file
+    fig.write_html(path, include_plotlyjs='directory')
+
+
+def _render_timeseries(job):
+    """Render a time series as PNG (matplotlib) and HTML (plotly)."""
+    df, x, y = job['data'], job['x'], job['y']
+    
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    ax.plot(df[x], df[y])
+    ax.set_title(f'{y} over time')
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    fig.savefig(f"{job['path']}.png")
+    
+    fig = px.line(df, x=x, y=y, title=f'{y} over time')
+    fig.update_layout(xaxis_title=x, yaxis_title=y)
+    _save_plotly_html(fig, f"{job['path']}.html")
+
+
+def _render_distribution(job):
+    """Render a histogram as PNG (seaborn) and HTML (plotly)."""
+    df, col = job['data'], job['x']
+    
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    sns.histplot(df[col].dropna(), kde=True, ax=ax)
+    ax.set_title(f'Distribution of {col}')
+    ax.set_xlabel(col)
+    ax.set_ylabel('Frequency')
+    fig.tight_layout()
+    fig.savefig(f"{job['path']}.png")
+    
+    fig = px.histogram(df, x=col, marginal="box", title=f'Distribution of {col}')
+    fig.update_layout(xaxis_title=col, yaxis_title='Frequency')
+    _save_plotly_html(fig, f"{job['path']}.html")
+
+
+def _render_correlation(job):
+    """Render a correlation heatmap as PNG (seaborn) and HTML (plotly)."""
+    corr_matrix, name = job['data'], job['name']
+    
+    fig = Figure(figsize=(12, 10))
+    ax = fig.add_subplot()
+    sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', vmin=-1, vmax=1, ax=ax)
+    ax.set_title(f'Correlation Matrix for {name}')
+    fig.tight_layout()
+    fig.savefig(f"{job['path']}.png")
+    
+    fig = go.Figure(data=go.Heatmap(
+        z=corr_matrix.values,
+        x=corr_matrix.columns,
+        y=corr_matrix.index,
+        colorscale='RdBu_r',
+        zmin=-1, zmax=1,
+        text=corr_matrix.round(2).values,
+        texttemplate="%{text}",
+        textfont={"size":10}
+    ))
+    fig.update_layout(title=f'Correlation Matrix for {name}')
+    _save_plotly_html(fig, f"{job['path']}.html")
+
+
+_RENDERERS = {
+    'timeseries': _render_timeseries,
+    'distribution': _render_distribution,
+    'correlation': _render_correlation,
+}
+
+
+def _render_job(job):
+    """
+    Render one plot job (process pool worker).
+    
+    Returns:
+        str: Error message, or None on success
+    """
+    try:
+        _RENDERERS[job['kind']](job)
+        return None
+    except Exception as e:
+        return f"Error creating {job['kind']} plot {os.path.basename(job['path'])}: {str(e)}"
+
+
+def _process_file(file_path, chunksize=None):
+    """
+    Import, clean and summarize a single file (process pool worker).
+    
+    Rendering is left to the parent, which renders the plots of every file once.
+    
+    Returns:
+        tuple: (file name, cleaned dataframe or None, summary statistics or None)
+    """
+    name = os.path.basename(file_path).split('.')[0]
+    processor = CSVProcessor([file_path])
+    processor.prepare_data(chunksize)
+    
+    return (
+        name,
+        processor.cleaned_dataframes.get(name),
+        processor.summary_statistics.get(name)
+    )
+
+
 def main():
     # Define the CSV file paths
     csv_files = [
@@ -0,0 +1,164 @@
+"""
+Shared access to the SQLite database holding the history.
+
+Every module opens the history database through here, so they agree on its
+path (SQLITE_DB, or SmartHome.db next to this file) and on its settings: WAL
+journal, so readers keep reading while a writer commits, synchronous=NORMAL,
+a memory mapped file and a larger page cache.
+
+get_connection hands each thread its own connection and keeps it open for the
+thread's next calls, so the prepared statements and the page cache of the
+connection are reused instead of being rebuilt on every call. When a thread
+ends, its connections go back to an idle pool for the next threads (a web
+server starting a thread per request then reuses the same few connections).
+Pooled connections must not be closed by their users; connect opens one owned
+by the caller, for long-lived writers and command line tools.
+"""
+
+import os
+import sqlite3
+import threading
+
+# Database used when no path is given and SQLITE_DB is not set
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SmartHome.db')
+
+# Seconds a connection waits for a lock held by another one
+BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', 30))
+
+# Bytes of the database file memory mapped by each connection
+MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+# KiB of page cache of each connection
+CACHE_SIZE_KIB = int(os.getenv('SQLITE_CACHE_SIZE_KIB', 64 * 1024))
+
+# Prepared statements kept by each connection
+STATEMENT_CACHE_SIZE = int(os.getenv('SQLITE_STATEMENT_CACHE_SIZE', 256))
+
+# Connections per database kept open by the idle pool
+MAX_IDLE_CONNECTIONS = int(os.getenv('SQLITE_MAX_IDLE_CONNECTIONS', 8))
+
+_local = threading.local()
+_idle_lock = threading.Lock()
+# Connections of ended threads by (process id, path)
+_idle = {}
+
+
+def resolve_path(path=None):
+    """Database to use: path, else SQLITE_DB, else DEFAULT_DB_PATH."""
+    return path or os.getenv('SQLITE_DB') or DEFAULT_DB_PATH
+
+
+def connect(path=None, **kwargs):
+    """
+    Open a connection with the shared settings.
+
+    The connection belongs to the caller, who closes it. Keyword arguments
+    are passed to sqlite3.connect.
+
+    Args:
+        path (str): SQLite database (see resolve_path)
+
+    Returns:
+        sqlite3.Connection: The connection
+    """
+    kwargs.setdefault('timeout', BUSY_TIMEOUT)
+    kwargs.setdefault('cached_statements', STATEMENT_CACHE_SIZE)
+    # Connections are only shared between threads through the idle pool, one thread at a time
+    kwargs.setdefault('check_same_thread', False)
+    conn = sqlite3.connect(resolve_path(path), **kwargs)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size={-CACHE_SIZE_KIB}")
+    return conn
+
+
+def _is_open(conn):
+    """False once a connection has been closed."""
+    try:
+        conn.total_changes
+    except sqlite3.ProgrammingError:
+        return False
+    return True
+
+
+def _release(key, conn):
+    """Put a connection back in the idle pool, or close it when the pool is full."""
+    if not _is_open(conn):  # Closed by its user
+        return
+    if conn.in_transaction:
+        conn.rollback()
+    with _idle_lock:
+        idle = _idle.setdefault(key, [])
+        if len(idle) < MAX_IDLE_CONNECTIONS:
+            idle.append(conn)
+            return
+    conn.close()
+
+
+class _ThreadConnections(dict):
+    """Connections of a thread by path, released to the idle pool when the thread ends."""
+
+    def __init__(self):
+        super().__init__()
+        self.pid = os.getpid()
+
+    def __del__(self):
+        # A forked process leaves the connections of its parent alone
+        if self.pid != os.getpid():
+            return
+        for path, conn in self.items():
+            _release((self.pid, path), conn)
+
+
+def _thread_connections():
+    """Connections of the calling thread."""
+    connections = getattr(_local, 'connections', None)
+    if connections is None or connections.pid != os.getpid():
+        connections = _local.connections = _ThreadConnections()
+    return connections
+
+
+def get_connection(path=None):
+    """
+    Pooled connection of the calling thread to a database.
+
+    Do not close it: it is kept for the next calls of the thread. Use it in a
+    `with conn:` block to write, so the transaction ends with the block.
+
+    Args:
+        path (str): SQLite database (see resolve_path)
+
+    Returns:
+        sqlite3.Connection: The connection
+    """
+    path = os.path.abspath(resolve_path(path))
+    connections = _thread_connections()
+    conn = connections.get(path)
+    if conn is not None and _is_open(conn):
+        return conn
+
+    with _idle_lock:
+        idle = _idle.get((connections.pid, path))
+        conn = idle.pop() if idle else None
+    connections[path] = conn or connect(path)
+    return connections[path]
+
+
+def reset_connections():
+    """Roll back the transactions left open on the calling thread's connections (e.g. by a failed request)."""
+    for conn in _thread_connections().values():
+        if _is_open(conn) and conn.in_transaction:
+            conn.rollback()
+
+
+def close_connections():
+    """Close the calling thread's connections and the idle ones."""
+    connections = _thread_connections()
+    with _idle_lock:
+        idle = [conn for key, conns in _idle.items() if key[0] == connections.pid for conn in conns]
+        for key in [key for key in _idle if key[0] == connections.pid]:
+            del _idle[key]
+    for conn in list(connections.values()) + idle:
+        conn.close()
+    connections.clear()
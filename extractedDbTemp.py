@@ -1,7 +1,5 @@
-import sqlite3
 import pandas as pd
-
-DB_NAME = "SmartHome.db"
+from data_access import get_connection
 
 def import_csv_to_db(csv_file_path):
     """Reads CSV and imports data into SQLite 'measures' table."""
@@ -12,10 +10,9 @@ def import_csv_to_db(csv_file_path):
     df['building'] = 'BAT'  # Example fixed building name
 
     # Connect to DB
-    conn = sqlite3.connect(DB_NAME)
-    # Append to 'measures' table
+    conn = get_connection()
+    # Append to 'measures' table (pandas commits the insert)
     df.to_sql('measures', conn, if_exists='append', index=False)
-    conn.close()
 
 if __name__ == '__main__':
     # Example usage
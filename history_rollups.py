@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Hourly and daily rollups of the history table.
+
+history_hourly and history_daily hold the Sum, Count, Min and Max of Value per
+(BAT, Type, Period), Mean being Sum / Count. write_history keeps them up to
+date: the periods covered by the written rows are recomputed from history in
+the same transaction, so upserted (changed) rows are never counted twice.
+
+Usage: python history_rollups.py --db SmartHome.db   (rebuild from existing history)
+"""
+
+import sys
+import time
+import argparse
+import pandas as pd
+from data_access import connect, resolve_path
+
+# Rollup tables, finest first
+ROLLUP_TABLES = ['history_hourly', 'history_daily']
+
+# Format of the hourly Periods (and of the history Datetime column)
+HOURLY_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+ROLLUP_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        BAT TEXT,
+        Type TEXT,
+        Period TEXT,
+        Sum REAL,
+        Count INTEGER,
+        Min REAL,
+        Max REAL,
+        PRIMARY KEY (BAT, Type, Period)
+    )
+'''
+
+# Hourly Period of a history Datetime, whatever its spelling (write_history normalizes
+# Datetime to HOURLY_FORMAT, rows written by older code may be date-only or use a T)
+HOURLY_PERIOD_SQL = "strftime('%Y-%m-%d %H:00:00', Datetime)"
+
+# Hourly periods aggregated from the raw history rows of one (BAT, Type) between two hours
+# (the days of the range are first selected on the text key, which every spelling of them sorts in)
+HOURLY_FROM_HISTORY_SQL = f'''
+    INSERT INTO history_hourly (BAT, Type, Period, Sum, Count, Min, Max)
+    SELECT BAT, Type, {HOURLY_PERIOD_SQL}, SUM(Value), COUNT(Value), MIN(Value), MAX(Value)
+    FROM history
+    WHERE BAT IS :bat AND Type IS :type AND Value IS NOT NULL
+        AND Datetime >= date(:start) AND Datetime < date(:end, '+1 day')
+        AND {HOURLY_PERIOD_SQL} >= :start AND {HOURLY_PERIOD_SQL} < :end
+    GROUP BY {HOURLY_PERIOD_SQL}
+'''
+
+# Daily periods aggregated from the hourly rollup of one (BAT, Type) between two hours
+DAILY_FROM_HOURLY_SQL = '''
+    INSERT INTO history_daily (BAT, Type, Period, Sum, Count, Min, Max)
+    SELECT BAT, Type, substr(Period, 1, 10), SUM(Sum), SUM(Count), MIN(Min), MAX(Max)
+    FROM history_hourly
+    WHERE BAT IS ? AND Type IS ? AND Period >= ? AND Period < ?
+    GROUP BY substr(Period, 1, 10)
+'''
+
+
+def create_rollup_tables(cursor):
+    """
+    Create the rollup tables if needed.
+
+    Returns:
+        bool: True if a table was created (it then needs rebuild_rollups)
+    """
+    existing = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    created = False
+    for table in ROLLUP_TABLES:
+        if table not in existing:
+            cursor.execute(ROLLUP_TABLE_SQL.format(table=table))
+            created = True
+    return created
+
+
+def rebuild_rollups(cursor):
+    """Recompute every rollup from the whole history table."""
+    cursor.execute("DELETE FROM history_hourly")
+    cursor.execute(f'''
+        INSERT INTO history_hourly (BAT, Type, Period, Sum, Count, Min, Max)
+        SELECT BAT, Type, {HOURLY_PERIOD_SQL}, SUM(Value), COUNT(Value), MIN(Value), MAX(Value)
+        FROM history
+        WHERE Value IS NOT NULL AND {HOURLY_PERIOD_SQL} IS NOT NULL
+        GROUP BY BAT, Type, {HOURLY_PERIOD_SQL}
+    ''')
+    cursor.execute("DELETE FROM history_daily")
+    cursor.execute('''
+        INSERT INTO history_daily (BAT, Type, Period, Sum, Count, Min, Max)
+        SELECT BAT, Type, substr(Period, 1, 10), SUM(Sum), SUM(Count), MIN(Min), MAX(Max)
+        FROM history_hourly
+        GROUP BY BAT, Type, substr(Period, 1, 10)
+    ''')
+
+
+def update_rollups(cursor, df):
+    """
+    Recompute the rollup periods covered by rows just written to history.
+
+    For each (BAT, Type) of the frame, the hours between its first and last
+    Datetime are recomputed from history, then the days holding them from the
+    hourly rollup. Must run in the transaction that wrote the rows.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor of the writing connection
+        df (pandas.DataFrame): Rows written, with BAT, Type and Datetime columns
+    """
+    if df.empty:
+        return
+
+    datetimes = pd.to_datetime(df['Datetime'], format='ISO8601')
+    ranges = datetimes.groupby([df['BAT'], df['Type']], dropna=False).agg(['min', 'max'])
+
+    for (bat, type_), (first, last) in ranges.iterrows():
+        if pd.isna(first):
+            continue
+        bat = None if pd.isna(bat) else bat
+        type_ = None if pd.isna(type_) else type_
+
+        # Hours from the first to the last written one, then the days holding them
+        hour_start = first.floor('h').strftime(HOURLY_FORMAT)
+        hour_end = (last.floor('h') + pd.Timedelta(hours=1)).strftime(HOURLY_FORMAT)
+        day_start = first.floor('D').strftime(HOURLY_FORMAT)
+        day_end = (last.floor('D') + pd.Timedelta(days=1)).strftime(HOURLY_FORMAT)
+
+        cursor.execute("DELETE FROM history_hourly WHERE BAT IS ? AND Type IS ? AND Period >= ? AND Period < ?",
+                       (bat, type_, hour_start, hour_end))
+        cursor.execute(HOURLY_FROM_HISTORY_SQL, {'bat': bat, 'type': type_, 'start': hour_start, 'end': hour_end})
+        cursor.execute("DELETE FROM history_daily WHERE BAT IS ? AND Type IS ? AND Period >= ? AND Period < ?",
+                       (bat, type_, day_start[:10], day_end[:10]))
+        cursor.execute(DAILY_FROM_HOURLY_SQL, (bat, type_, day_start, day_end))
+
+
+def read_daily_rollup(conn, bat, types=None, exclude_types=None, start=None, end=None):
+    """
+    Read the daily rollup of a BAT.
+
+    Args:
+        conn (sqlite3.Connection): Open connection
+        bat (str): BAT to read
+        types (list): Only these Types
+        exclude_types (list): Leave these Types out (Types starting with DEVICE are always kept)
+        start (str): First day ('YYYY-MM-DD'), included
+        end (str): Last day ('YYYY-MM-DD'), included
+
+    Returns:
+        list: (Period, Type, Sum, Count, Min, Max, Mean) tuples ordered by Period
+    """
+    conditions = ["BAT = ?"]
+    params = [bat]
+    if types:
+        conditions.append(f"Type IN ({', '.join('?' * len(types))})")
+        params.extend(types)
+    if exclude_types:
+        conditions.append(f"(Type LIKE 'DEVICE%' OR Type NOT IN ({', '.join('?' * len(exclude_types))}))")
+        params.extend(exclude_types)
+    if start:
+        conditions.append("Period >= ?")
+        params.append(start)
+    if end:
+        conditions.append("Period <= ?")
+        params.append(end)
+
+    return conn.execute(f'''
+        SELECT Period, Type, Sum, Count, Min, Max, Sum / Count
+        FROM history_daily
+        WHERE {' AND '.join(conditions)}
+        ORDER BY Period
+    ''', params).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the history rollups from the history table.')
+    parser.add_argument('--db', type=str, default=resolve_path(),
+                        help='SQLite database holding the history table')
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    try:
+        start = time.perf_counter()
+        with conn:
+            cursor = conn.cursor()
+            create_rollup_tables(cursor)
+            rebuild_rollups(cursor)
+        hourly = conn.execute("SELECT COUNT(*) FROM history_hourly").fetchone()[0]
+        daily = conn.execute("SELECT COUNT(*) FROM history_daily").fetchone()[0]
+        print(f"Rebuilt {hourly} hourly and {daily} daily rollup rows in {time.perf_counter() - start:.2f}s")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Schema of the history table.
+
+The history table lives in plain SQLite databases written by WeatherDataFetcher
+and the sample import routes, so its schema is maintained here rather than by
+the Alembic migrations (which only cover the Flask-SQLAlchemy database).
+"""
+
+import os
+import pandas as pd
+from history_rollups import create_rollup_tables, rebuild_rollups, update_rollups, HOURLY_FORMAT
+
+HISTORY_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        BAT TEXT,
+        Datetime TEXT,
+        Objet TEXT,
+        Commande TEXT,
+        Name TEXT,
+        Type TEXT,
+        Value REAL,
+        Unit TEXT,
+        Timestamp INTEGER
+    )
+'''
+
+# Columns of the history table, added if missing from tables created by older code
+HISTORY_COLUMNS = {
+    'BAT': 'TEXT',
+    'Datetime': 'TEXT',
+    'Objet': 'TEXT',
+    'Commande': 'TEXT',
+    'Name': 'TEXT',
+    'Type': 'TEXT',
+    'Value': 'REAL',
+    'Unit': 'TEXT',
+    'Timestamp': 'INTEGER',
+}
+
+# Types written by WeatherDataFetcher, shown by display_weather
+WEATHER_TYPES = ['TEMPERATURE', 'TEMPERATURE_MIN', 'TEMPERATURE_MAX', 'PRECIPITATION', 'WIND_SPEED']
+
+# Types that are not device consumptions (every other Type, and any DEVICE_* Type, is a device)
+NON_DEVICE_TYPES = WEATHER_TYPES + ['HUMIDITY', 'ELECTRICITY', 'GAS', 'WATER', 'INDOOR_TEMP']
+
+# Unique key of the history table, used by display_weather / generate_visualizations
+# (filter on BAT and Type, then ORDER BY Datetime) and by the upsert in write_history.
+# Datetime stays the time key of every query: the upsert needs this index anyway and,
+# stored normalized (see normalize_datetimes), its text order is chronological. The
+# epoch Timestamp column is a numeric copy for readers of the table and is not indexed,
+# as a second index on it would cost every write without speeding up any query.
+HISTORY_INDEXES = {
+    'ux_history_bat_type_datetime': 'history (BAT, Type, Datetime)',
+}
+
+# Non-unique index created by the first version of the schema, replaced by the unique one
+LEGACY_INDEXES = ['ix_history_bat_type_datetime']
+
+# Insert a row, or update the existing row with the same key only if something changed
+HISTORY_UPSERT_SQL = '''
+    INSERT INTO history (BAT, Datetime, Objet, Commande, Name, Type, Value, Unit, Timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (BAT, Type, Datetime) DO UPDATE SET
+        Objet = excluded.Objet,
+        Commande = excluded.Commande,
+        Name = excluded.Name,
+        Value = excluded.Value,
+        Unit = excluded.Unit,
+        Timestamp = excluded.Timestamp
+    WHERE history.Value IS NOT excluded.Value
+        OR history.Objet IS NOT excluded.Objet
+        OR history.Commande IS NOT excluded.Commande
+        OR history.Name IS NOT excluded.Name
+        OR history.Unit IS NOT excluded.Unit
+        OR history.Timestamp IS NOT excluded.Timestamp
+'''
+
+# Databases already checked by this process (the check only needs to run once)
+_ensured = set()
+
+
+def datetime_to_epoch(datetimes):
+    """
+    Convert a Series of datetime strings to integer epoch seconds.
+
+    Naive datetimes are treated as UTC, as SQLite's strftime('%s', ...) does.
+    This fills the Timestamp column; queries use Datetime (see HISTORY_INDEXES).
+    """
+    return pd.to_datetime(datetimes, format='ISO8601').astype('int64') // 10 ** 9
+
+
+def normalize_datetimes(datetimes):
+    """
+    Spell a Series of datetimes as the Datetime key of the history table (HOURLY_FORMAT).
+
+    Date-only values become midnight and a T separator a space, so every
+    spelling of an instant is stored, keyed and rolled up the same way.
+    Missing values become None.
+    """
+    parsed = pd.to_datetime(datetimes, format='ISO8601')
+    return parsed.dt.strftime(HOURLY_FORMAT).astype(object).where(parsed.notna(), None)
+
+
+def ensure_history_schema(conn, db_path=None):
+    """
+    Create the history table, its indexes and its rollups if needed.
+
+    Tables created by older code get their missing columns (e.g. Timestamp)
+    added, rows without an epoch Timestamp are backfilled from Datetime, and
+    duplicate (BAT, Type, Datetime) rows are removed (keeping the latest one)
+    before the unique key is created. Missing rollup tables (see
+    history_rollups.py) are created and filled from the existing rows.
+
+    Args:
+        conn (sqlite3.Connection): Open connection
+        db_path (str): Path of the database, used to run the check once per process
+    """
+    key = os.path.abspath(db_path) if db_path else None
+    if key and key in _ensured:
+        return
+
+    cursor = conn.cursor()
+    cursor.execute(HISTORY_TABLE_SQL)
+
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(history)")]
+    for column, column_type in HISTORY_COLUMNS.items():
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE history ADD COLUMN {column} {column_type}")
+
+    cursor.execute('''
+        UPDATE history
+        SET Timestamp = CAST(strftime('%s', Datetime) AS INTEGER)
+        WHERE Timestamp IS NULL OR Timestamp = 0
+    ''')
+
+    existing = [row[1] for row in cursor.execute("PRAGMA index_list(history)")]
+    for name in LEGACY_INDEXES:
+        if name in existing:
+            cursor.execute(f"DROP INDEX {name}")
+
+    if any(name not in existing for name in HISTORY_INDEXES):
+        # Keep only the latest row for each key so the unique index can be built
+        cursor.execute('''
+            DELETE FROM history
+            WHERE id NOT IN (SELECT MAX(id) FROM history GROUP BY BAT, Type, Datetime)
+        ''')
+        for name, definition in HISTORY_INDEXES.items():
+            cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {definition}")
+
+    # Rollups are backfilled from the existing rows when their tables are first created
+    if create_rollup_tables(cursor):
+        rebuild_rollups(cursor)
+
+    conn.commit()
+    if key:
+        _ensured.add(key)
+
+
+def write_history(conn, df, default_unit=None):
+    """
+    Upsert rows into the history table in a single transaction.
+
+    Rows are keyed on (BAT, Type, Datetime): re-importing the same data updates
+    nothing and does not grow the table. The hourly and daily rollups of the
+    written periods are refreshed in the same transaction.
+
+    Args:
+        conn (sqlite3.Connection): Open connection (ensure_history_schema must have run)
+        df (pandas.DataFrame): Rows with at least BAT, Datetime, Type and Value columns;
+            Objet, Commande, Name, Unit and Timestamp are optional. Datetime is
+            stored normalized (see normalize_datetimes)
+        default_unit (str): Unit used when the frame has no Unit column
+
+    Returns:
+        int: Number of rows inserted or changed
+    """
+    n = len(df)
+
+    def column(name, default):
+        return df[name].tolist() if name in df.columns else [default] * n
+
+    timestamps = df['Timestamp'] if 'Timestamp' in df.columns else datetime_to_epoch(df['Datetime'])
+
+    rows = zip(
+        column('BAT', None),
+        normalize_datetimes(df['Datetime']).tolist(),
+        column('Objet', ''),
+        column('Commande', ''),
+        column('Name', ''),
+        column('Type', ''),
+        column('Value', None),
+        column('Unit', default_unit),
+        timestamps.astype('int64').tolist()
+    )
+
+    before = conn.total_changes
+    with conn:
+        conn.executemany(HISTORY_UPSERT_SQL, rows)
+        changed = conn.total_changes - before
+        if changed:
+            update_rollups(conn.cursor(), df)
+    return changed
@@ -0,0 +1,154 @@
+"""
+Vectorized summaries of history data for the weather page and the device charts.
+
+Everything works on daily partial aggregates: one row per (Period, Type) with
+the Sum, Count, Min and Max of Value, as stored by the history_daily rollup.
+Raw history rows are brought to that shape by to_partials. The weather matrix
+is a single pivot_table of the partials and the device statistics a single
+groupby-agg, the summary dicts of display_weather are derived from those.
+"""
+
+import numpy as np
+import pandas as pd
+from history_schema import WEATHER_TYPES
+
+# Columns of the partial aggregates (read_daily_rollup rows carry an extra Mean)
+PARTIAL_COLUMNS = ['Period', 'Type', 'Sum', 'Count', 'Min', 'Max']
+
+# How each Type is combined across the partials of a Period
+PARTIAL_AGGREGATES = {'Sum': 'sum', 'Count': 'sum', 'Min': 'min', 'Max': 'max'}
+
+# weather_data field -> (statistic, Type) of the weather matrix
+WEATHER_FIELDS = {
+    'temp': ('Mean', 'TEMPERATURE'),
+    'temp_min': ('Min', 'TEMPERATURE_MIN'),
+    'temp_max': ('Max', 'TEMPERATURE_MAX'),
+    'precipitation': ('Sum', 'PRECIPITATION'),
+    'wind_speed': ('Mean', 'WIND_SPEED'),
+}
+
+# Value of max_temp when there is no temperature
+NO_MAX_TEMP = -100
+
+
+def rollup_frame(rows):
+    """Build a partials frame from read_daily_rollup rows."""
+    return pd.DataFrame(rows, columns=PARTIAL_COLUMNS + ['Mean'])[PARTIAL_COLUMNS]
+
+
+def to_partials(df):
+    """
+    Turn raw history rows into partial aggregates, one per row.
+
+    Rows without a Value are dropped. The result can be passed to weather_matrix
+    and device_stats as is, they group the rows themselves.
+
+    Args:
+        df (pandas.DataFrame): History rows with Datetime, Type and Value columns
+
+    Returns:
+        pandas.DataFrame: PARTIAL_COLUMNS, Period being the day of Datetime
+    """
+    df = df[df['Value'].notna()]
+    datetimes = df['Datetime']
+    if pd.api.types.is_datetime64_any_dtype(datetimes):
+        periods = datetimes.dt.strftime('%Y-%m-%d')
+    else:
+        periods = datetimes.astype(str).str.slice(0, 10)
+    values = df['Value'].astype(float)
+    return pd.DataFrame({
+        'Period': periods,
+        'Type': df['Type'],
+        'Sum': values,
+        'Count': 1,
+        'Min': values,
+        'Max': values,
+    })
+
+
+def weather_matrix(partials):
+    """
+    Pivot weather partials into one row per Period.
+
+    Returns:
+        pandas.DataFrame: Indexed by Period (sorted), (statistic, Type) columns for
+        Sum, Count, Min, Max and Mean of every WEATHER_TYPES, NaN where a Type has
+        no data for the day
+    """
+    columns = pd.MultiIndex.from_product([list(PARTIAL_AGGREGATES), WEATHER_TYPES])
+    weather = partials[partials['Type'].isin(WEATHER_TYPES)]
+    if weather.empty:
+        matrix = pd.DataFrame(index=pd.Index([], name='Period'), columns=columns, dtype=float)
+    else:
+        matrix = weather.pivot_table(index='Period', columns='Type', values=list(PARTIAL_AGGREGATES),
+                                     aggfunc=PARTIAL_AGGREGATES)
+    matrix = matrix.reindex(columns=columns)
+    means = matrix['Sum'] / matrix['Count'].replace(0, np.nan)
+    means.columns = pd.MultiIndex.from_product([['Mean'], means.columns])
+    return pd.concat([matrix, means], axis=1)
+
+
+def weather_days(matrix):
+    """
+    Per-day weather values of the weather page.
+
+    Returns:
+        dict: Period -> {temp, temp_min, temp_max, precipitation, wind_speed}, 0 where missing
+    """
+    days = pd.DataFrame({field: matrix[column] for field, column in WEATHER_FIELDS.items()}, index=matrix.index)
+    return days.fillna(0).to_dict('index')
+
+
+def weather_summary(matrix):
+    """
+    Summary of the weather page.
+
+    Returns:
+        dict: avg_temp and avg_wind (weighted by the number of values), max_temp
+        (NO_MAX_TEMP without temperatures) and total_precip
+    """
+    def average(type_):
+        count = matrix[('Count', type_)].sum()
+        return float(matrix[('Sum', type_)].sum() / count) if count else 0
+
+    max_temp = matrix[('Max', 'TEMPERATURE')].max()
+    return {
+        'avg_temp': average('TEMPERATURE'),
+        'max_temp': max(NO_MAX_TEMP, float(max_temp)) if pd.notna(max_temp) else NO_MAX_TEMP,
+        'total_precip': float(matrix[('Sum', 'PRECIPITATION')].sum()),
+        'avg_wind': average('WIND_SPEED'),
+    }
+
+
+def device_label(device_type):
+    """Display name of a device Type."""
+    return device_type.replace('DEVICE_', '').title()
+
+
+def device_stats(partials):
+    """
+    Consumption statistics per device Type.
+
+    Returns:
+        pandas.DataFrame: Indexed by Type in order of first appearance, with
+        total, count, avg, max, percentage (of the total of all devices) and label columns
+    """
+    stats = partials.groupby('Type', sort=False).agg(
+        total=('Sum', 'sum'), count=('Count', 'sum'), max=('Max', 'max'))
+    stats['avg'] = stats['total'] / stats['count'].replace(0, np.nan)
+    grand_total = stats['total'].sum()
+    stats['percentage'] = stats['total'] / grand_total * 100 if grand_total > 0 else 0.0
+    stats['label'] = [device_label(device_type) for device_type in stats.index]
+    return stats
+
+
+def device_summary(stats):
+    """
+    Device statistics of the weather page.
+
+    Returns:
+        dict: Device label -> {total, avg, max, percentage}
+    """
+    # Types sharing a label keep the place of the first and the values of the last, like dict assignments
+    stats = stats.groupby('label', sort=False)[['total', 'avg', 'max', 'percentage']].last()
+    return stats.to_dict('index')
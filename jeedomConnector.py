@@ -1,20 +1,294 @@
+"""
+Jeedom connector.
+
+JeedomClient reads many command values per request through the JSON-RPC API
+(cmd::execCmd accepts a list of ids) over a reused session, and JeedomPoller
+reads a set of commands on a schedule and writes each round into the history
+table in one transaction.
+
+Usage: python jeedomConnector.py --commands commands.json --interval 60
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import itertools
 import requests
+import pandas as pd
+from datetime import datetime
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from data_access import connect, resolve_path
+from history_schema import ensure_history_schema, write_history
+
+load_dotenv()
+
+JEEDOM_URL = os.getenv('JEEDOM_URL', "https://h2o.eu.jeedom.link/")
+JEEDOM_API_KEY = os.getenv('JEEDOM_API_KEY', "AnxyTteWw8DlvZqHQ1rnVFYuRR7NbXN0")
+
+# Command ids sent in a single cmd::execCmd call
+DEFAULT_BATCH_SIZE = 100
+
+# cmd::execCmd calls running at the same time
+DEFAULT_CONCURRENCY = 4
+
+# (connect, read) timeouts of Jeedom requests, in seconds
+DEFAULT_TIMEOUT = (3.05, 30)
+
+# Seconds between two polling rounds
+DEFAULT_INTERVAL = 60
+
+# Format of the collectDate of a command reading
+COLLECT_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Session used by get_jeedom_data
+_session = requests.Session()
 
-JEEDOM_URL = "https://h2o.eu.jeedom.link/"
-JEEDOM_API_KEY = "AnxyTteWw8DlvZqHQ1rnVFYuRR7NbXN0"
 
 def get_jeedom_data(cmd_id="1"):
     """Minimal example to fetch data from Jeedom."""
-    endpoint = f"{JEEDOM_URL}/core/api/jeeApi.php"
+    endpoint = f"{JEEDOM_URL.rstrip('/')}/core/api/jeeApi.php"
     params = {
         "apikey": JEEDOM_API_KEY,
         "type": "cmd",
         "id": cmd_id
     }
-    response = requests.get(endpoint, params=params)
+    response = _session.get(endpoint, params=params, timeout=DEFAULT_TIMEOUT)
     data = response.json()
     return data
 
+
+class JeedomError(Exception):
+    """Error returned by the Jeedom JSON-RPC API."""
+
+
+class JeedomClient:
+    """JSON-RPC client of the Jeedom API reading command values in batches."""
+
+    def __init__(self, url=JEEDOM_URL, api_key=JEEDOM_API_KEY, batch_size=DEFAULT_BATCH_SIZE,
+                 concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, session=None):
+        """
+        Initialize the client.
+
+        Args:
+            url (str): Base URL of the Jeedom box
+            api_key (str): API key
+            batch_size (int): Command ids per cmd::execCmd call
+            concurrency (int): Calls running at the same time
+            timeout (float or tuple): requests timeout
+            session (requests.Session): Session to reuse, a new pooled one if None
+        """
+        self.endpoint = f"{url.rstrip('/')}/core/api/jeeApi.php"
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='jeedom')
+
+    def call(self, method, **params):
+        """
+        Call a JSON-RPC method.
+
+        Returns:
+            The 'result' member of the response
+
+        Raises:
+            JeedomError: The API answered with an error
+        """
+        payload = {
+            'jsonrpc': '2.0',
+            'id': next(self._ids),
+            'method': method,
+            'params': {'apikey': self.api_key, **params},
+        }
+        response = self.session.post(self.endpoint, data={'request': json.dumps(payload)}, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        if 'error' in data:
+            raise JeedomError(f"{method}: {data['error'].get('message', data['error'])}")
+        return data.get('result')
+
+    def _exec_batch(self, cmd_ids):
+        """Read one batch of command readings."""
+        result = self.call('cmd::execCmd', id=[int(cmd_id) for cmd_id in cmd_ids])
+        # A list of ids is answered with id -> {value, collectDate}, a single id with its reading alone
+        if not isinstance(result, dict) or (len(cmd_ids) == 1 and str(cmd_ids[0]) not in result):
+            return {str(cmd_ids[0]): to_reading(result)}
+        return {str(cmd_id): to_reading(reading) for cmd_id, reading in result.items()}
+
+    def exec_cmds(self, cmd_ids):
+        """
+        Read the current value of many commands.
+
+        Ids are sent batch_size at a time, at most concurrency calls at once.
+
+        Returns:
+            dict: Command id (str) -> reading, see to_reading
+        """
+        cmd_ids = list(cmd_ids)
+        batches = [cmd_ids[i:i + self.batch_size] for i in range(0, len(cmd_ids), self.batch_size)]
+
+        values = {}
+        for batch_values in self._executor.map(self._exec_batch, batches):
+            values.update(batch_values)
+        return values
+
+
+def to_reading(result):
+    """
+    Normalize the answer of cmd::execCmd for one command.
+
+    Jeedom answers each id with a {value, collectDate} object; a bare value
+    (older boxes, plugins) is accepted too.
+
+    Returns:
+        dict: 'value' and 'collectDate' (None if unknown)
+    """
+    if isinstance(result, dict) and 'value' in result:
+        return {'value': result['value'], 'collectDate': result.get('collectDate') or None}
+    return {'value': result, 'collectDate': None}
+
+
+def load_commands(path):
+    """
+    Load the commands to poll.
+
+    The file is a JSON list of objects with an 'id' and the history columns of
+    the command (BAT, Type and optionally Objet, Commande, Name, Unit).
+
+    Returns:
+        dict: Command id (str) -> history columns
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        commands = json.load(f)
+    return {str(command.pop('id')): command for command in commands}
+
+
+def to_history_frame(commands, values, when=None):
+    """
+    Build history rows from command readings.
+
+    Each row is dated with the collectDate of its reading, or with when if the
+    reading has none. Non-numeric values (and commands missing from values)
+    are skipped.
+
+    Args:
+        commands (dict): Command id -> history columns
+        values (dict): Command id -> reading (see to_reading) or bare value
+        when (datetime): Time of the poll, now if None
+
+    Returns:
+        pandas.DataFrame: Rows for write_history
+    """
+    when = (when or datetime.now()).strftime(COLLECT_DATE_FORMAT)
+    readings = {cmd_id: to_reading(value) for cmd_id, value in values.items() if cmd_id in commands}
+    rows = [dict(commands[cmd_id], Datetime=reading['collectDate'] or when, Value=reading['value'])
+            for cmd_id, reading in readings.items()]
+    df = pd.DataFrame(rows, columns=['BAT', 'Datetime', 'Objet', 'Commande', 'Name', 'Type', 'Value', 'Unit'])
+    df['Value'] = pd.to_numeric(df['Value'], errors='coerce')
+
+    # Normalize the collect dates to the history format, falling back to the poll time
+    datetimes = pd.to_datetime(df['Datetime'], format=COLLECT_DATE_FORMAT, errors='coerce')
+    df['Datetime'] = datetimes.dt.strftime(COLLECT_DATE_FORMAT).fillna(when)
+    return df.dropna(subset=['Value'])
+
+
+class JeedomPoller:
+    """Read a set of commands on a schedule and store each round in the history table."""
+
+    def __init__(self, client, commands, db_path, interval=DEFAULT_INTERVAL):
+        """
+        Initialize the poller.
+
+        Args:
+            client (JeedomClient): Client to read the values with
+            commands (dict): Command id -> history columns, see load_commands
+            db_path (str): SQLite database holding the history table
+            interval (float): Seconds between the starts of two rounds
+        """
+        self.client = client
+        self.commands = commands
+        self.db_path = db_path
+        self.interval = interval
+
+    def poll_once(self, conn):
+        """
+        Read all commands and write them into history in one transaction.
+
+        Returns:
+            int: Number of history rows inserted or changed
+        """
+        start = time.perf_counter()
+        values = self.client.exec_cmds(self.commands)
+        df = to_history_frame(self.commands, values)
+        changed = write_history(conn, df)
+        print(f"Polled {len(values)} of {len(self.commands)} Jeedom commands in "
+              f"{time.perf_counter() - start:.2f}s, {changed} history row(s) written")
+        return changed
+
+    def run(self, rounds=None):
+        """
+        Poll until interrupted (or for a number of rounds).
+
+        A failed round is reported and the next one runs on schedule.
+        """
+        conn = connect(self.db_path)
+        try:
+            ensure_history_schema(conn, self.db_path)
+            done = 0
+            next_run = time.monotonic()
+            while rounds is None or done < rounds:
+                try:
+                    self.poll_once(conn)
+                except (requests.RequestException, JeedomError, ValueError) as e:
+                    print(f"Error polling Jeedom: {e}")
+                except sqlite3.Error as e:
+                    # e.g. database is locked: the next round writes again
+                    print(f"Error writing Jeedom values: {e}")
+                done += 1
+
+                next_run += self.interval
+                if rounds is None or done < rounds:
+                    time.sleep(max(0.0, next_run - time.monotonic()))
+        finally:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Poll Jeedom commands into the history table.')
+    parser.add_argument('--commands', type=str, help='JSON file of the commands to poll (see load_commands)')
+    parser.add_argument('--db', type=str, default=resolve_path(), help='SQLite database holding the history table')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='Seconds between two polling rounds')
+    parser.add_argument('--rounds', type=int, default=None, help='Stop after this many rounds (runs forever by default)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Command ids per request')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Requests running at the same time')
+    args = parser.parse_args()
+
+    if not args.commands:
+        # Minimal example
+        print(get_jeedom_data())
+        return 0
+
+    client = JeedomClient(batch_size=args.batch_size, concurrency=args.concurrency)
+    poller = JeedomPoller(client, load_commands(args.commands), args.db, args.interval)
+    try:
+        poller.run(args.rounds)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
 if __name__ == "__main__":
-    data = get_jeedom_data()
-    print(data)
+    sys.exit(main())
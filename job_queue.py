@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Local background job queue backed by SQLite.
+
+Routes submit jobs (a kind and JSON parameters) and return right away; a pool
+of worker processes claims them from the jobs table and runs the handler
+registered for their kind. A job reports its current stage, progress and the
+time spent in each stage while it runs, and its result (or error) when it
+ends. Submitting a job identical to one still queued or running returns the
+existing job instead of adding another.
+
+`python app.py` starts a pool of workers with the development server. Under
+`flask run` or a WSGI server, run the workers as their own process, next to
+the app and pointing to the same jobs database:
+
+Usage: python job_queue.py --workers 2 [--db data/jobs.db]
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import importlib
+import traceback
+import multiprocessing
+from contextlib import contextmanager
+
+# SQLite file holding the jobs
+DEFAULT_JOBS_DB = os.getenv('JOBS_DB', 'data/jobs.db')
+
+# Worker processes started by WorkerPool
+DEFAULT_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+
+# Seconds an idle worker waits before looking for a job again
+POLL_INTERVAL = 0.5
+
+# Days finished jobs are kept
+RETENTION_DAYS = 7
+
+# Module registering the handlers, imported by the workers
+DEFAULT_HANDLERS_MODULE = 'app_jobs'
+
+# Job statuses; a job is pending while queued or running
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+JOBS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        key TEXT NOT NULL,
+        params TEXT NOT NULL,
+        status TEXT NOT NULL,
+        stage TEXT,
+        progress REAL NOT NULL DEFAULT 0,
+        timings TEXT NOT NULL DEFAULT '{}',
+        result TEXT,
+        error TEXT,
+        worker INTEGER,
+        submitted_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL
+    )
+'''
+
+# At most one pending job per key, which is what coalesces duplicate submissions
+PENDING_KEY_INDEX_SQL = '''
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_pending_key ON jobs (key) WHERE status IN ('queued', 'running')
+'''
+
+# Handlers by job kind, see handler
+HANDLERS = {}
+
+
+class JobError(Exception):
+    """Raised by a handler to fail its job with a message meant for the user."""
+
+
+def handler(kind):
+    """
+    Register a function as the handler of a job kind.
+
+    The function is called with the Job and the job parameters as keyword
+    arguments; it returns the (JSON serializable) result of the job.
+    """
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+def job_key(kind, params):
+    """Key identifying identical jobs."""
+    return hashlib.sha256(json.dumps([kind, params], sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def connect(db_path):
+    """Open the jobs database, creating the table if needed."""
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(JOBS_TABLE_SQL)
+    conn.execute(PENDING_KEY_INDEX_SQL)
+    return conn
+
+
+@contextmanager
+def immediate(conn):
+    """Run the block in a write transaction taken up front."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _process_alive(pid):
+    """True if a process with this pid is running on this machine."""
+    if pid is None:
+        return False
+    if os.name == 'nt':
+        # os.kill would terminate the process on Windows; assume the worker stopped
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # Running under another user
+        return True
+    return True
+
+
+def _to_dict(row):
+    """Decode a jobs row."""
+    if row is None:
+        return None
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    job['timings'] = json.loads(job['timings'])
+    job['result'] = json.loads(job['result']) if job['result'] is not None else None
+    return job
+
+
+class JobQueue:
+    """Submit jobs and read their status."""
+
+    def __init__(self, db_path=DEFAULT_JOBS_DB):
+        """
+        Initialize the queue.
+
+        Args:
+            db_path (str): SQLite file holding the jobs
+        """
+        self.db_path = db_path
+        connect(db_path).close()
+
+    def submit(self, kind, **params):
+        """
+        Queue a job, or return the identical one still pending.
+
+        Returns:
+            tuple: (job id, True if the job was just queued)
+        """
+        key = job_key(kind, params)
+        conn = connect(self.db_path)
+        try:
+            with immediate(conn):
+                row = conn.execute("SELECT id FROM jobs WHERE key = ? AND status IN (?, ?)",
+                                   (key, QUEUED, RUNNING)).fetchone()
+                if row:
+                    return row['id'], False
+                cursor = conn.execute(
+                    "INSERT INTO jobs (kind, key, params, status, submitted_at) VALUES (?, ?, ?, ?, ?)",
+                    (kind, key, json.dumps(params, default=str), QUEUED, time.time()))
+                return cursor.lastrowid, True
+        finally:
+            conn.close()
+
+    def get(self, job_id):
+        """
+        Status of a job.
+
+        Returns:
+            dict: The job (params, status, stage, progress, timings, result, error
+            and times), or None if there is no such job
+        """
+        conn = connect(self.db_path)
+        try:
+            return _to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+        finally:
+            conn.close()
+
+    def find(self, kind, **params):
+        """Most recent job with these parameters, or None."""
+        conn = connect(self.db_path)
+        try:
+            return _to_dict(conn.execute("SELECT * FROM jobs WHERE key = ? ORDER BY id DESC LIMIT 1",
+                                         (job_key(kind, params),)).fetchone())
+        finally:
+            conn.close()
+
+    def requeue_interrupted(self):
+        """
+        Queue again the jobs left running by workers that stopped (call before starting workers).
+        
+        Jobs whose worker process is still alive (e.g. run by another pool on the
+        same database) are left alone.
+        """
+        conn = connect(self.db_path)
+        try:
+            with immediate(conn):
+                running = conn.execute("SELECT id, worker FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+                interrupted = [(row['id'],) for row in running if not _process_alive(row['worker'])]
+                conn.executemany("UPDATE jobs SET status = ?, worker = NULL WHERE id = ? AND status = ?",
+                                 [(QUEUED, job_id, RUNNING) for job_id, in interrupted])
+                return len(interrupted)
+        finally:
+            conn.close()
+
+    def prune(self, days=RETENTION_DAYS):
+        """Delete the jobs finished more than some days ago."""
+        conn = connect(self.db_path)
+        try:
+            with immediate(conn):
+                return conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                                    (DONE, FAILED, time.time() - days * 86400)).rowcount
+        finally:
+            conn.close()
+
+
+class Job:
+    """A claimed job, as seen by its handler."""
+
+    def __init__(self, conn, row):
+        self.conn = conn
+        self.id = row['id']
+        self.kind = row['kind']
+        self.params = json.loads(row['params'])
+        self.timings = {}
+
+    def _update(self, **columns):
+        assignments = ', '.join(f"{column} = ?" for column in columns)
+        self.conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*columns.values(), self.id))
+
+    def progress(self, fraction):
+        """Report the part of the job done, from 0 to 1."""
+        self._update(progress=min(max(fraction, 0.0), 1.0))
+
+    @contextmanager
+    def stage(self, name, progress=None):
+        """
+        Run a stage of the job.
+
+        The stage is reported while the block runs and its duration is added
+        to the job timings; progress is reported when the block ends.
+        """
+        self._update(stage=name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+            columns = {'timings': json.dumps(self.timings)}
+            if progress is not None:
+                columns['progress'] = progress
+            self._update(**columns)
+
+
+def claim(conn, worker):
+    """Mark the oldest queued job as running for a worker and return it, or None."""
+    with immediate(conn):
+        row = conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE jobs SET status = ?, worker = ?, started_at = ? WHERE id = ?",
+                     (RUNNING, worker, time.time(), row['id']))
+    return Job(conn, row)
+
+
+def run_job(job):
+    """Run a claimed job with its handler and store its result or error."""
+    started = time.perf_counter()
+    try:
+        function = HANDLERS.get(job.kind)
+        if function is None:
+            raise JobError(f"No handler for jobs of kind {job.kind}")
+        result = function(job, **job.params)
+        job._update(status=DONE, progress=1.0, stage=None, result=json.dumps(result, default=str),
+                    timings=json.dumps(job.timings), finished_at=time.time())
+    except Exception as e:
+        if not isinstance(e, JobError):
+            traceback.print_exc()
+        job._update(status=FAILED, error=str(e), timings=json.dumps(job.timings), finished_at=time.time())
+    print(f"Job {job.id} ({job.kind}) finished in {time.perf_counter() - started:.2f}s")
+
+
+def work(db_path, handlers_module=DEFAULT_HANDLERS_MODULE, stop=None, poll_interval=POLL_INTERVAL, max_jobs=None):
+    """
+    Run jobs until stopped (worker process main loop).
+
+    Args:
+        db_path (str): SQLite file holding the jobs
+        handlers_module (str): Module registering the handlers
+        stop (multiprocessing.Event): Set to stop after the current job
+        poll_interval (float): Seconds to wait when no job is queued
+        max_jobs (int): Stop after this many jobs
+    """
+    importlib.import_module(handlers_module)
+    conn = connect(db_path)
+    done = 0
+    try:
+        while (stop is None or not stop.is_set()) and (max_jobs is None or done < max_jobs):
+            job = claim(conn, os.getpid())
+            if job is None:
+                if stop is not None:
+                    stop.wait(poll_interval)
+                else:
+                    time.sleep(poll_interval)
+                continue
+            run_job(job)
+            done += 1
+    finally:
+        conn.close()
+
+
+class WorkerPool:
+    """Worker processes running the queued jobs."""
+
+    def __init__(self, db_path=DEFAULT_JOBS_DB, workers=DEFAULT_WORKERS, handlers_module=DEFAULT_HANDLERS_MODULE):
+        """
+        Initialize the pool.
+
+        Args:
+            db_path (str): SQLite file holding the jobs
+            workers (int): Worker processes
+            handlers_module (str): Module registering the handlers, imported by each worker
+        """
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self.handlers_module = handlers_module
+        # Use spawn so workers start from a clean interpreter with the Agg backend
+        self._context = multiprocessing.get_context('spawn')
+        self._stop = self._context.Event()
+        self._processes = []
+
+    def start(self):
+        """Start the workers, first queuing again the jobs a previous pool left running."""
+        queue = JobQueue(self.db_path)
+        queue.requeue_interrupted()
+        queue.prune()
+        for _ in range(self.workers):
+            # Not daemonic: jobs may start process pools of their own
+            process = self._context.Process(target=work, args=(self.db_path, self.handlers_module, self._stop),
+                                            name='job-worker')
+            process.start()
+            self._processes.append(process)
+        return self
+
+    def join(self):
+        """Wait for the workers to exit."""
+        for process in self._processes:
+            process.join()
+
+    def stop(self, timeout=None):
+        """Stop the workers once their current job is done."""
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout)
+        self._processes = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run background job workers.')
+    parser.add_argument('--db', type=str, default=DEFAULT_JOBS_DB, help='SQLite file holding the jobs')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Worker processes')
+    parser.add_argument('--handlers', type=str, default=DEFAULT_HANDLERS_MODULE, help='Module registering the handlers')
+    args = parser.parse_args()
+
+    pool = WorkerPool(args.db, args.workers, args.handlers).start()
+    print(f"{args.workers} job worker(s) running on {args.db}")
+    try:
+        pool.join()
+    except KeyboardInterrupt:
+        pool.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
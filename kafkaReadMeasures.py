@@ -1,34 +1,437 @@
+"""
+Consume measures from Kafka into SQLite.
+
+Messages are pulled in batches and each batch is written with one executemany
+in a single transaction on a long-lived WAL connection. Kafka offsets are
+committed only after the database commit, so delivery is at-least-once: after
+a crash the last batch may be written again, but never lost.
+
+consume_kafka_messages does this in one loop. MeasurePipeline splits it in two
+stages: the consumer thread polls and deserializes, and a writer thread group
+commits the batches it takes from a bounded queue. When the queue is full the
+partitions are paused instead of buffering more messages.
+"""
+
 from kafka import KafkaConsumer
-import sqlite3
+from kafka.structs import OffsetAndMetadata
+import os
 import json
+import time
+import queue
+import threading
+from data_access import connect
 
-DB_NAME = "SmartHome.db"
+try:
+    import orjson
+except ImportError:  # optional, faster JSON parser
+    orjson = None
+
+# Database of the measures table (SQLITE_DB or SmartHome.db if None, see data_access.resolve_path)
+DB_NAME = None
 KAFKA_BOOTSTRAP_SERVERS = "localhost:9092"
 KAFKA_TOPIC = "Measures"
+KAFKA_GROUP_ID = "smarthome-measures"
+
+# Messages returned by a single poll
+MAX_RECORDS = 500
+
+# Milliseconds a poll waits for messages
+POLL_TIMEOUT_MS = 1000
+
+# Batches waiting for the writer before the partitions are paused
+QUEUE_SIZE = 20
+
+# Rows the writer tries to gather from the queue into one transaction
+GROUP_COMMIT_ROWS = 5000
+
+# JSON parser of the messages: 'json', or 'orjson' when it is installed
+JSON_PARSER = os.getenv('KAFKA_JSON_PARSER', 'orjson' if orjson else 'json')
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+# Seconds between two metrics reports of the pipeline (0 to disable)
+METRICS_INTERVAL = 10
+
+MEASURES_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS measures (
+        id INTEGER PRIMARY KEY,
+        timestamp DATETIME NOT NULL,
+        value FLOAT NOT NULL
+    )
+'''
+
+INSERT_SQL = "INSERT INTO measures (timestamp, value) VALUES (?, ?)"
+
+
+def get_db_connection(db_name=DB_NAME):
+    """Open the long-lived connection used by the consumer (WAL, so readers are not blocked, see data_access.connect)."""
+    conn = connect(db_name)
+    conn.execute(MEASURES_TABLE_SQL)
+    conn.commit()
     return conn
 
-def consume_kafka_messages():
-    consumer = KafkaConsumer(
+
+def create_consumer():
+    """Create a consumer whose offsets are only committed explicitly."""
+    return KafkaConsumer(
         KAFKA_TOPIC,
         bootstrap_servers=[KAFKA_BOOTSTRAP_SERVERS],
-        value_deserializer=lambda m: json.loads(m.decode('utf-8'))
+        group_id=KAFKA_GROUP_ID,
+        enable_auto_commit=False,
+        auto_offset_reset='earliest'
     )
-    
-    for message in consumer:
-        data = message.value
-        # Example: data might look like {"timestamp": "...", "value": 123.45}
+
+
+def get_json_parser(name=JSON_PARSER):
+    """Return the loads function of a JSON parser ('json' or 'orjson')."""
+    if name == 'orjson':
+        if orjson is None:
+            raise ValueError("orjson is not installed")
+        return orjson.loads
+    if name == 'json':
+        return json.loads
+    raise ValueError(f"Unknown JSON parser: {name}")
+
+
+def decode_message(raw, loads=json.loads):
+    """
+    Turn a message value into a measures row.
+
+    Messages look like {"timestamp": "...", "value": 123.45}.
+
+    Args:
+        raw (bytes): Message value
+        loads: JSON parser, see get_json_parser
+
+    Returns:
+        tuple: (timestamp, value), or None if the message is not a valid measure
+    """
+    try:
+        data = loads(raw)
         timestamp = data.get("timestamp")
         value = data.get("value")
+    except (ValueError, TypeError, AttributeError):
+        return None
+    if timestamp is None or value is None:
+        return None
+    return timestamp, value
+
+
+def write_batch(conn, rows):
+    """Insert rows in a single transaction."""
+    with conn:
+        conn.executemany(INSERT_SQL, rows)
+
+
+def consume_kafka_messages(consumer=None, conn=None, max_records=MAX_RECORDS, max_batches=None):
+    """
+    Consume measures until interrupted (or for a number of batches).
+
+    Args:
+        consumer: KafkaConsumer (created with create_consumer if None)
+        conn (sqlite3.Connection): Connection (opened with get_db_connection if None)
+        max_records (int): Messages per poll
+        max_batches (int): Stop after this many non-empty batches
+
+    Returns:
+        dict: Counts of 'messages', 'rows', 'skipped' and 'batches'
+    """
+    consumer = consumer or create_consumer()
+    conn = conn or get_db_connection()
+    stats = {'messages': 0, 'rows': 0, 'skipped': 0, 'batches': 0}
+
+    while max_batches is None or stats['batches'] < max_batches:
+        records = consumer.poll(timeout_ms=POLL_TIMEOUT_MS, max_records=max_records)
+        if not records:
+            continue
+
+        rows = []
+        for messages in records.values():
+            for message in messages:
+                row = decode_message(message.value)
+                if row is None:
+                    stats['skipped'] += 1
+                else:
+                    rows.append(row)
+
+        write_batch(conn, rows)
+        # Only acknowledge the messages once they are safely in the database
+        consumer.commit()
+
+        stats['messages'] += sum(len(messages) for messages in records.values())
+        stats['rows'] += len(rows)
+        stats['batches'] += 1
+
+    return stats
+
+
+def _offset_and_metadata(offset):
+    """Build the value committed for a partition (kafka-python 2.x has no leader_epoch)."""
+    if 'leader_epoch' in OffsetAndMetadata._fields:
+        return OffsetAndMetadata(offset, None, -1)
+    return OffsetAndMetadata(offset, None)
+
+
+class PipelineMetrics:
+    """Counters of a MeasurePipeline, read with snapshot()."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.polled = 0
+        self.skipped = 0
+        self.written = 0
+        self.transactions = 0
+        self.pauses = 0
+        self.batch_latency_last = 0.0
+        self.batch_latency_max = 0.0
+        self.batch_latency_total = 0.0
+        self.batches = 0
+        self.started = time.monotonic()
+
+    def record_write(self, rows, batches, latency):
+        """Record a group commit of rows from batches, latency being the age of its oldest batch."""
+        with self.lock:
+            self.written += rows
+            self.transactions += 1
+            self.batches += batches
+            self.batch_latency_last = latency
+            self.batch_latency_max = max(self.batch_latency_max, latency)
+            self.batch_latency_total += latency * batches
+
+    def snapshot(self, queue_depth=0, kafka_lag=None):
+        """
+        Return the current metrics.
+
+        lag is the number of valid messages polled but not yet in the database,
+        kafka_lag the messages still on the broker (when the consumer knows it).
+        """
+        with self.lock:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            return {
+                'queue_depth': queue_depth,
+                'lag': self.polled - self.skipped - self.written,
+                'kafka_lag': kafka_lag,
+                'polled': self.polled,
+                'skipped': self.skipped,
+                'written': self.written,
+                'transactions': self.transactions,
+                'pauses': self.pauses,
+                'batch_latency_last_ms': self.batch_latency_last * 1000,
+                'batch_latency_avg_ms': self.batch_latency_total / self.batches * 1000 if self.batches else 0.0,
+                'batch_latency_max_ms': self.batch_latency_max * 1000,
+                'rows_per_sec': self.written / elapsed,
+            }
+
+
+class _Batch:
+    """Decoded rows of one poll, with the offsets to commit once they are written."""
+
+    __slots__ = ('rows', 'offsets', 'polled_at')
+
+    def __init__(self, rows, offsets, polled_at):
+        self.rows = rows
+        self.offsets = offsets
+        self.polled_at = polled_at
+
+
+_STOP = object()
+
+
+class MeasurePipeline:
+    """
+    Two-stage consumer: poll + deserialize, then group commits on a writer thread.
+
+    The consumer thread (the one calling run) owns the KafkaConsumer: it polls,
+    decodes and queues batches, and commits the offsets the writer reports as
+    written. The writer owns the SQLite connection and merges the queued batches
+    into transactions of up to group_rows rows.
+    """
+
+    def __init__(self, consumer=None, db_name=DB_NAME, max_records=MAX_RECORDS, queue_size=QUEUE_SIZE,
+                 group_rows=GROUP_COMMIT_ROWS, parser=JSON_PARSER, metrics_interval=METRICS_INTERVAL):
+        """
+        Initialize the pipeline.
+
+        Args:
+            consumer: KafkaConsumer (created with create_consumer if None)
+            db_name (str): SQLite database, opened by the writer thread
+            max_records (int): Messages per poll
+            queue_size (int): Batches waiting for the writer before partitions are paused
+            group_rows (int): Rows gathered into one transaction
+            parser (str): JSON parser, 'json' or 'orjson'
+            metrics_interval (float): Seconds between metrics reports (0 to disable)
+        """
+        self.consumer = consumer or create_consumer()
+        self.db_name = db_name
+        self.max_records = max_records
+        self.group_rows = group_rows
+        self.loads = get_json_parser(parser)
+        self.metrics_interval = metrics_interval
+        self.metrics = PipelineMetrics()
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._written = queue.SimpleQueue()   # offsets written by the writer, to commit
+        self._stop = threading.Event()
+        self._error = None
+        self._writer = None
+
+    def stop(self):
+        """Ask run() to finish: queued batches are written and their offsets committed."""
+        self._stop.set()
+
+    def kafka_lag(self):
+        """Messages still on the broker for the assigned partitions, or None if unknown."""
+        try:
+            lag = 0
+            for tp in self.consumer.assignment():
+                highwater = self.consumer.highwater(tp)
+                if highwater is None:
+                    return None
+                lag += highwater - self.consumer.position(tp)
+            return lag
+        except Exception:
+            return None
+
+    def snapshot(self):
+        """Return the pipeline metrics (queue depth, lag, batch latency...)."""
+        return self.metrics.snapshot(self.queue.qsize(), self.kafka_lag())
+
+    def _decode(self, records):
+        """Turn the records of a poll into a batch."""
+        rows = []
+        offsets = {}
+        count = 0
+        for tp, messages in records.items():
+            for message in messages:
+                row = decode_message(message.value, self.loads)
+                if row is not None:
+                    rows.append(row)
+            count += len(messages)
+            offsets[tp] = messages[-1].offset + 1
+
+        with self.metrics.lock:
+            self.metrics.polled += count
+            self.metrics.skipped += count - len(rows)
+        return _Batch(rows, offsets, time.monotonic())
+
+    def _write_loop(self):
+        """Writer thread: take batches from the queue and group commit them."""
+        conn = get_db_connection(self.db_name)
+        try:
+            stopping = False
+            while not stopping:
+                item = self.queue.get()
+                if item is _STOP:
+                    break
+
+                group = [item]
+                rows = len(item.rows)
+                while rows < self.group_rows:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    group.append(item)
+                    rows += len(item.rows)
+
+                with conn:
+                    conn.executemany(INSERT_SQL, (row for batch in group for row in batch.rows))
+
+                offsets = {}
+                for batch in group:
+                    offsets.update(batch.offsets)
+                self._written.put(offsets)
+                self.metrics.record_write(rows, len(group), time.monotonic() - group[0].polled_at)
+        except Exception as e:
+            self._error = e
+            self._stop.set()
+        finally:
+            conn.close()
+
+    def _commit_written(self):
+        """Commit the offsets of the batches the writer has stored."""
+        offsets = {}
+        while True:
+            try:
+                offsets.update(self._written.get_nowait())
+            except queue.Empty:
+                break
+        if offsets:
+            self.consumer.commit({tp: _offset_and_metadata(offset) for tp, offset in offsets.items()})
+
+    def run(self, max_batches=None):
+        """
+        Consume until stop() is called (or for a number of polled batches).
+
+        Returns:
+            dict: Final metrics
+        """
+        self._writer = threading.Thread(target=self._write_loop, name='measure-writer', daemon=True)
+        self._writer.start()
+
+        pending = None
+        paused = set()
+        batches = 0
+        next_report = time.monotonic() + self.metrics_interval
+
+        try:
+            while not self._stop.is_set() and (max_batches is None or batches < max_batches or pending):
+                self._commit_written()
+
+                if self.metrics_interval and time.monotonic() >= next_report:
+                    print(f"Kafka pipeline: {self.snapshot()}")
+                    next_report = time.monotonic() + self.metrics_interval
+
+                if pending is None:
+                    records = self.consumer.poll(timeout_ms=POLL_TIMEOUT_MS, max_records=self.max_records)
+                    if not records:
+                        continue
+                    pending = self._decode(records)
+                    batches += 1
+
+                try:
+                    self.queue.put(pending, timeout=0.1)
+                    pending = None
+                    if paused:
+                        self.consumer.resume(*paused)
+                        paused = set()
+                except queue.Full:
+                    # The writer is behind: stop fetching instead of buffering more
+                    if not paused:
+                        paused = set(self.consumer.assignment())
+                        self.consumer.pause(*paused)
+                        with self.metrics.lock:
+                            self.metrics.pauses += 1
+                    # Polling paused partitions keeps the consumer in its group without fetching
+                    records = self.consumer.poll(timeout_ms=0)
+                    if records:
+                        # Partitions assigned after the pause: keep their messages with the pending batch
+                        extra = self._decode(records)
+                        pending.rows.extend(extra.rows)
+                        pending.offsets.update(extra.offsets)
+        finally:
+            # The writer drains the queue before stopping, unless it died on an error
+            while self._writer.is_alive():
+                try:
+                    self.queue.put(_STOP, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            self._writer.join()
+            self._commit_written()
+            if paused:
+                self.consumer.resume(*paused)
+
+        if self._error is not None:
+            raise self._error
+        return self.snapshot()
 
-        # Store into SQLite
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("INSERT INTO measures (timestamp, value) VALUES (?, ?)", (timestamp, value))
-        conn.commit()
-        conn.close()
 
 if __name__ == "__main__":
-    consume_kafka_messages()
+    pipeline = MeasurePipeline()
+    try:
+        pipeline.run()
+    except KeyboardInterrupt:
+        pipeline.stop()
+    print(f"Kafka pipeline: {pipeline.snapshot()}")
@@ -0,0 +1,53 @@
+"""add time series indexes
+
+Revision ID: 3f6a9c1d2b7e
+Revises: 8dbc212428bd
+Create Date: 2026-10-17 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a9c1d2b7e'
+down_revision = '8dbc212428bd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('measure', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_measure_timestamp'), ['timestamp'], unique=False)
+
+    # The history table is created outside of the ORM (see history_schema.py),
+    # so only touch it if it lives in this database
+    inspector = sa.inspect(op.get_bind())
+    if 'history' not in inspector.get_table_names():
+        return
+
+    columns = [column['name'] for column in inspector.get_columns('history')]
+    if 'Timestamp' not in columns:
+        op.add_column('history', sa.Column('Timestamp', sa.Integer(), nullable=True))
+
+    # Store Datetime as integer epoch seconds in the Timestamp column (queries keep
+    # filtering and sorting on the indexed Datetime, see HISTORY_INDEXES in history_schema.py)
+    op.execute(
+        "UPDATE history SET Timestamp = CAST(strftime('%s', Datetime) AS INTEGER) "
+        "WHERE Timestamp IS NULL OR Timestamp = 0"
+    )
+
+    existing = [index['name'] for index in inspector.get_indexes('history')]
+    if 'ix_history_bat_type_datetime' not in existing:
+        op.create_index('ix_history_bat_type_datetime', 'history', ['BAT', 'Type', 'Datetime'], unique=False)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'history' in inspector.get_table_names():
+        existing = [index['name'] for index in inspector.get_indexes('history')]
+        if 'ix_history_bat_type_datetime' in existing:
+            op.drop_index('ix_history_bat_type_datetime', table_name='history')
+
+    with op.batch_alter_table('measure', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_measure_timestamp'))
@@ -0,0 +1,47 @@
+"""unique history key
+
+Revision ID: c42e8b5a1f93
+Revises: 3f6a9c1d2b7e
+Create Date: 2026-10-17 10:03:27.540981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c42e8b5a1f93'
+down_revision = '3f6a9c1d2b7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The history table is created outside of the ORM (see history_schema.py),
+    # so only touch it if it lives in this database
+    inspector = sa.inspect(op.get_bind())
+    if 'history' not in inspector.get_table_names():
+        return
+
+    existing = [index['name'] for index in inspector.get_indexes('history')]
+    if 'ix_history_bat_type_datetime' in existing:
+        op.drop_index('ix_history_bat_type_datetime', table_name='history')
+
+    if 'ux_history_bat_type_datetime' not in existing:
+        # Keep only the latest row for each key so the unique index can be built
+        op.execute(
+            "DELETE FROM history WHERE id NOT IN "
+            "(SELECT MAX(id) FROM history GROUP BY BAT, Type, Datetime)"
+        )
+        op.create_index('ux_history_bat_type_datetime', 'history', ['BAT', 'Type', 'Datetime'], unique=True)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'history' not in inspector.get_table_names():
+        return
+
+    existing = [index['name'] for index in inspector.get_indexes('history')]
+    if 'ux_history_bat_type_datetime' in existing:
+        op.drop_index('ux_history_bat_type_datetime', table_name='history')
+    op.create_index('ix_history_bat_type_datetime', 'history', ['BAT', 'Type', 'Datetime'], unique=False)
@@ -2,21 +2,27 @@
 
 
 import os
-import sys
 import glob
+import argparse
 from csv_processor import CSVProcessor
 import traceback
 
 def main():
-    # Check if any arguments were provided
-    if len(sys.argv) < 2:
-        print("Usage: python process_csv_cli.py [csv_file1] [csv_file2] ... [csv_fileN]")
-        print("Example: python process_csv_cli.py uploads/Export_Data_Val*.csv uploads/Export_AIH*.csv")
-        return
+    parser = argparse.ArgumentParser(
+        description='Clean, summarize and visualize CSV exports.',
+        epilog='Example: python process_csv_cli.py uploads/Export_Data_Val*.csv uploads/Export_AIH*.csv')
+    parser.add_argument('patterns', nargs='+', metavar='csv_file',
+                        help='CSV files to process (glob patterns are supported)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes (one file per worker, defaults to 1)')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='Stream files in chunks of this many rows instead of loading them whole')
+    
+    args = parser.parse_args()
     
     # Collect all CSV files from the arguments (supporting glob patterns)
     csv_files = []
-    for pattern in sys.argv[1:]:
+    for pattern in args.patterns:
         matched_files = glob.glob(pattern)
         if matched_files:
             csv_files.extend(matched_files)
@@ -38,7 +44,7 @@ def main():
     # Process the CSV files
     try:
         processor = CSVProcessor(csv_files)
-        cleaned_data = processor.process_all(output_dir)
+        cleaned_data = processor.process_all(output_dir, chunksize=args.chunksize, workers=args.workers)
         
         print("\nProcessing complete!")
         print(f"Visualizations saved to: {os.path.abspath(output_dir)}")
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import hashlib
+import pandas as pd
+
+# Name of the manifest written next to the cached outputs
+MANIFEST_NAME = '.render_cache.json'
+
+# Disk budget for cached outputs, in bytes (least recently used plots are evicted beyond it)
+DEFAULT_MAX_BYTES = int(os.getenv('RENDER_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+
+# Bump when the plotting code changes so existing outputs are re-rendered
+CACHE_VERSION = 2
+
+
+class RenderCache:
+    """
+    Content-hash cache for rendered visualizations.
+
+    Each plot is identified by its output stem (e.g. 'static/visualizations/Tours_wind')
+    and stored with a key hashing its input data and plot parameters. A plot whose
+    key has not changed and whose files are still on disk does not need re-rendering.
+    """
+
+    def __init__(self, output_dir, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Initialize the cache for an output directory.
+
+        Args:
+            output_dir (str): Directory holding the rendered files and the manifest
+            max_bytes (int): Disk budget for the files tracked by the manifest
+        """
+        self.output_dir = output_dir
+        self.max_bytes = max_bytes
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        self.entries = self._load()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        """Load the manifest, starting empty if it is missing or unreadable."""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def make_key(data, **params):
+        """
+        Hash a data slice and the plot parameters into a cache key.
+
+        Args:
+            data (pandas.DataFrame or None): Data the plot is drawn from
+            **params: Plot parameters (title, columns, date range...)
+
+        Returns:
+            str: Hex digest
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps({'version': CACHE_VERSION, **params}, sort_keys=True, default=str).encode('utf-8'))
+        if data is not None:
+            digest.update(json.dumps([str(col) for col in data.columns]).encode('utf-8'))
+            digest.update(json.dumps([str(dtype) for dtype in data.dtypes]).encode('utf-8'))
+            digest.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+        return digest.hexdigest()
+
+    def is_fresh(self, stem, key):
+        """Return True if the plot for this stem was rendered from the same key and its files still exist."""
+        entry = self.entries.get(stem)
+        if entry and entry['key'] == key and all(os.path.exists(path) for path in entry['files']):
+            entry['last_used'] = time.time()
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+    def store(self, stem, key, files):
+        """Record that a plot was rendered into the given files."""
+        self.entries[stem] = {
+            'key': key,
+            'files': list(files),
+            'size': sum(os.path.getsize(path) for path in files if os.path.exists(path)),
+            'last_used': time.time()
+        }
+
+    def _evict(self):
+        """Delete the least recently used plots until the budget is met."""
+        total = sum(entry['size'] for entry in self.entries.values())
+        for stem, entry in sorted(self.entries.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            for path in entry['files']:
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= entry['size']
+            del self.entries[stem]
+            print(f"Evicted cached visualization {os.path.basename(stem)}")
+
+    def save(self):
+        """Evict over budget and write the manifest."""
+        # Merge with entries written meanwhile by other processes using the same directory;
+        # an entry lost to a race only means that plot is rendered again next time
+        on_disk = self._load()
+        on_disk.update(self.entries)
+        self.entries = on_disk
+
+        self._evict()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.manifest_path)
+
+        print(f"Render cache: {self.hits} hit(s), {self.misses} miss(es)")
@@ -0,0 +1,45 @@
+"""
+Registry of the sites (BAT) weather data is fetched for.
+
+Sites are read from a JSON file mapping each name to its coordinates:
+
+    {"Tours": {"latitude": 47.3941, "longitude": 0.6848}, ...}
+
+The file defaults to sites.json next to this module and can be replaced with
+the SITES_FILE environment variable.
+"""
+
+import os
+import json
+
+# JSON file of the registry
+DEFAULT_SITES_PATH = os.getenv('SITES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sites.json'))
+
+# Registries already read by this process, by absolute path
+_loaded = {}
+
+
+def load_sites(path=None):
+    """
+    Load a site registry.
+
+    Args:
+        path (str): JSON file to read, DEFAULT_SITES_PATH if None
+
+    Returns:
+        dict: Site name -> {'latitude': float, 'longitude': float}
+    """
+    path = os.path.abspath(path or DEFAULT_SITES_PATH)
+    if path not in _loaded:
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+
+        sites = {}
+        for name, site in raw.items():
+            try:
+                sites[name] = {'latitude': float(site['latitude']), 'longitude': float(site['longitude'])}
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f"Invalid coordinates for site '{name}' in {path}")
+        _loaded[path] = sites
+
+    return _loaded[path]
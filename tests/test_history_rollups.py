@@ -0,0 +1,83 @@
+"""
+The rollups kept up to date by write_history (update_rollups) must match a full
+rebuild_rollups of the history, whatever the spelling of the written Datetimes.
+"""
+
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from history_rollups import ROLLUP_TABLES, HOURLY_FORMAT, rebuild_rollups
+from history_schema import ensure_history_schema, write_history
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'history.db')
+    ensure_history_schema(conn)
+    yield conn
+    conn.close()
+
+
+def rollups(conn):
+    """Every rollup table, ordered by key."""
+    return {table: pd.read_sql_query(f"SELECT * FROM {table} ORDER BY BAT, Type, Period", conn)
+            for table in ROLLUP_TABLES}
+
+
+def assert_matches_rebuild(conn):
+    incremental = rollups(conn)
+    with conn:
+        rebuild_rollups(conn.cursor())
+    rebuilt = rollups(conn)
+    for table in ROLLUP_TABLES:
+        assert_frame_equal(incremental[table], rebuilt[table], check_exact=False)
+
+
+def batch(datetimes, seed, bat='Tours', type_='DEVICE_OVEN'):
+    values = np.random.default_rng(seed).uniform(0, 5, len(datetimes)).round(2)
+    return pd.DataFrame({'BAT': bat, 'Datetime': datetimes, 'Type': type_, 'Value': values})
+
+
+def test_incremental_matches_rebuild(conn):
+    # Overlapping batches over two days, the last one changing values already written
+    write_history(conn, batch(pd.date_range('2024-01-01 22:00', periods=20, freq='15min')
+                              .strftime(HOURLY_FORMAT), seed=1))
+    write_history(conn, batch(pd.date_range('2024-01-02 01:30', periods=10, freq='20min')
+                              .strftime(HOURLY_FORMAT), seed=2))
+    write_history(conn, batch(['2024-01-01 23:00:00', '2024-01-02 02:10:00'], seed=3))
+    write_history(conn, batch(['2024-01-02 02:00:00'], seed=4, type_='DEVICE_TV'))
+
+    assert_matches_rebuild(conn)
+
+
+def test_datetime_spellings(conn):
+    write_history(conn, batch(['2024-01-01', '2024-01-01T05:30:00', '2024-01-01 05:45:00.500',
+                               '2024-01-02T00:15:00'], seed=5))
+    # The same instants spelled differently update the rows instead of adding new ones
+    write_history(conn, batch(['2024-01-01 00:00:00', '2024-01-01 05:30:00'], seed=6))
+
+    stored = [row[0] for row in conn.execute("SELECT Datetime FROM history ORDER BY Datetime")]
+    assert stored == ['2024-01-01 00:00:00', '2024-01-01 05:30:00', '2024-01-01 05:45:00', '2024-01-02 00:15:00']
+    assert_matches_rebuild(conn)
+
+    periods = pd.read_sql_query("SELECT Period FROM history_hourly", conn)['Period']
+    assert pd.to_datetime(periods, format=HOURLY_FORMAT).notna().all()
+
+
+def test_rows_written_by_older_code(conn):
+    # Date-only and T-separated Datetimes stored as is before write_history normalized them
+    with conn:
+        conn.executemany("INSERT INTO history (BAT, Datetime, Type, Value) VALUES (?, ?, ?, ?)", [
+            ('Tours', '2024-01-01', 'DEVICE_OVEN', 1.0),
+            ('Tours', '2024-01-01T05:10:00', 'DEVICE_OVEN', 2.0),
+        ])
+        rebuild_rollups(conn.cursor())
+
+    write_history(conn, batch(['2024-01-01 00:30:00', '2024-01-01 05:20:00'], seed=7))
+
+    assert_matches_rebuild(conn)
+    hourly = rollups(conn)['history_hourly'].set_index('Period')
+    assert hourly.loc['2024-01-01 00:00:00', 'Count'] == 2
+    assert hourly.loc['2024-01-01 05:00:00', 'Count'] == 2
@@ -0,0 +1,117 @@
+"""
+JeedomClient and JeedomPoller against a local fake of the jeeApi JSON-RPC endpoint.
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import pytest
+import jeedomConnector
+from jeedomConnector import JeedomClient, JeedomPoller, JeedomError, to_history_frame
+
+COMMANDS = {
+    '11': {'BAT': 'Tours', 'Type': 'ELECTRICITY', 'Name': 'Compteur', 'Unit': 'kWh'},
+    '12': {'BAT': 'Tours', 'Type': 'INDOOR_TEMP', 'Name': 'Salon', 'Unit': '°C'},
+    '13': {'BAT': 'Tours', 'Type': 'DEVICE_OVEN', 'Name': 'Four', 'Unit': 'kWh'},
+}
+
+READINGS = {
+    11: {'value': '1520.5', 'collectDate': '2024-03-01 10:15:00'},
+    12: {'value': 19.5, 'collectDate': '2024-03-01 10:14:30'},
+    13: {'value': 0.8, 'collectDate': ''},
+}
+
+
+class JeeApiStub(BaseHTTPRequestHandler):
+    """Answer cmd::execCmd from READINGS like a Jeedom box, recording the ids of each call."""
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        request = json.loads(form['request'][0])
+        ids = request['params']['id']
+        self.server.calls.append((request['method'], ids, request['params']['apikey']))
+
+        if request['params']['apikey'] != 'secret':
+            answer = {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -32001, 'message': 'Accès non autorisé'}}
+        elif len(ids) == 1:
+            # A single id is answered with its reading alone
+            answer = {'jsonrpc': '2.0', 'id': request['id'], 'result': READINGS[ids[0]]}
+        else:
+            answer = {'jsonrpc': '2.0', 'id': request['id'],
+                      'result': {str(cmd_id): READINGS[cmd_id] for cmd_id in ids if cmd_id in READINGS}}
+
+        body = json.dumps(answer).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), JeeApiStub)
+    server.calls = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def client(stub, **kwargs):
+    return JeedomClient(url=f"http://127.0.0.1:{stub.server_port}/", api_key=kwargs.pop('api_key', 'secret'), **kwargs)
+
+
+def test_exec_cmds_batches_ids(stub):
+    values = client(stub, batch_size=2).exec_cmds(COMMANDS)
+
+    assert sorted(ids for _, ids, _ in stub.calls) == [[11, 12], [13]]
+    assert {method for method, _, _ in stub.calls} == {'cmd::execCmd'}
+    assert values == {
+        '11': {'value': '1520.5', 'collectDate': '2024-03-01 10:15:00'},
+        '12': {'value': 19.5, 'collectDate': '2024-03-01 10:14:30'},
+        '13': {'value': 0.8, 'collectDate': None},
+    }
+
+
+def test_api_error(stub):
+    with pytest.raises(JeedomError, match='Accès non autorisé'):
+        client(stub, api_key='wrong').exec_cmds(COMMANDS)
+
+
+def test_history_frame_uses_collect_dates(stub):
+    values = client(stub).exec_cmds(COMMANDS)
+    df = to_history_frame(COMMANDS, values, when=datetime(2024, 3, 1, 10, 16)).set_index('Type')
+
+    assert df.loc['ELECTRICITY', 'Value'] == 1520.5
+    assert df.loc['ELECTRICITY', 'Datetime'] == '2024-03-01 10:15:00'
+    assert df.loc['INDOOR_TEMP', 'Datetime'] == '2024-03-01 10:14:30'
+    # No collectDate: dated with the poll time
+    assert df.loc['DEVICE_OVEN', 'Datetime'] == '2024-03-01 10:16:00'
+
+
+def test_poller_survives_sqlite_errors(stub, tmp_path, monkeypatch, capsys):
+    db_path = str(tmp_path / 'history.db')
+    write_history = jeedomConnector.write_history
+    rounds = []
+
+    def locked_once(conn, df):
+        rounds.append(len(df))
+        if len(rounds) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        return write_history(conn, df)
+
+    monkeypatch.setattr(jeedomConnector, 'write_history', locked_once)
+    JeedomPoller(client(stub), COMMANDS, db_path, interval=0).run(rounds=2)
+
+    assert rounds == [3, 3]
+    assert 'Error writing Jeedom values: database is locked' in capsys.readouterr().out
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM history WHERE BAT = 'Tours'").fetchone()[0] == 3
@@ -0,0 +1,98 @@
+"""
+JobQueue on a temporary database: identical pending jobs are coalesced and only
+the jobs of workers that stopped are requeued.
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import pytest
+import job_queue
+from job_queue import JobQueue, JobError, connect, claim, handler, work, QUEUED, RUNNING, DONE, FAILED
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.db'))
+
+
+@pytest.fixture
+def conn(queue):
+    conn = connect(queue.db_path)
+    yield conn
+    conn.close()
+
+
+def dead_pid():
+    """Pid of a process that has exited."""
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_duplicate_submit_returns_pending_job(queue, conn):
+    job_id, created = queue.submit('render', ville_name='Tours', days=7)
+    assert created
+
+    # Same parameters in another order: same job, while queued and while running
+    assert queue.submit('render', days=7, ville_name='Tours') == (job_id, False)
+    claim(conn, os.getpid())
+    assert queue.submit('render', ville_name='Tours', days=7) == (job_id, False)
+
+    # Other parameters or another kind: another job
+    assert queue.submit('render', ville_name='Tours', days=30)[1]
+    assert queue.submit('import', ville_name='Tours', days=7)[1]
+
+
+def test_finished_job_is_submitted_again(queue, conn):
+    job_id, _ = queue.submit('render', ville_name='Tours')
+    conn.execute("UPDATE jobs SET status = ? WHERE id = ?", (DONE, job_id))
+
+    new_id, created = queue.submit('render', ville_name='Tours')
+    assert created and new_id != job_id
+
+
+def test_pending_key_is_unique(queue, conn):
+    job_id, _ = queue.submit('render', ville_name='Tours')
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO jobs (kind, key, params, status, submitted_at) "
+                     "SELECT kind, key, params, ?, submitted_at FROM jobs WHERE id = ?", (QUEUED, job_id))
+
+
+def test_requeue_only_jobs_of_stopped_workers(queue, conn):
+    live_id, _ = queue.submit('render', ville_name='Tours')
+    dead_id, _ = queue.submit('render', ville_name='Lyon')
+    orphan_id, _ = queue.submit('render', ville_name='Paris')
+    claim(conn, os.getpid())
+    claim(conn, dead_pid())
+    claim(conn, None)
+
+    assert queue.requeue_interrupted() == 2
+
+    assert queue.get(live_id)['status'] == RUNNING
+    assert queue.get(live_id)['worker'] == os.getpid()
+    for job_id in (dead_id, orphan_id):
+        assert queue.get(job_id)['status'] == QUEUED
+        assert queue.get(job_id)['worker'] is None
+
+
+@handler('test_echo')
+def echo(job, value):
+    with job.stage('echo', progress=0.5):
+        if value is None:
+            raise JobError('No value')
+    return {'value': value}
+
+
+def test_work_runs_jobs(queue):
+    done_id, _ = queue.submit('test_echo', value=3)
+    failed_id, _ = queue.submit('test_echo', value=None)
+
+    work(queue.db_path, handlers_module=job_queue.__name__, max_jobs=2)
+
+    done = queue.get(done_id)
+    assert (done['status'], done['result'], done['progress']) == (DONE, {'value': 3}, 1.0)
+    assert set(done['timings']) == {'echo'}
+    failed = queue.get(failed_id)
+    assert (failed['status'], failed['error']) == (FAILED, 'No value')
@@ -0,0 +1,116 @@
+"""
+WeatherArchive against a local stub of the Open-Meteo archive: days already
+cached are served from DailyWeatherCache and only the missing ranges are fetched.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pytest
+from weather_archive import WeatherArchive, DailyWeatherCache, DAILY_VARIABLES, COLUMNS, date_range
+
+
+def day_values(latitude, day):
+    """Values the stub answers for a location and a day, one per DAILY_VARIABLES."""
+    return [round(float(latitude) + int(day[-2:]) + i / 10, 1) for i in range(len(DAILY_VARIABLES))]
+
+
+class ArchiveStub(BaseHTTPRequestHandler):
+    """Answer archive requests with day_values, recording (locations, start_date, end_date)."""
+
+    def do_GET(self):
+        params = {name: values[0] for name, values in parse_qs(urlparse(self.path).query).items()}
+        latitudes = params['latitude'].split(',')
+        longitudes = params['longitude'].split(',')
+        self.server.calls.append((list(zip(latitudes, longitudes)), params['start_date'], params['end_date']))
+
+        days = date_range(params['start_date'], params['end_date'])
+        responses = [{
+            'latitude': float(latitude),
+            'longitude': float(longitude),
+            'daily': {'time': days, **{variable: [day_values(latitude, day)[i] for day in days]
+                                       for i, variable in enumerate(DAILY_VARIABLES)}},
+        } for latitude, longitude in zip(latitudes, longitudes)]
+
+        body = json.dumps(responses if len(responses) > 1 else responses[0]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ArchiveStub)
+    server.calls = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def archive(stub, tmp_path):
+    return WeatherArchive(cache=DailyWeatherCache(str(tmp_path / 'cache.db')),
+                          url=f"http://127.0.0.1:{stub.server_port}/v1/archive", retries=0, backoff=0)
+
+
+# Tours and the latitude of its grid cell, the one sent to the archive
+TOURS = (47.39, 0.69)
+TOURS_CELL_LATITUDE = 47.4
+
+
+def expected(latitude, start_date, end_date):
+    return [(day, *day_values(latitude, day)) for day in date_range(start_date, end_date)]
+
+
+def test_second_read_is_served_from_cache(archive, stub):
+    rows = archive.daily(*TOURS, '2024-01-01', '2024-01-10')
+    assert rows == expected(TOURS_CELL_LATITUDE, '2024-01-01', '2024-01-10')
+    assert len(rows[0]) == len(COLUMNS) + 1
+    assert (archive.cache.hits, archive.cache.misses, len(stub.calls)) == (0, 10, 1)
+
+    assert archive.daily(*TOURS, '2024-01-01', '2024-01-10') == rows
+    assert (archive.cache.hits, archive.cache.misses, len(stub.calls)) == (10, 10, 1)
+
+
+def test_only_missing_ranges_are_fetched(archive, stub):
+    archive.daily(*TOURS, '2024-01-05', '2024-01-10')
+    stub.calls.clear()
+
+    rows = archive.daily(*TOURS, '2024-01-01', '2024-01-20')
+
+    assert rows == expected(TOURS_CELL_LATITUDE, '2024-01-01', '2024-01-20')
+    assert sorted((start, end) for _, start, end in stub.calls) == [
+        ('2024-01-01', '2024-01-04'), ('2024-01-11', '2024-01-20')]
+    assert (archive.cache.hits, archive.cache.misses) == (6, 6 + 14)
+
+
+def test_long_ranges_are_split_into_chunks(archive, stub):
+    archive.chunk_days = 7
+    rows = archive.daily(*TOURS, '2024-01-01', '2024-01-20')
+
+    assert rows == expected(TOURS_CELL_LATITUDE, '2024-01-01', '2024-01-20')
+    assert sorted((start, end) for _, start, end in stub.calls) == [
+        ('2024-01-01', '2024-01-07'), ('2024-01-08', '2024-01-14'), ('2024-01-15', '2024-01-20')]
+
+
+def test_sites_share_requests(archive, stub):
+    results, errors = archive.daily_many([
+        ('tours', *TOURS, '2024-01-01', '2024-01-05'),
+        ('tours-nord', 47.41, 0.70, '2024-01-01', '2024-01-05'),  # Same grid cell as tours
+        ('lyon', 45.76, 4.84, '2024-01-01', '2024-01-05'),
+    ])
+
+    assert errors == {}
+    assert results['tours'] == results['tours-nord']
+    assert results['lyon'] == expected(45.8, '2024-01-01', '2024-01-05')
+    # Both cells missing the same range are fetched in one multi-location request
+    assert len(stub.calls) == 1
+    assert len(stub.calls[0][0]) == 2
@@ -0,0 +1,132 @@
+"""
+to_history_frame must give the same rows as the per-row loop it replaced in
+WeatherDataFetcher.process_weather_data, for every registered format.
+"""
+
+import glob
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from weather_formats import WEATHER_FORMATS, detect_weather_format, to_history_frame
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+def legacy_history_frame(df, ville_name):
+    """The previous process_weather_data conversion (iterrows, one dict per Type)."""
+    processed_data = []
+
+    def add(date_str, time, type_name, value):
+        processed_data.append({'Datetime': f"{date_str} {time}", 'BAT': ville_name, 'Type': type_name, 'Value': value})
+
+    if 'temp_max' in df.columns and 'temp_min' in df.columns:
+        for _, row in df.iterrows():
+            add(row['date'], '12:00:00', 'TEMPERATURE', row['temp_mean'])
+            add(row['date'], '00:00:00', 'TEMPERATURE_MIN', row['temp_min'])
+            add(row['date'], '00:00:00', 'TEMPERATURE_MAX', row['temp_max'])
+            add(row['date'], '12:00:00', 'WIND_SPEED', row['windspeed'])
+            add(row['date'], '12:00:00', 'PRECIPITATION', row['precipitation'])
+    elif 'name' in df.columns and 'datetime' in df.columns:
+        for _, row in df.iterrows():
+            add(row['datetime'], '12:00:00', 'TEMPERATURE', row['temp'])
+            add(row['datetime'], '00:00:00', 'TEMPERATURE_MIN', row['tempmin'])
+            add(row['datetime'], '00:00:00', 'TEMPERATURE_MAX', row['tempmax'])
+            if 'humidity' in row:
+                add(row['datetime'], '12:00:00', 'HUMIDITY', row['humidity'])
+            if 'windspeed' in row:
+                add(row['datetime'], '12:00:00', 'WIND_SPEED', row['windspeed'])
+    else:
+        df = df.copy()
+        df.columns = WEATHER_FORMATS['historique-meteo']['columns']
+        for _, row in df.iterrows():
+            add(row['Date'], '12:00:00', 'TEMPERATURE', (row['TempMax'] + row['TempMin']) / 2)
+            add(row['Date'], '00:00:00', 'TEMPERATURE_MIN', row['TempMin'])
+            add(row['Date'], '00:00:00', 'TEMPERATURE_MAX', row['TempMax'])
+            add(row['Date'], '12:00:00', 'HUMIDITY', (row['HumidityMax'] + row['HumidityMin']) / 2)
+            add(row['Date'], '12:00:00', 'WIND_SPEED', row['WindSpeed'])
+
+    return pd.DataFrame(processed_data)
+
+
+def _days(rows):
+    return pd.date_range('2024-01-01', periods=rows, freq='D').strftime('%Y-%m-%d')
+
+
+def _values(rows, seed, missing=True):
+    """Random values, with some missing ones."""
+    values = np.random.default_rng(seed).normal(10, 5, rows).round(1)
+    if missing:
+        values[::4] = np.nan
+    return values
+
+
+def open_meteo_frame(rows=12):
+    return pd.DataFrame({
+        'date': _days(rows),
+        'temp_max': _values(rows, 1),
+        'temp_min': _values(rows, 2, missing=False),
+        'temp_mean': _values(rows, 3),
+        'precipitation': _values(rows, 4),
+        'windspeed': _values(rows, 5),
+    })
+
+
+def visual_crossing_frame(rows=12, humidity=True, windspeed=True):
+    df = pd.DataFrame({
+        'name': 'Tours',
+        'datetime': _days(rows),
+        'tempmax': _values(rows, 1),
+        'tempmin': _values(rows, 2),
+        'temp': _values(rows, 3, missing=False),
+    })
+    if humidity:
+        df['humidity'] = _values(rows, 4)
+    if windspeed:
+        df['windspeed'] = _values(rows, 5)
+    return df
+
+
+def historique_meteo_frame(rows=12):
+    columns = WEATHER_FORMATS['historique-meteo']['columns']
+    df = pd.DataFrame({column: _values(rows, seed) for seed, column in enumerate(columns)})
+    df['Date'] = _days(rows)
+    df['WindDir'] = 'NE'
+    df['Sunrise'] = '07:58'
+    # Named after the first data row, as read_csv does with these header-less files
+    return df.set_axis([f"c{i}" for i in range(len(columns))], axis=1)
+
+
+# A sample frame for every registered format
+SAMPLE_FRAMES = {
+    'open-meteo': [open_meteo_frame()],
+    'visual-crossing': [
+        visual_crossing_frame(),
+        visual_crossing_frame(humidity=False),
+        visual_crossing_frame(windspeed=False),
+        visual_crossing_frame(humidity=False, windspeed=False),
+    ],
+    'historique-meteo': [historique_meteo_frame()],
+}
+
+
+def test_every_format_has_samples():
+    assert set(SAMPLE_FRAMES) == set(WEATHER_FORMATS)
+
+
+@pytest.mark.parametrize('format_name, df', [
+    pytest.param(name, df, id=f"{name}-{i}") for name, frames in SAMPLE_FRAMES.items() for i, df in enumerate(frames)
+])
+def test_matches_legacy_loop(format_name, df):
+    assert detect_weather_format(df) == format_name
+    assert_frame_equal(to_history_frame(df, 'Tours'), legacy_history_frame(df, 'Tours'))
+
+
+@pytest.mark.parametrize('path', sorted(
+    glob.glob(os.path.join(DATA_DIR, '*_????-??-??_????-??-??.csv')) +
+    glob.glob(os.path.join(DATA_DIR, 'sample_weather_data.csv'))
+), ids=os.path.basename)
+def test_data_files_match_legacy_loop(path):
+    df = pd.read_csv(path)
+    assert_frame_equal(to_history_frame(df, 'Tours'), legacy_history_frame(df, 'Tours'))
@@ -0,0 +1,361 @@
+import math
+import json
+import base64
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+# Default maximum number of points sent to the dashboard chart
+DEFAULT_MAX_POINTS = 1000
+
+# Format SQLAlchemy uses to store DateTime columns in SQLite
+SQLITE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Format of the Datetime column of the history table
+HISTORY_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Default and maximum number of rows per page in the measures API
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+# Tables the measures API can read from, with the columns telling their series apart
+# (series column -> name in the API output)
+SOURCES = {
+    'measure': {'table': 'measure', 'time': 'timestamp', 'value': 'value', 'format': SQLITE_DATETIME_FORMAT,
+                'series': {}},
+    'history': {'table': 'history', 'time': 'Datetime', 'value': 'Value', 'format': HISTORY_DATETIME_FORMAT,
+                'series': {'BAT': 'bat', 'Type': 'type'}},
+}
+
+# Buckets as (length of the datetime prefix grouped on, suffix completing the label, bucket width)
+BUCKETS = {
+    '1min': (16, ':00', pd.Timedelta(minutes=1)),
+    '1h': (13, ':00:00', pd.Timedelta(hours=1)),
+    '1d': (10, ' 00:00:00', pd.Timedelta(days=1)),
+}
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, in each bucket in between, the point
+    forming the largest triangle with the previously kept point and the average
+    of the next bucket, which preserves the visual shape of the series.
+
+    Args:
+        x (numpy.ndarray): Sorted x values (as floats)
+        y (numpy.ndarray): y values
+        threshold (int): Maximum number of points to keep
+
+    Returns:
+        numpy.ndarray: Indices of the kept points
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    sampled = [0]
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average point of the next bucket
+        avg_start = int(math.floor((i + 1) * every)) + 1
+        avg_end = min(int(math.floor((i + 2) * every)) + 1, n)
+        avg_x = x[avg_start:avg_end].mean()
+        avg_y = y[avg_start:avg_end].mean()
+
+        # Candidates in the current bucket
+        range_start = int(math.floor(i * every)) + 1
+        range_end = int(math.floor((i + 1) * every)) + 1
+        xs = x[range_start:range_end]
+        ys = y[range_start:range_end]
+
+        area = np.abs((x[a] - avg_x) * (ys - y[a]) - (x[a] - xs) * (avg_y - y[a]))
+        a = range_start + int(area.argmax())
+        sampled.append(a)
+
+    sampled.append(n - 1)
+    return np.array(sampled)
+
+
+def minmax(y, threshold):
+    """
+    Min/max bucket decimation.
+
+    Splits the series into threshold / 2 buckets and keeps the minimum and
+    maximum of each, so peaks are never lost.
+
+    Args:
+        y (numpy.ndarray): y values
+        threshold (int): Maximum number of points to keep
+
+    Returns:
+        numpy.ndarray: Sorted indices of the kept points
+    """
+    n = len(y)
+    if threshold >= n or threshold < 2:
+        return np.arange(n)
+
+    indices = []
+    for bucket in np.array_split(np.arange(n), threshold // 2):
+        values = y[bucket]
+        indices.append(bucket[values.argmin()])
+        indices.append(bucket[values.argmax()])
+
+    return np.unique(indices)
+
+
+def downsample(df, max_points=DEFAULT_MAX_POINTS, method='lttb', x='timestamp', y='value'):
+    """
+    Reduce a time series to at most max_points rows.
+
+    Args:
+        df (pandas.DataFrame): Series sorted by x
+        max_points (int): Maximum number of rows to return
+        method (str): 'lttb' or 'minmax'
+        x (str): Datetime column
+        y (str): Value column
+
+    Returns:
+        pandas.DataFrame: The kept rows
+    """
+    if len(df) <= max_points:
+        return df
+
+    values = df[y].to_numpy(dtype=float)
+    if method == 'minmax':
+        indices = minmax(values, max_points)
+    elif method == 'lttb':
+        times = df[x].to_numpy(dtype='datetime64[ns]').astype('int64').astype(float)
+        indices = lttb(times, values, max_points)
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+
+    return df.iloc[indices]
+
+
+def parse_bound(value, name='bound'):
+    """
+    Parse a window bound given as a string.
+
+    Args:
+        value (str): Date or datetime
+        name (str): Name of the parameter, for the error message
+
+    Returns:
+        pandas.Timestamp: The bound
+
+    Raises:
+        ValueError: If value is not a valid date or datetime
+    """
+    try:
+        ts = pd.Timestamp(value)
+    except (ValueError, TypeError):
+        ts = pd.NaT
+    if pd.isna(ts):
+        raise ValueError(f"Invalid {name}: {value!r}")
+    return ts
+
+
+def parse_window(start=None, end=None, fmt=SQLITE_DATETIME_FORMAT):
+    """
+    Turn optional start/end strings into SQLite datetime bounds.
+
+    A date without a time as end includes that whole day.
+
+    Args:
+        start (str): Start of the window
+        end (str): End of the window (inclusive)
+        fmt (str): Format the datetimes are stored with
+
+    Returns:
+        tuple: (start bound or None, exclusive end bound or None)
+
+    Raises:
+        ValueError: If start or end is not a valid date or datetime
+    """
+    start_bound = end_bound = None
+    if start:
+        start_bound = parse_bound(start, 'start').strftime(fmt)
+    if end:
+        end_ts = parse_bound(end, 'end')
+        if len(end.strip()) <= 10:
+            end_ts += pd.Timedelta(days=1)
+        elif '%f' in fmt:
+            end_ts += pd.Timedelta(microseconds=1)
+        else:
+            end_ts += pd.Timedelta(seconds=1)
+        end_bound = end_ts.strftime(fmt)
+    return start_bound, end_bound
+
+
+def encode_cursor(values):
+    """Encode the position after the last returned row as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor returned by encode_cursor."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+
+def query_series(connection, source='measure', start=None, end=None, bucket='raw',
+                 cursor=None, limit=DEFAULT_PAGE_SIZE, filters=None):
+    """
+    Read one page of a time series, aggregated in SQL.
+
+    Pages are keyset-paginated: the cursor holds the last returned timestamp
+    (and id in raw mode, or series in bucketed mode), so each page is a range
+    scan on the time column.
+
+    Sources holding several series (the history table has one per BAT and
+    Type) return the series of each row, and buckets are aggregated per
+    series, so different measurements are never mixed into one value.
+
+    Args:
+        connection: DBAPI (sqlite3) connection
+        source (str): Key of SOURCES
+        start (str): Optional start of the window
+        end (str): Optional end of the window (inclusive)
+        bucket (str): 'raw' or a key of BUCKETS
+        cursor (str): Cursor returned with the previous page
+        limit (int): Maximum number of rows in the page
+        filters (dict): Column name -> list of accepted values
+
+    Returns:
+        tuple: (column names, list of row tuples, next cursor or None)
+        Rows are (t, series..., value) in raw mode and (t, series..., avg, min,
+        max, count) in bucketed mode.
+    """
+    if source not in SOURCES:
+        raise ValueError(f"Unknown source: {source}")
+    if bucket != 'raw' and bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket: {bucket}")
+
+    table = SOURCES[source]['table']
+    time_col = SOURCES[source]['time']
+    value_col = SOURCES[source]['value']
+    fmt = SOURCES[source]['format']
+    series = list(SOURCES[source]['series'])
+    series_names = list(SOURCES[source]['series'].values())
+    series_sql = ''.join(f", {col}" for col in series)
+
+    start_bound, end_bound = parse_window(start, end, fmt)
+    conditions = []
+    params = {'limit': limit + 1}
+    if start_bound:
+        conditions.append(f"{time_col} >= :start")
+        params['start'] = start_bound
+    if end_bound:
+        conditions.append(f"{time_col} < :end")
+        params['end'] = end_bound
+    for i, (col, values) in enumerate((filters or {}).items()):
+        names = [f"f{i}_{j}" for j in range(len(values))]
+        conditions.append(f"{col} IN ({', '.join(':' + name for name in names)})")
+        params.update(zip(names, values))
+
+    position = decode_cursor(cursor) if cursor else None
+
+    if bucket == 'raw':
+        if position:
+            conditions.append(f"({time_col} > :cursor_time OR ({time_col} = :cursor_time AND id > :cursor_id))")
+            params['cursor_time'], params['cursor_id'] = position
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT {time_col}{series_sql}, {value_col}, id
+            FROM {table}
+            {where}
+            ORDER BY {time_col}, id
+            LIMIT :limit
+        """
+        columns = ['t', *series_names, 'value']
+    else:
+        length, suffix, width = BUCKETS[bucket]
+        having = ""
+        if position:
+            if len(position) != 1 + len(series):
+                raise ValueError("Invalid cursor")
+            if series:
+                # Start in the last returned bucket, after its last returned series
+                conditions.append(f"{time_col} >= :after")
+                params['after'] = pd.Timestamp(position[0]).strftime(fmt)
+                names = [f"cursor_{i}" for i in range(len(position))]
+                having = f"HAVING (t{series_sql}) > ({', '.join(':' + name for name in names)})"
+                params.update(zip(names, position))
+            else:
+                # Start right after the last returned bucket
+                conditions.append(f"{time_col} >= :after")
+                params['after'] = (pd.Timestamp(position[0]) + width).strftime(fmt)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT substr({time_col}, 1, {length}) || '{suffix}' AS t{series_sql},
+                   AVG({value_col}), MIN({value_col}), MAX({value_col}), COUNT(*)
+            FROM {table}
+            {where}
+            GROUP BY t{series_sql}
+            {having}
+            ORDER BY t{series_sql}
+            LIMIT :limit
+        """
+        columns = ['t', *series_names, 'avg', 'min', 'max', 'count']
+
+    cur = connection.cursor()
+    try:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if bucket == 'raw':
+            next_cursor = encode_cursor([last[0], last[-1]])
+        else:
+            next_cursor = encode_cursor(list(last[:1 + len(series)]))
+
+    if bucket == 'raw':
+        rows = [row[:-1] for row in rows]
+
+    return columns, rows, next_cursor
+
+
+def load_measure_series(connection, start=None, end=None, max_points=DEFAULT_MAX_POINTS, method='lttb'):
+    """
+    Read measures for a window straight from SQLite and downsample them.
+
+    Rows are read into two columns without building ORM objects.
+
+    Args:
+        connection: SQLAlchemy connection to the application database
+        start (str): Optional start of the window
+        end (str): Optional end of the window (inclusive)
+        max_points (int): Maximum number of points to return
+        method (str): 'lttb' or 'minmax'
+
+    Returns:
+        pandas.DataFrame: 'timestamp' and 'value' columns
+    """
+    start_bound, end_bound = parse_window(start, end)
+
+    conditions = []
+    params = {}
+    if start_bound:
+        conditions.append("timestamp >= :start")
+        params['start'] = start_bound
+    if end_bound:
+        conditions.append("timestamp < :end")
+        params['end'] = end_bound
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    query = f"SELECT timestamp, value FROM measure {where} ORDER BY timestamp"
+    df = pd.read_sql_query(text(query), connection, params=params)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+
+    return downsample(df, max_points, method)
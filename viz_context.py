@@ -0,0 +1,200 @@
+"""
+Shared data of the visualizations of a BAT.
+
+VizContext reads the history rows the plots need (only their Types, only the
+requested date window) in a single query and pivots them once into a wide
+frame indexed by Datetime with one column per Type. Each plot then gets a view
+of its columns instead of filtering and pivoting the rows again. The time
+spent in each stage is kept in VizContext.timings.
+
+Short windows are read from the raw history, longer ones from the hourly or
+daily rollup (see history_rollups.py), so the number of points plotted, and
+the rendering time, follows the window rather than the whole history.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+import pandas as pd
+from history_schema import NON_DEVICE_TYPES
+
+# Longest windows, in days, read from the raw history and from the hourly rollup
+# (longer ones are read from the daily rollup)
+RAW_MAX_DAYS = int(os.getenv('VIZ_RAW_MAX_DAYS', 14))
+HOURLY_MAX_DAYS = int(os.getenv('VIZ_HOURLY_MAX_DAYS', 90))
+
+# Where each resolution is read from: (table, time column, value expression)
+# A rollup period is plotted with its mean, or its extreme for the min/max Types
+ROLLUP_VALUE_SQL = "CASE Type WHEN 'TEMPERATURE_MIN' THEN Min WHEN 'TEMPERATURE_MAX' THEN Max ELSE Sum / Count END"
+RESOLUTIONS = {
+    'raw': ('history', 'Datetime', 'Value'),
+    'hourly': ('history_hourly', 'Period', ROLLUP_VALUE_SQL),
+    'daily': ('history_daily', 'Period', ROLLUP_VALUE_SQL),
+}
+
+
+def select(wide, types):
+    """
+    View of some Types of a wide frame.
+
+    Types missing from the frame are ignored and Datetimes without any value
+    for the selected Types are dropped, so the view matches a pivot of only
+    those Types' rows.
+    """
+    return wide[[type_ for type_ in types if type_ in wide.columns]].dropna(how='all')
+
+
+def to_rows(wide):
+    """Turn a wide frame (or view) back into Datetime, Type, Value rows."""
+    rows = wide.rename_axis(columns='Type').stack().rename('Value').reset_index()
+    return rows[['Datetime', 'Type', 'Value']]
+
+
+def day_after(day):
+    """Day following a 'YYYY-MM-DD' string."""
+    return (pd.Timestamp(day) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def history_span(conn, ville_name):
+    """
+    First and last day of the history of a BAT.
+
+    Returns:
+        tuple: ('YYYY-MM-DD', 'YYYY-MM-DD'), or (None, None) without history
+    """
+    # The daily rollup has the same days as the history, in far fewer rows
+    return conn.execute("SELECT MIN(Period), MAX(Period) FROM history_daily WHERE BAT = ?", (ville_name,)).fetchone()
+
+
+def choose_resolution(start, end):
+    """
+    Resolution to plot a window of days with.
+
+    Args:
+        start (str): First day ('YYYY-MM-DD')
+        end (str): Last day ('YYYY-MM-DD'), included
+
+    Returns:
+        str: 'raw' up to RAW_MAX_DAYS, 'hourly' up to HOURLY_MAX_DAYS, 'daily' beyond
+    """
+    if not start or not end:
+        return 'raw'
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    if days <= RAW_MAX_DAYS:
+        return 'raw'
+    if days <= HOURLY_MAX_DAYS:
+        return 'hourly'
+    return 'daily'
+
+
+class VizContext:
+    """History of a BAT prepared once for all its plots."""
+
+    def __init__(self, ville_name, rows, timings=None, resolution='raw'):
+        """
+        Pivot rows into the wide frame.
+
+        Args:
+            ville_name (str): BAT the rows belong to
+            rows (pandas.DataFrame): Datetime (parsed), Type and Value rows
+            timings (dict): Stage timings measured so far, in seconds
+            resolution (str): Resolution the rows were read at (see RESOLUTIONS)
+        """
+        self.ville_name = ville_name
+        self.rows = rows
+        self.resolution = resolution
+        self.timings = dict(timings or {})
+
+        with self.stage('pivot'):
+            if rows.empty:
+                self.wide = pd.DataFrame(index=pd.DatetimeIndex([], name='Datetime'))
+            else:
+                # The history key is unique, but two spellings of a Datetime may parse to the same instant
+                unique = rows.drop_duplicates(['Datetime', 'Type'], keep='last')
+                self.wide = unique.pivot(index='Datetime', columns='Type', values='Value').sort_index()
+                self.wide.columns.name = None
+
+    @classmethod
+    def load(cls, conn, ville_name, types=None, devices=True, start=None, end=None, resolution=None):
+        """
+        Read the history of a BAT and prepare it.
+
+        Args:
+            conn (sqlite3.Connection): Connection to the database holding the history table
+            ville_name (str): BAT to read
+            types (list): Types to read, every Type if None
+            devices (bool): Also read the device Types (those outside NON_DEVICE_TYPES)
+            start (str): First day to read ('YYYY-MM-DD'), included
+            end (str): Last day to read ('YYYY-MM-DD'), included
+            resolution (str): 'raw', 'hourly' or 'daily', chosen from the window if None
+                (the rollup tables must exist, see ensure_history_schema)
+
+        Returns:
+            VizContext: The prepared context
+        """
+        timings = {}
+        started = time.perf_counter()
+
+        if resolution is None:
+            first, last = (start, end) if start and end else history_span(conn, ville_name)
+            resolution = choose_resolution(start or first, end or last)
+        table, time_column, value_sql = RESOLUTIONS[resolution]
+
+        conditions = ["BAT = ?"]
+        params = [ville_name]
+        if types is not None:
+            type_conditions = [f"Type IN ({', '.join('?' * len(types))})"] if types else []
+            params.extend(types)
+            if devices:
+                type_conditions.append(f"Type LIKE 'DEVICE%' OR Type NOT IN ({', '.join('?' * len(NON_DEVICE_TYPES))})")
+                params.extend(NON_DEVICE_TYPES)
+            conditions.append(f"({' OR '.join(type_conditions) or '0'})")
+        if start:
+            conditions.append(f"{time_column} >= ?")
+            params.append(start)
+        if end:
+            conditions.append(f"{time_column} < ?")
+            params.append(day_after(end))
+
+        rows = pd.read_sql_query(f'''
+            SELECT {time_column} AS Datetime, Type, {value_sql} AS Value
+            FROM {table}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {time_column}
+        ''', conn, params=params)
+        rows['Datetime'] = pd.to_datetime(rows['Datetime'], format='ISO8601')
+        timings['query'] = time.perf_counter() - started
+
+        return cls(ville_name, rows, timings, resolution)
+
+    @contextmanager
+    def stage(self, name):
+        """Add the time spent in the block to the timings of a stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+    @property
+    def empty(self):
+        """True when no row was read."""
+        return self.rows.empty
+
+    def frame(self, types=None):
+        """View of some Types (every Type if None), see select."""
+        return self.wide if types is None else select(self.wide, types)
+
+    def device_types(self):
+        """
+        Types plotted as devices.
+
+        Types containing 'DEVICE', or if there are none, every Type outside NON_DEVICE_TYPES.
+        """
+        devices = [type_ for type_ in self.wide.columns if 'DEVICE' in str(type_).upper()]
+        return devices or [type_ for type_ in self.wide.columns if type_ not in NON_DEVICE_TYPES]
+
+    def report(self):
+        """One line summing up the resolution and the stage timings."""
+        stages = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items())
+        return f"{len(self.rows)} {self.resolution} rows, {stages}"
@@ -0,0 +1,402 @@
+"""
+Client and on-disk cache for the Open-Meteo historical archive.
+
+Archive data for past days does not change, so every day fetched for a
+coordinate is kept in a SQLite cache and only the missing days are requested.
+"""
+
+import os
+import time
+import random
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from data_access import get_connection
+
+# Archive endpoint (can point to a local server for tests)
+ARCHIVE_URL = os.getenv('OPEN_METEO_ARCHIVE_URL', 'https://archive-api.open-meteo.com/v1/archive')
+
+# SQLite file holding the cached days
+DEFAULT_CACHE_PATH = os.getenv('WEATHER_CACHE_DB', os.path.join('data', 'weather_cache.db'))
+
+# Seconds before an archive request is abandoned
+REQUEST_TIMEOUT = 30
+
+# Longest range requested in a single call, longer ranges are split into chunks
+MAX_CHUNK_DAYS = 365
+
+# Requests running at the same time
+DEFAULT_CONCURRENCY = 4
+
+# Attempts after a failed request, waiting RETRY_BACKOFF * 2 ** attempt seconds (plus jitter) in between
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+
+# Statuses worth retrying (rate limited or temporarily unavailable)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Decimals coordinates are rounded to in the cache key (~10 m)
+COORDINATE_PRECISION = 4
+
+# Size in degrees of the grid cells sites are grouped by: sites in the same cell
+# get the same archive data, so they are fetched and cached once (ERA5-Land is ~0.1 degree)
+GRID_RESOLUTION = float(os.getenv('WEATHER_GRID_RESOLUTION', 0.1))
+
+# Most locations sent in a single multi-location request
+MAX_LOCATIONS_PER_REQUEST = 50
+
+# Daily variables requested from the archive, mapped to the CSV columns written by fetch_weather_data
+DAILY_VARIABLES = {
+    'temperature_2m_max': 'temp_max',
+    'temperature_2m_min': 'temp_min',
+    'temperature_2m_mean': 'temp_mean',
+    'precipitation_sum': 'precipitation',
+    'windspeed_10m_max': 'windspeed',
+    'winddirection_10m_dominant': 'winddirection',
+}
+
+COLUMNS = list(DAILY_VARIABLES.values())
+
+# Value columns are declared without a type so values come back exactly as the API sent them
+CACHE_TABLE_SQL = f'''
+    CREATE TABLE IF NOT EXISTS daily_weather (
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        date TEXT NOT NULL,
+        {', '.join(COLUMNS)},
+        PRIMARY KEY (latitude, longitude, date)
+    )
+'''
+
+
+def date_range(start_date, end_date):
+    """Return the 'YYYY-MM-DD' days from start_date to end_date, both included."""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    return [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((end - start).days + 1)]
+
+
+def missing_intervals(days, available):
+    """
+    Group the days that are not available into contiguous intervals.
+
+    Args:
+        days (list): Sorted 'YYYY-MM-DD' days
+        available (set): Days already known
+
+    Returns:
+        list: (first day, last day) tuples
+    """
+    intervals = []
+    start = previous = None
+    for day in days:
+        if day in available:
+            if start:
+                intervals.append((start, previous))
+                start = None
+            continue
+        if start is None:
+            start = day
+        previous = day
+
+    if start:
+        intervals.append((start, previous))
+    return intervals
+
+
+def split_interval(first, last, max_days=MAX_CHUNK_DAYS):
+    """
+    Split an interval of days into chunks of at most max_days.
+
+    Returns:
+        list: (first day, last day) tuples in date order
+    """
+    start = datetime.strptime(first, '%Y-%m-%d')
+    end = datetime.strptime(last, '%Y-%m-%d')
+    chunks = []
+    while start <= end:
+        chunk_end = min(start + timedelta(days=max_days - 1), end)
+        chunks.append((start.strftime('%Y-%m-%d'), chunk_end.strftime('%Y-%m-%d')))
+        start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def grid_cell(latitude, longitude, resolution=GRID_RESOLUTION):
+    """Return the center of the grid cell holding a coordinate pair."""
+    if not resolution:
+        return round(float(latitude), COORDINATE_PRECISION), round(float(longitude), COORDINATE_PRECISION)
+    return (round(round(float(latitude) / resolution) * resolution, COORDINATE_PRECISION),
+            round(round(float(longitude) / resolution) * resolution, COORDINATE_PRECISION))
+
+
+class DailyWeatherCache:
+    """
+    SQLite store of daily archive rows keyed by (latitude, longitude, date).
+
+    hits and misses count the days served from disk and the days that had to be fetched.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        """
+        Open (and create if needed) the cache database.
+
+        Args:
+            path (str): SQLite file of the cache
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(CACHE_TABLE_SQL)
+
+    def _connect(self):
+        """Pooled connection of the calling thread to the cache database (see data_access.get_connection)."""
+        return get_connection(self.path)
+
+    @staticmethod
+    def key(latitude, longitude):
+        """Round a coordinate pair to the precision used as cache key."""
+        return round(float(latitude), COORDINATE_PRECISION), round(float(longitude), COORDINATE_PRECISION)
+
+    def get(self, latitude, longitude, start_date, end_date):
+        """
+        Read the cached days of a range.
+
+        Returns:
+            dict: 'YYYY-MM-DD' -> tuple of COLUMNS values
+        """
+        lat, lon = self.key(latitude, longitude)
+        rows = self._connect().execute(f'''
+            SELECT date, {', '.join(COLUMNS)}
+            FROM daily_weather
+            WHERE latitude = ? AND longitude = ? AND date >= ? AND date <= ?
+        ''', (lat, lon, start_date, end_date)).fetchall()
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+    def put(self, latitude, longitude, days):
+        """
+        Store fetched days.
+
+        Days without any value (not yet available in the archive) are not cached
+        so they are requested again next time.
+
+        Args:
+            days (dict): 'YYYY-MM-DD' -> tuple of COLUMNS values
+        """
+        lat, lon = self.key(latitude, longitude)
+        rows = [(lat, lon, day) + tuple(values) for day, values in days.items()
+                if any(value is not None for value in values)]
+
+        with self._connect() as conn:
+            conn.executemany(f'''
+                INSERT OR REPLACE INTO daily_weather (latitude, longitude, date, {', '.join(COLUMNS)})
+                VALUES ({', '.join('?' * (len(COLUMNS) + 3))})
+            ''', rows)
+
+
+class WeatherArchive:
+    """
+    Fetch daily weather from the archive, serving the days already fetched from the cache.
+
+    Sites are grouped by grid cell, missing days are split into chunks of at most
+    chunk_days and fetched in multi-location requests, concurrently on a shared
+    requests.Session with retries, then merged back in date order.
+    """
+
+    def __init__(self, cache=None, url=ARCHIVE_URL, timeout=REQUEST_TIMEOUT, session=None,
+                 concurrency=DEFAULT_CONCURRENCY, chunk_days=MAX_CHUNK_DAYS,
+                 retries=MAX_RETRIES, backoff=RETRY_BACKOFF, resolution=GRID_RESOLUTION):
+        """
+        Initialize the archive client.
+
+        Args:
+            cache (DailyWeatherCache): Cache to use, a DailyWeatherCache at DEFAULT_CACHE_PATH if None
+            url (str): Archive endpoint
+            timeout (float): Seconds before a request is abandoned
+            session (requests.Session): Session to reuse connections from, a new one if None
+            concurrency (int): Maximum number of requests running at the same time
+            chunk_days (int): Longest range requested in a single call
+            retries (int): Attempts after a failed request
+            backoff (float): Base wait between attempts, in seconds
+            resolution (float): Grid cell size in degrees sites are grouped by (0 to disable)
+        """
+        self.cache = cache or DailyWeatherCache()
+        self.url = url
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+        self.chunk_days = chunk_days
+        self.retries = retries
+        self.backoff = backoff
+        self.resolution = resolution
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+    def _get(self, params):
+        """GET the archive, retrying connection errors and RETRY_STATUSES with exponential backoff."""
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(self.url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                response = None
+
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                break
+            if response is not None and attempt == self.retries:
+                break
+
+            delay = self.backoff * 2 ** attempt
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            print(f"Archive request for {params['start_date']}..{params['end_date']} failed "
+                  f"({response.status_code if response is not None else 'connection error'}), "
+                  f"retrying in {delay:.1f}s")
+            time.sleep(delay + random.uniform(0, self.backoff))
+
+        if response.status_code != 200:
+            raise requests.HTTPError(f"HTTP {response.status_code}: {response.text}", response=response)
+        return response
+
+    def request_daily_many(self, locations, start_date, end_date):
+        """
+        Fetch a range of days for several locations in one request, bypassing the cache.
+
+        Args:
+            locations (list): (latitude, longitude) tuples
+
+        Returns:
+            list: For each location, a dict 'YYYY-MM-DD' -> tuple of COLUMNS values
+        """
+        params = {
+            'latitude': ','.join(str(latitude) for latitude, _ in locations),
+            'longitude': ','.join(str(longitude) for _, longitude in locations),
+            'start_date': start_date,
+            'end_date': end_date,
+            'daily': ','.join(DAILY_VARIABLES),
+            'timezone': 'Europe/Berlin',
+        }
+        data = self._get(params).json()
+
+        # A single location comes back as an object, several as a list in request order
+        responses = data if isinstance(data, list) else [data]
+        if len(responses) != len(locations):
+            raise ValueError(f"Expected {len(locations)} locations in response, got {len(responses)}")
+
+        results = []
+        for response in responses:
+            if 'daily' not in response:
+                raise ValueError(f"No daily data in response: {response}")
+
+            daily = response['daily']
+            dates = daily.get('time', [])
+            series = [daily.get(variable, [None] * len(dates)) for variable in DAILY_VARIABLES]
+            results.append({day: tuple(values[i] for values in series) for i, day in enumerate(dates)})
+        return results
+
+    def request_daily(self, latitude, longitude, start_date, end_date):
+        """
+        Fetch a range of days from the archive, bypassing the cache.
+
+        Returns:
+            dict: 'YYYY-MM-DD' -> tuple of COLUMNS values
+        """
+        return self.request_daily_many([(latitude, longitude)], start_date, end_date)[0]
+
+    def daily_many(self, sites):
+        """
+        Return the daily weather of many sites, fetching the missing days in batches.
+
+        Sites are grouped by grid cell (see grid_cell) so nearby sites are fetched
+        and cached once. The days missing for each cell are split into chunks, and
+        the cells missing the same chunk are requested together (up to
+        MAX_LOCATIONS_PER_REQUEST per request), at most self.concurrency requests
+        at a time. Results are fanned back out to the sites in date order.
+
+        Args:
+            sites (list): (key, latitude, longitude, start date, end date) tuples
+
+        Returns:
+            tuple: (dict key -> list of (date, *COLUMNS values) tuples in date order,
+                    dict key -> exception for the sites whose fetch failed)
+        """
+        # Days needed by each cell, and the sites reading from it
+        cells = {}
+        for key, latitude, longitude, start_date, end_date in sites:
+            cell = cells.setdefault(grid_cell(latitude, longitude, self.resolution), {'days': set(), 'sites': []})
+            days = date_range(start_date, end_date)
+            cell['days'].update(days)
+            cell['sites'].append((key, days))
+
+        # Chunks missing from the cache, and the cells missing each of them
+        batches = {}
+        for coordinates, cell in cells.items():
+            days = sorted(cell['days'])
+            cell['known'] = self.cache.get(*coordinates, days[0], days[-1]) if days else {}
+            for key, site_days in cell['sites']:
+                hits = sum(1 for day in site_days if day in cell['known'])
+                self.cache.hits += hits
+                self.cache.misses += len(site_days) - hits
+
+            for first, last in missing_intervals(days, cell['known']):
+                for chunk in split_interval(first, last, self.chunk_days):
+                    batches.setdefault(chunk, []).append(coordinates)
+
+        requests_ = [
+            (chunk, locations[i:i + MAX_LOCATIONS_PER_REQUEST])
+            for chunk, locations in batches.items()
+            for i in range(0, len(locations), MAX_LOCATIONS_PER_REQUEST)
+        ]
+
+        failed = {}
+        if requests_:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(requests_))) as pool:
+                futures = {
+                    pool.submit(self.request_daily_many, locations, first, last): locations
+                    for (first, last), locations in requests_
+                }
+                for future in as_completed(futures):
+                    locations = futures[future]
+                    try:
+                        fetched = future.result()
+                    except Exception as e:
+                        for coordinates in locations:
+                            failed.setdefault(coordinates, e)
+                        continue
+                    # Chunks that succeeded are cached even if another chunk of the cell failed
+                    for coordinates, days in zip(locations, fetched):
+                        self.cache.put(*coordinates, days)
+                        cells[coordinates]['known'].update(days)
+
+        results = {}
+        errors = {}
+        for coordinates, cell in cells.items():
+            for key, days in cell['sites']:
+                if coordinates in failed:
+                    errors[key] = failed[coordinates]
+                else:
+                    results[key] = [(day,) + tuple(cell['known'][day]) for day in days if day in cell['known']]
+        return results, errors
+
+    def daily(self, latitude, longitude, start_date, end_date):
+        """
+        Return the daily weather of a range, fetching only the days missing from the cache.
+
+        Returns:
+            list: (date, *COLUMNS values) tuples in date order
+        """
+        results, errors = self.daily_many([(None, latitude, longitude, start_date, end_date)])
+        if errors:
+            raise errors[None]
+        return results[None]
@@ -6,11 +6,9 @@ This script fetches historical weather data from Open-Meteo API and stores it in
 It also generates hourly temperature data using min/max temperatures with a sine function.
 """
 
-import requests
 import dotenv
 import os
 import csv
-import sqlite3
 import math
 import pandas as pd
 from datetime import datetime
@@ -20,242 +18,239 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 import matplotlib.dates as mdates
+import time
 import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from render_cache import RenderCache
+from data_access import get_connection, resolve_path
+from history_schema import ensure_history_schema, write_history
+from history_rollups import read_daily_rollup
+from history_summaries import to_partials, rollup_frame, device_stats, device_label
+from weather_formats import to_history_frame
+from sites import load_sites
+from viz_context import VizContext, select, to_rows
+from weather_archive import WeatherArchive, DailyWeatherCache, DEFAULT_CACHE_PATH, DEFAULT_CONCURRENCY, COLUMNS as WEATHER_COLUMNS
+
+# Each plot of generate_visualizations: method, output file names and the Types it draws
+# (None means the device Types)
+VIZ_PLOTS = [
+    ('_generate_temperature_viz', ['temperature'], ['TEMPERATURE', 'TEMPERATURE_MIN', 'TEMPERATURE_MAX']),
+    ('_generate_precipitation_viz', ['precipitation'], ['PRECIPITATION']),
+    ('_generate_wind_viz', ['wind'], ['WIND_SPEED']),
+    ('_generate_consumption_viz', ['consumption'], ['ELECTRICITY', 'GAS', 'WATER']),
+    ('_generate_device_consumption_viz', ['device_consumption', 'device_consumption_pie'], None),
+    ('_generate_smart_home_dashboard', ['dashboard'],
+     ['TEMPERATURE', 'TEMPERATURE_MIN', 'TEMPERATURE_MAX', 'INDOOR_TEMP',
+      'ELECTRICITY', 'GAS', 'WATER', 'PRECIPITATION', 'WIND_SPEED', 'HUMIDITY']),
+]
+
+# Processes rendering the plots of generate_visualizations (1 renders in the calling process)
+# Starting a spawn worker (importing pandas, matplotlib and seaborn) takes seconds, more than
+# rendering the six plots of most windows, so the pool is only used when this is set above 1
+# and at least VIZ_POOL_MIN_ROWS rows are plotted
+VIZ_RENDER_WORKERS = int(os.getenv('VIZ_RENDER_WORKERS', 1))
+VIZ_POOL_MIN_ROWS = int(os.getenv('VIZ_POOL_MIN_ROWS', 20000))
 
 class WeatherDataFetcher:
-    def __init__(self, db_path=None):
-        """Initialize the weather data fetcher."""
+    def __init__(self, db_path=None, cache_path=None, concurrency=DEFAULT_CONCURRENCY, sites_path=None):
+        """
+        Initialize the weather data fetcher.
+        
+        Args:
+            db_path (str): SQLite database holding the history table (SQLITE_DB or SmartHome.db if None)
+            cache_path (str): SQLite file caching archive days (WEATHER_CACHE_DB or data/weather_cache.db if None)
+            concurrency (int): Maximum number of archive requests running at the same time
+            sites_path (str): JSON site registry with the coordinates of each city (sites.json if None)
+        """
         # Load environment variables
         dotenv.load_dotenv()
         
         # Set up database connection
-        self.db_path = db_path or os.getenv('SQLITE_DB')
-        if not self.db_path:
-            raise ValueError("Database path not provided and SQLITE_DB environment variable not set")
+        self.db_path = resolve_path(db_path)
         
         # Create data directory if it doesn't exist
         os.makedirs('data', exist_ok=True)
         
+        # Archive client, created on first fetch
+        self.cache_path = cache_path or DEFAULT_CACHE_PATH
+        self.concurrency = concurrency
+        self.archive = None
+        
+        # Coordinates of the cities
+        self.sites = load_sites(sites_path)
+        
         # Initialize the database
         self.initialize_db()
         
     def initialize_db(self):
         """Initialize the database with required tables."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        conn = self.connect_db()
+
         # Create Mesures table if it doesn't exist
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Mesures (
-            BAT TEXT,
-            Datetime TEXT,
-            Objet TEXT,
-            Commande TEXT,
-            Name TEXT,
-            Type TEXT,
-            Value REAL,
-            Unit TEXT
-        )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        with conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS Mesures (
+                BAT TEXT,
+                Datetime TEXT,
+                Objet TEXT,
+                Commande TEXT,
+                Name TEXT,
+                Type TEXT,
+                Value REAL,
+                Unit TEXT
+            )
+            ''')
+
         print(f"Database initialized at {self.db_path}")
         
     def connect_db(self):
-        """Connect to the SQLite database."""
-        # Connect to the database
-        conn = sqlite3.connect(self.db_path)
-        
-        return conn
+        """Pooled connection of this thread to the SQLite database (see data_access.get_connection, do not close it)."""
+        return get_connection(self.db_path)
     
     def store_weather_data(self, processed_df):
-        """Store processed weather data in the database."""
-        import sqlite3
-        import traceback
+        """
+        Store processed weather data in the database.
         
+        Rows are upserted on (BAT, Type, Datetime) in a single transaction, so
+        storing the same city and range again does not create duplicates.
+        """
         try:
             # Connect to database
-            conn = sqlite3.connect('smarthome.db')
-            cursor = conn.cursor()
-            
-            # Create table if it doesn't exist
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    BAT TEXT,
-                    Datetime TEXT,
-                    Objet TEXT,
-                    Commande TEXT,
-                    Name TEXT,
-                    Type TEXT,
-                    Value REAL,
-                    Unit TEXT,
-                    Timestamp INTEGER
-                )
-            ''')
+            conn = self.connect_db()
+            
+            # Create table and indexes if they don't exist
+            ensure_history_schema(conn, self.db_path)
             
-            # Insert data
-            for _, item in processed_df.iterrows():
-                cursor.execute('''
-                    INSERT INTO history (BAT, Datetime, Objet, Commande, Name, Type, Value, Unit, Timestamp)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', 
-                    (
-                        item['BAT'],
-                        item['Datetime'],
-                        item.get('Objet', ''),
-                        item.get('Commande', ''),
-                        item.get('Name', ''),
-                        item.get('Type', ''),
-                        item['Value'],
-                        item.get('Unit', '°C'),  # Set default unit to '°C'
-                        0
-                    )
-                )
-            
-            # Commit changes
-            conn.commit()
-            
-            print(f"Stored {len(processed_df)} weather data points in database")
+            # Insert or update data
+            changed = write_history(conn, processed_df, default_unit='°C')
+            
+            print(f"Stored {len(processed_df)} weather data points in database ({changed} new or changed)")
             return True
             
         except Exception as e:
             print(f"Error storing weather data: {e}")
             print(traceback.format_exc())
             return False
-            
-        finally:
-            # Close connection
-            if 'conn' in locals():
-                conn.close()
         
+    def get_archive(self):
+        """Return the Open-Meteo archive client, whose day cache and session are shared by all fetches of this fetcher."""
+        if self.archive is None:
+            self.archive = WeatherArchive(DailyWeatherCache(self.cache_path), concurrency=self.concurrency)
+        return self.archive
+    
     def fetch_weather_data(self, ville_name, start_date, end_date):
-        """Fetch weather data for a given city and date range using Open-Meteo free API."""
-        import requests
-        import os
-        from datetime import datetime, timedelta
-        import time
-        import random
-        import traceback
-        
-        print(f"Starting fetch for {ville_name} from {start_date} to {end_date}")
-        
-        # Create data directory if it doesn't exist
-        os.makedirs('data', exist_ok=True)
-        
-        # Format dates
-        try:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
-        except ValueError as e:
-            print(f"Error parsing dates: {e}")
-            return False
-        
-        # Check if date range is valid
-        if start_date_obj > end_date_obj:
-            print(f"Error: Start date {start_date} is after end date {end_date}")
-            return False
-        
-        # Calculate number of days
-        delta = end_date_obj - start_date_obj
-        num_days = delta.days + 1
-        
-        if num_days > 365:
-            print(f"Error: Date range too large ({num_days} days). Maximum is 365 days.")
-            return False
+        """
+        Fetch weather data for a given city and date range using Open-Meteo free API.
         
-        # Map French city names to coordinates (latitude, longitude)
-        city_coordinates = {
-            'Paris': {'latitude': 48.8566, 'longitude': 2.3522},
-            'Marseille': {'latitude': 43.2965, 'longitude': 5.3698},
-            'Lyon': {'latitude': 45.7578, 'longitude': 4.8320},
-            'Toulouse': {'latitude': 43.6047, 'longitude': 1.4442},
-            'Nice': {'latitude': 43.7102, 'longitude': 7.2620},
-            'Nantes': {'latitude': 47.2184, 'longitude': -1.5536},
-            'Strasbourg': {'latitude': 48.5734, 'longitude': 7.7521},
-            'Montpellier': {'latitude': 43.6108, 'longitude': 3.8767},
-            'Bordeaux': {'latitude': 44.8378, 'longitude': -0.5792},
-            'Lille': {'latitude': 50.6292, 'longitude': 3.0573},
-            'Tours': {'latitude': 47.3941, 'longitude': 0.6848},
-            'Roland': {'latitude': 47.3900, 'longitude': 0.6900},  # Approximate coordinates near Tours
-            'SampleCity': {'latitude': 48.8566, 'longitude': 2.3522}  # Use Paris for sample
-        }
-        
-        # Check if we have coordinates for this city
-        if ville_name not in city_coordinates:
-            print(f"Error: No coordinates found for '{ville_name}'")
-            return False
+        Days already fetched for the same coordinates are served from the on-disk
+        cache (see weather_archive.py), only the missing intervals are requested.
+        Ranges longer than a year are fetched in concurrent chunks.
+        """
+        return self.fetch_all_weather_data([
+            {'ville_name': ville_name, 'start_date': start_date, 'end_date': end_date}
+        ])[0]
+    
+    def fetch_all_weather_data(self, villes):
+        """
+        Fetch weather data for many cities and date ranges at once.
         
-        # Get coordinates
-        latitude = city_coordinates[ville_name]['latitude']
-        longitude = city_coordinates[ville_name]['longitude']
+        Cities are looked up in the site registry (sites.json). Cities in the
+        same grid cell are fetched once, and the chunks missing from the cache
+        are fetched in multi-location requests, at most self.concurrency at a
+        time. Each city's CSV file is written as
+        data/{ville_name}_{start_date}_{end_date}.csv.
         
-        # Use Open-Meteo API (free, no API key required)
-        base_url = "https://archive-api.open-meteo.com/v1/archive"
+        Args:
+            villes (list): Dicts with ville_name, start_date and end_date ('YYYY-MM-DD')
         
-        # Construct API URL
-        url = f"{base_url}?latitude={latitude}&longitude={longitude}&start_date={start_date}&end_date={end_date}&daily=temperature_2m_max,temperature_2m_min,temperature_2m_mean,precipitation_sum,windspeed_10m_max,winddirection_10m_dominant&timezone=Europe%2FBerlin"
+        Returns:
+            list: True or False for each city, in the order of villes
+        """
+        from datetime import datetime
         
-        print(f"Fetching weather data for {ville_name} from {start_date} to {end_date}")
-        print(f"API URL: {url}")
+        # Create data directory if it doesn't exist
+        os.makedirs('data', exist_ok=True)
         
-        try:
-            # Make API request
-            response = requests.get(url)
-            
-            print(f"Response status code: {response.status_code}")
-            
-            if response.status_code != 200:
-                print(f"Error fetching data: HTTP {response.status_code}")
-                print(f"Response: {response.text}")
-                return False
+        results = [False] * len(villes)
+        sites = []
+        for i, ville in enumerate(villes):
+            ville_name, start_date, end_date = ville['ville_name'], ville['start_date'], ville['end_date']
+            print(f"Starting fetch for {ville_name} from {start_date} to {end_date}")
             
-            # Parse JSON response
-            data = response.json()
+            # Format dates
+            try:
+                start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
+                end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
+            except ValueError as e:
+                print(f"Error parsing dates: {e}")
+                continue
             
-            # Convert to CSV format
-            csv_data = "date,temp_max,temp_min,temp_mean,precipitation,windspeed,winddirection\n"
+            # Check if date range is valid
+            if start_date_obj > end_date_obj:
+                print(f"Error: Start date {start_date} is after end date {end_date}")
+                continue
             
-            # Check if we have daily data
-            if 'daily' not in data:
-                print("Error: No daily data in response")
-                print(f"Response: {data}")
-                return False
-            
-            # Get daily data
-            daily = data['daily']
-            dates = daily.get('time', [])
-            temp_max = daily.get('temperature_2m_max', [])
-            temp_min = daily.get('temperature_2m_min', [])
-            temp_mean = daily.get('temperature_2m_mean', [])
-            precip = daily.get('precipitation_sum', [])
-            windspeed = daily.get('windspeed_10m_max', [])
-            winddir = daily.get('winddirection_10m_dominant', [])
-            
-            print(f"Retrieved {len(dates)} days of weather data")
-            
-            # Create CSV rows
-            for i in range(len(dates)):
-                csv_data += f"{dates[i]},{temp_max[i]},{temp_min[i]},{temp_mean[i]},{precip[i]},{windspeed[i]},{winddir[i]}\n"
+            # Check if we have coordinates for this city
+            if ville_name not in self.sites:
+                print(f"Error: No coordinates found for '{ville_name}'")
+                continue
             
-            # Save raw data to file
-            output_file = f"data/{ville_name}_{start_date}_{end_date}.csv"
-            with open(output_file, 'w') as f:
-                f.write(csv_data)
-            
-            print(f"Saved data to {output_file}")
-            return True
+            coordinates = self.sites[ville_name]
+            sites.append((i, coordinates['latitude'], coordinates['longitude'], start_date, end_date))
+        
+        if not sites:
+            return results
+        
+        try:
+            # Days already fetched are read from the cache, only missing intervals hit the API
+            archive = self.get_archive()
+            hits, misses = archive.cache.hits, archive.cache.misses
+            rows_by_site, errors = archive.daily_many(sites)
             
+            print(f"Retrieved weather data for {len(rows_by_site)} of {len(sites)} request(s) "
+                  f"({archive.cache.hits - hits} day(s) from cache, {archive.cache.misses - misses} fetched)")
         except Exception as e:
             print(f"Error fetching weather data: {e}")
             print(traceback.format_exc())
-            return False
+            return results
+        
+        for i, error in errors.items():
+            print(f"Error fetching weather data for {villes[i]['ville_name']}: {error}")
+        
+        for i, rows in rows_by_site.items():
+            ville = villes[i]
+            try:
+                self._write_weather_csv(ville['ville_name'], ville['start_date'], ville['end_date'], rows)
+                results[i] = True
+            except Exception as e:
+                print(f"Error saving weather data: {e}")
+                print(traceback.format_exc())
+        
+        return results
+    
+    def _write_weather_csv(self, ville_name, start_date, end_date, rows):
+        """Write daily archive rows to the CSV file read by process_weather_data."""
+        # Convert to CSV format
+        lines = ["date," + ",".join(WEATHER_COLUMNS)]
+        lines.extend(",".join(f"{value}" for value in row) for row in rows)
+        csv_data = "\n".join(lines) + "\n"
+        
+        # Save raw data to file
+        output_file = f"data/{ville_name}_{start_date}_{end_date}.csv"
+        with open(output_file, 'w') as f:
+            f.write(csv_data)
+        
+        print(f"Saved {len(rows)} days of weather data to {output_file}")
     
     def process_weather_data(self, ville_name, file_path):
-        """Process weather data from CSV file."""
+        """
+        Process weather data from CSV file.
+        
+        The file format (Open-Meteo, Visual Crossing, historique-meteo.net...)
+        is detected from its columns, see weather_formats.WEATHER_FORMATS.
+        """
         import pandas as pd
-        import sqlite3
         import os
         import traceback
         
@@ -265,168 +260,8 @@ class WeatherDataFetcher:
             # Read CSV file
             df = pd.read_csv(file_path)
             
-            # Check if this is from Open-Meteo API
-            if 'temp_max' in df.columns and 'temp_min' in df.columns:
-                # Process Open-Meteo data format
-                processed_data = []
-                
-                # Map Open-Meteo columns to our format
-                for _, row in df.iterrows():
-                    date_str = row['date']
-                    
-                    # Add temperature data
-                    processed_data.append({
-                        'Datetime': f"{date_str} 12:00:00",
-                        'BAT': ville_name,
-                        'Type': 'TEMPERATURE',
-                        'Value': row['temp_mean']
-                    })
-                    
-                    # Add min temperature data
-                    processed_data.append({
-                        'Datetime': f"{date_str} 00:00:00",
-                        'BAT': ville_name,
-                        'Type': 'TEMPERATURE_MIN',
-                        'Value': row['temp_min']
-                    })
-                    
-                    # Add max temperature data
-                    processed_data.append({
-                        'Datetime': f"{date_str} 00:00:00",
-                        'BAT': ville_name,
-                        'Type': 'TEMPERATURE_MAX',
-                        'Value': row['temp_max']
-                    })
-                    
-                    # Add wind speed data
-                    processed_data.append({
-                        'Datetime': f"{date_str} 12:00:00",
-                        'BAT': ville_name,
-                        'Type': 'WIND_SPEED',
-                        'Value': row['windspeed']
-                    })
-                    
-                    # Add precipitation data
-                    processed_data.append({
-                        'Datetime': f"{date_str} 12:00:00",
-                        'BAT': ville_name,
-                        'Type': 'PRECIPITATION',
-                        'Value': row['precipitation']
-                    })
-                
-                # Create DataFrame from processed data
-                processed_df = pd.DataFrame(processed_data)
-                
-            elif 'name' in df.columns and 'datetime' in df.columns:
-                # Process Visual Crossing data format
-                processed_data = []
-                
-                # Map Visual Crossing columns to our format
-                for _, row in df.iterrows():
-                    date_str = row['datetime']
-                    
-                    # Add temperature data
-                    processed_data.append({
-                        'Datetime': f"{date_str} 12:00:00",
-                        'BAT': ville_name,
-                        'Type': 'TEMPERATURE',
-                        'Value': row['temp']
-                    })
-                    
-                    # Add min temperature data
-                    processed_data.append({
-                        'Datetime': f"{date_str} 00:00:00",
-                        'BAT': ville_name,
-                        'Type': 'TEMPERATURE_MIN',
-                        'Value': row['tempmin']
-                    })
-                    
-                    # Add max temperature data
-                    processed_data.append({
-                        'Datetime': f"{date_str} 00:00:00",
-                        'BAT': ville_name,
-                        'Type': 'TEMPERATURE_MAX',
-                        'Value': row['tempmax']
-                    })
-                    
-                    # Add humidity data if available
-                    if 'humidity' in row:
-                        processed_data.append({
-                            'Datetime': f"{date_str} 12:00:00",
-                            'BAT': ville_name,
-                            'Type': 'HUMIDITY',
-                            'Value': row['humidity']
-                        })
-                    
-                    # Add wind speed data if available
-                    if 'windspeed' in row:
-                        processed_data.append({
-                            'Datetime': f"{date_str} 12:00:00",
-                            'BAT': ville_name,
-                            'Type': 'WIND_SPEED',
-                            'Value': row['windspeed']
-                        })
-                
-                # Create DataFrame from processed data
-                processed_df = pd.DataFrame(processed_data)
-                
-            else:
-                # Original format (historique-meteo.net)
-                # Assuming CSV format: date,temp_max,temp_min,etc.
-                df.columns = ['Date', 'TempMax', 'TempMin', 'WindSpeed', 'WindGust', 'WindDir', 
-                            'Precipitation', 'PressureMax', 'PressureMin', 'HumidityMax', 'HumidityMin',
-                            'Visibility', 'CloudCover', 'HeatIndexMax', 'HeatIndexMin', 'DewPointMax',
-                            'DewPointMin', 'WindChillMin', 'Sunrise', 'Sunset', 'MoonriseTime',
-                            'MoonsetTime', 'MoonPhase', 'UVIndex']
-                
-                # Process data
-                processed_data = []
-                
-                for _, row in df.iterrows():
-                    date_str = row['Date']
-                    
-                    # Add temperature data
-                    processed_data.append({
-                        'Datetime': f"{date_str} 12:00:00",
-                        'BAT': ville_name,
-                        'Type': 'TEMPERATURE',
-                        'Value': (row['TempMax'] + row['TempMin']) / 2  # Average temperature
-                    })
-                    
-                    # Add min temperature data
-                    processed_data.append({
-                        'Datetime': f"{date_str} 00:00:00",
-                        'BAT': ville_name,
-                        'Type': 'TEMPERATURE_MIN',
-                        'Value': row['TempMin']
-                    })
-                    
-                    # Add max temperature data
-                    processed_data.append({
-                        'Datetime': f"{date_str} 00:00:00",
-                        'BAT': ville_name,
-                        'Type': 'TEMPERATURE_MAX',
-                        'Value': row['TempMax']
-                    })
-                    
-                    # Add humidity data
-                    processed_data.append({
-                        'Datetime': f"{date_str} 12:00:00",
-                        'BAT': ville_name,
-                        'Type': 'HUMIDITY',
-                        'Value': (row['HumidityMax'] + row['HumidityMin']) / 2  # Average humidity
-                    })
-                    
-                    # Add wind speed data
-                    processed_data.append({
-                        'Datetime': f"{date_str} 12:00:00",
-                        'BAT': ville_name,
-                        'Type': 'WIND_SPEED',
-                        'Value': row['WindSpeed']
-                    })
-                
-                # Create DataFrame from processed data
-                processed_df = pd.DataFrame(processed_data)
+            # Reshape to one row per (day, Type) using the mapping of the detected format
+            processed_df = to_history_frame(df, ville_name)
             
             # Store data in database
             success = self.store_weather_data(processed_df)
@@ -444,13 +279,25 @@ class WeatherDataFetcher:
             print(traceback.format_exc())
             return False
     
-    def generate_visualizations(self, ville_name, viz_dir):
+    def generate_visualizations(self, ville_name, viz_dir, start_date=None, end_date=None, workers=None,
+                                resolution=None):
         """
         Generate visualizations for the weather data.
         
+        The history is read and pivoted once (see viz_context.py), plots whose
+        data has not changed are skipped and the others are rendered in this
+        process, or in a process pool for large windows when VIZ_RENDER_WORKERS
+        allows it. The time spent in each stage is kept in self.viz_timings.
+        
         Args:
             ville_name (str): Name of the city
             viz_dir (str): Directory to save visualizations
+            start_date (str): First day to plot (YYYY-MM-DD), from the first row if None
+            end_date (str): Last day to plot (YYYY-MM-DD), up to the last row if None
+            workers (int): Rendering processes, 1 renders in this process (if None,
+                VIZ_RENDER_WORKERS when at least VIZ_POOL_MIN_ROWS rows are plotted, else 1)
+            resolution (str): 'raw', 'hourly' or 'daily' rows, chosen from the length of the
+                window if None (see viz_context.choose_resolution)
             
         Returns:
             pandas.DataFrame: DataFrame containing the weather data
@@ -458,72 +305,98 @@ class WeatherDataFetcher:
         try:
             print(f"Generating visualizations for {ville_name}")
             
-            # Connect to database
-            conn = sqlite3.connect('smarthome.db')
-            
-            # Query for weather data
-            query = """
-                SELECT Datetime, Type, Value
-                FROM history
-                WHERE BAT = ?
-                ORDER BY Datetime
-            """
-            
-            # Execute query
-            df = pd.read_sql_query(query, conn, params=(ville_name,))
-            
-            # Close connection
-            conn.close()
+            # Read the Types used by the plots (and the devices) and pivot them once
+            types = sorted({type_ for _, _, plot_types in VIZ_PLOTS if plot_types for type_ in plot_types})
+            conn = self.connect_db()
+            ensure_history_schema(conn, self.db_path)
+            context = VizContext.load(conn, ville_name, types=types, devices=True,
+                                      start=start_date, end=end_date, resolution=resolution)
+            self.viz_timings = context.timings
             
-            if df.empty:
+            if context.empty:
                 print(f"No data found for {ville_name}")
                 return pd.DataFrame()
             
-            # Convert datetime to pandas datetime
-            df['Datetime'] = pd.to_datetime(df['Datetime'])
+            # The rollups plot one mean per period, which cannot be summed: the device pie
+            # takes its totals from the Sums of the daily rollup instead
+            device_partials = None
+            device_types = context.device_types()
+            if context.resolution != 'raw' and device_types:
+                with context.stage('query'):
+                    device_partials = rollup_frame(read_daily_rollup(conn, ville_name, types=device_types,
+                                                                     start=start_date, end=end_date))
+            
+            # Skip the plots whose data has not changed
+            cache = RenderCache(viz_dir)
+            jobs = []
+            with context.stage('cache'):
+                for method, names, plot_types in VIZ_PLOTS:
+                    data = context.frame(plot_types if plot_types is not None else device_types)
+                    options = {'partials': device_partials} if plot_types is None and device_partials is not None else {}
+                    files = [f"{viz_dir}/{ville_name}_{name}.png" for name in names]
+                    stem = f"{viz_dir}/{ville_name}_{names[0]}"
+                    key = RenderCache.make_key(data, plot=method, ville_name=ville_name, resolution=context.resolution,
+                                               **{name: RenderCache.make_key(value) for name, value in options.items()})
+                    
+                    if cache.is_fresh(stem, key):
+                        print(f"Visualization {os.path.basename(stem)} is up to date")
+                        continue
+                    jobs.append({'method': method, 'data': data, 'options': options, 'ville_name': ville_name,
+                                 'viz_dir': viz_dir, 'name': names[0], 'stem': stem, 'key': key, 'files': files})
+            
+            with context.stage('render'):
+                if workers is None:
+                    workers = VIZ_RENDER_WORKERS if len(context.rows) >= VIZ_POOL_MIN_ROWS else 1
+                workers = min(workers, len(jobs))
+                if workers > 1:
+                    # Use spawn so workers start from a clean interpreter with the Agg backend
+                    mp_context = multiprocessing.get_context('spawn')
+                    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+                        durations = list(executor.map(_render_plot, jobs))
+                else:
+                    durations = [_render_plot(job) for job in jobs]
+            
+            with context.stage('save'):
+                for job in jobs:
+                    # Plots without data produce no file and are simply retried next time
+                    if all(os.path.exists(path) for path in job['files']):
+                        cache.store(job['stem'], job['key'], job['files'])
+                cache.save()
             
-            # Generate visualizations
-            self._generate_temperature_viz(df, ville_name, viz_dir)
-            self._generate_precipitation_viz(df, ville_name, viz_dir)
-            self._generate_wind_viz(df, ville_name, viz_dir)
-            self._generate_consumption_viz(df, ville_name, viz_dir)
-            self._generate_device_consumption_viz(df, ville_name, viz_dir)
-            self._generate_smart_home_dashboard(df, ville_name, viz_dir)
+            plots = ', '.join(f"{job['name']} {seconds:.2f}s" for job, seconds in zip(jobs, durations))
+            print(f"Visualizations of {ville_name}: {context.report()} "
+                  f"({len(jobs)} plot(s) rendered with {max(workers, 1)} worker(s){': ' + plots if plots else ''})")
             
-            return df
+            return context.rows
         except Exception as e:
             print(f"Error generating visualizations: {e}")
             traceback.print_exc()
             return pd.DataFrame()
     
-    def _generate_temperature_viz(self, df, ville_name, viz_dir):
+    @staticmethod
+    def _generate_temperature_viz(data, ville_name, viz_dir):
         """
         Generate temperature visualization.
         
         Args:
-            df (pandas.DataFrame): DataFrame containing the weather data
+            data (pandas.DataFrame): Temperature Types by Datetime (see viz_context.py)
             ville_name (str): Name of the city
             viz_dir (str): Directory to save visualization
         """
         try:
-            # Filter for temperature data
-            temp_df = df[df['Type'].isin(['TEMPERATURE', 'TEMPERATURE_MIN', 'TEMPERATURE_MAX'])]
-            
-            if temp_df.empty:
+            if data.empty:
                 print("No temperature data found")
                 return
             
-            # Pivot data
-            pivot_df = temp_df.pivot(index='Datetime', columns='Type', values='Value')
-            
             # Rename columns
-            pivot_df.columns = ['Average', 'Maximum', 'Minimum'] if len(pivot_df.columns) == 3 else pivot_df.columns
+            pivot_df = data.rename(columns={'TEMPERATURE': 'Average', 'TEMPERATURE_MAX': 'Maximum',
+                                            'TEMPERATURE_MIN': 'Minimum'})
             
             # Create figure
             plt.figure(figsize=(12, 6))
             
             # Plot data
-            if 'Minimum' in pivot_df.columns:
+            if 'Minimum' in pivot_df.columns and 'Maximum' in pivot_df.columns:
                 plt.fill_between(pivot_df.index, pivot_df['Minimum'], pivot_df['Maximum'], 
                                  alpha=0.2, color='blue', label='Temperature Range')
             
@@ -560,20 +433,20 @@ class WeatherDataFetcher:
             print(f"Error generating temperature visualization: {e}")
             traceback.print_exc()
     
-    def _generate_precipitation_viz(self, df, ville_name, viz_dir):
+    @staticmethod
+    def _generate_precipitation_viz(data, ville_name, viz_dir):
         """
         Generate precipitation visualization.
         
         Args:
-            df (pandas.DataFrame): DataFrame containing the weather data
+            data (pandas.DataFrame): PRECIPITATION by Datetime (see viz_context.py)
             ville_name (str): Name of the city
             viz_dir (str): Directory to save visualization
         """
         try:
-            # Filter for precipitation data
-            precip_df = df[df['Type'] == 'PRECIPITATION']
+            precip = data['PRECIPITATION'] if 'PRECIPITATION' in data.columns else pd.Series(dtype=float)
             
-            if precip_df.empty:
+            if precip.empty:
                 print("No precipitation data found")
                 return
             
@@ -581,7 +454,7 @@ class WeatherDataFetcher:
             plt.figure(figsize=(12, 6))
             
             # Plot data
-            plt.bar(precip_df['Datetime'], precip_df['Value'], width=0.8, color='skyblue', alpha=0.7)
+            plt.bar(precip.index, precip.values, width=0.8, color='skyblue', alpha=0.7)
             
             # Add labels and title
             plt.xlabel('Date')
@@ -593,10 +466,8 @@ class WeatherDataFetcher:
             plt.gcf().autofmt_xdate()
             
             # Add data points and values
-            for i, row in precip_df.iterrows():
-                if row['Value'] > 0:
-                    plt.text(row['Datetime'], row['Value'] + 0.5, f"{row['Value']:.1f}", 
-                             ha='center', va='bottom', fontsize=8)
+            for when, value in precip[precip > 0].items():
+                plt.text(when, value + 0.5, f"{value:.1f}", ha='center', va='bottom', fontsize=8)
             
             # Save figure
             plt.tight_layout()
@@ -608,20 +479,20 @@ class WeatherDataFetcher:
             print(f"Error generating precipitation visualization: {e}")
             traceback.print_exc()
     
-    def _generate_wind_viz(self, df, ville_name, viz_dir):
+    @staticmethod
+    def _generate_wind_viz(data, ville_name, viz_dir):
         """
         Generate wind visualization.
         
         Args:
-            df (pandas.DataFrame): DataFrame containing the weather data
+            data (pandas.DataFrame): WIND_SPEED by Datetime (see viz_context.py)
             ville_name (str): Name of the city
             viz_dir (str): Directory to save visualization
         """
         try:
-            # Filter for wind data
-            wind_df = df[df['Type'] == 'WIND_SPEED']
+            wind = data['WIND_SPEED'] if 'WIND_SPEED' in data.columns else pd.Series(dtype=float)
             
-            if wind_df.empty:
+            if wind.empty:
                 print("No wind data found")
                 return
             
@@ -629,8 +500,8 @@ class WeatherDataFetcher:
             plt.figure(figsize=(12, 6))
             
             # Plot data
-            plt.plot(wind_df['Datetime'], wind_df['Value'], 'g-', linewidth=2)
-            plt.fill_between(wind_df['Datetime'], 0, wind_df['Value'], alpha=0.2, color='green')
+            plt.plot(wind.index, wind.values, 'g-', linewidth=2)
+            plt.fill_between(wind.index, 0, wind.values, alpha=0.2, color='green')
             
             # Add labels and title
             plt.xlabel('Date')
@@ -642,7 +513,7 @@ class WeatherDataFetcher:
             plt.gcf().autofmt_xdate()
             
             # Add data points
-            plt.scatter(wind_df['Datetime'], wind_df['Value'], s=30, color='green', alpha=0.7)
+            plt.scatter(wind.index, wind.values, s=30, color='green', alpha=0.7)
             
             # Save figure
             plt.tight_layout()
@@ -654,25 +525,22 @@ class WeatherDataFetcher:
             print(f"Error generating wind visualization: {e}")
             traceback.print_exc()
     
-    def _generate_consumption_viz(self, df, ville_name, viz_dir):
+    @staticmethod
+    def _generate_consumption_viz(data, ville_name, viz_dir):
         """
         Generate energy consumption visualization.
         
         Args:
-            df (pandas.DataFrame): DataFrame containing the smart home data
+            data (pandas.DataFrame): ELECTRICITY, GAS and WATER by Datetime (see viz_context.py)
             ville_name (str): Name of the city
             viz_dir (str): Directory to save visualization
         """
         try:
-            # Filter for consumption data
-            consumption_df = df[df['Type'].isin(['ELECTRICITY', 'GAS', 'WATER'])]
-            
-            if consumption_df.empty:
+            if data.empty:
                 print("No consumption data found")
                 return
             
-            # Pivot data
-            pivot_df = consumption_df.pivot(index='Datetime', columns='Type', values='Value')
+            pivot_df = data
             
             # Create figure
             plt.figure(figsize=(12, 6))
@@ -711,35 +579,25 @@ class WeatherDataFetcher:
             print(f"Error generating consumption visualization: {e}")
             traceback.print_exc()
     
-    def _generate_device_consumption_viz(self, df, ville_name, viz_dir):
+    @staticmethod
+    def _generate_device_consumption_viz(data, ville_name, viz_dir, partials=None):
         """
         Generate device-specific consumption visualization.
         
         Args:
-            df (pandas.DataFrame): DataFrame containing the smart home data
+            data (pandas.DataFrame): Device Types by Datetime (see VizContext.device_types)
             ville_name (str): Name of the city
             viz_dir (str): Directory to save visualization
+            partials (pandas.DataFrame): Partial aggregates of the devices for the pie totals
+                (see _generate_device_consumption_pie)
         """
         try:
-            # Filter for device consumption data
-            # Look for types that start with 'DEVICE_' or contain 'DEVICE'
-            device_df = df[df['Type'].str.contains('DEVICE', case=False, na=False)]
-            
-            if device_df.empty:
+            if data.empty:
                 print("No device consumption data found")
-                # Try to find any columns that might represent devices
-                potential_devices = df[~df['Type'].isin(['TEMPERATURE', 'TEMPERATURE_MIN', 'TEMPERATURE_MAX', 
-                                                      'PRECIPITATION', 'WIND_SPEED', 'HUMIDITY', 
-                                                      'ELECTRICITY', 'GAS', 'WATER', 'INDOOR_TEMP'])]
-                
-                if not potential_devices.empty:
-                    print(f"Found potential device data: {potential_devices['Type'].unique()}")
-                    device_df = potential_devices
-                else:
-                    return
+                return
             
-            # Get unique device types
-            device_types = device_df['Type'].unique()
+            # Get device types
+            device_types = list(data.columns)
             print(f"Found device types: {device_types}")
             
             # Create figure
@@ -750,13 +608,13 @@ class WeatherDataFetcher:
             
             # Plot data for each device
             for i, device_type in enumerate(device_types):
-                device_data = device_df[device_df['Type'] == device_type]
-                plt.plot(device_data['Datetime'], device_data['Value'], 
+                device_data = data[device_type].dropna()
+                plt.plot(device_data.index, device_data.values, 
                          linestyle='-', linewidth=2, color=colors[i], 
-                         label=device_type.replace('DEVICE_', '').title())
+                         label=device_label(device_type))
                 
                 # Add data points
-                plt.scatter(device_data['Datetime'], device_data['Value'], 
+                plt.scatter(device_data.index, device_data.values, 
                            s=30, color=colors[i], alpha=0.7)
             
             # Add labels and title
@@ -782,34 +640,37 @@ class WeatherDataFetcher:
             print(f"Device consumption visualization saved to {viz_dir}/{ville_name}_device_consumption.png")
             
             # Create a pie chart showing total consumption by device
-            self._generate_device_consumption_pie(device_df, ville_name, viz_dir)
+            WeatherDataFetcher._generate_device_consumption_pie(data, ville_name, viz_dir, partials)
             
         except Exception as e:
             print(f"Error generating device consumption visualization: {e}")
             traceback.print_exc()
     
-    def _generate_device_consumption_pie(self, device_df, ville_name, viz_dir):
+    @staticmethod
+    def _generate_device_consumption_pie(data, ville_name, viz_dir, partials=None):
         """
         Generate a pie chart showing total consumption by device.
         
         Args:
-            device_df (pandas.DataFrame): DataFrame containing device consumption data
+            data (pandas.DataFrame): Device Types by Datetime (see VizContext.device_types)
             ville_name (str): Name of the city
             viz_dir (str): Directory to save visualization
+            partials (pandas.DataFrame): Partial aggregates of the devices (see history_summaries.py),
+                built from the rows of data if None (only valid for raw rows)
         """
         try:
-            # Group by device type and sum values
-            device_totals = device_df.groupby('Type')['Value'].sum().reset_index()
+            if partials is None:
+                partials = to_partials(to_rows(data))
             
-            # Sort by total consumption (descending)
-            device_totals = device_totals.sort_values('Value', ascending=False)
+            # Totals per device type (see history_summaries.py), largest first
+            device_totals = device_stats(partials).sort_values('total', ascending=False)
             
             # Create figure
             plt.figure(figsize=(10, 10))
             
             # Create pie chart
-            plt.pie(device_totals['Value'], 
-                   labels=[t.replace('DEVICE_', '').title() for t in device_totals['Type']], 
+            plt.pie(device_totals['total'], 
+                   labels=device_totals['label'], 
                    autopct='%1.1f%%',
                    startangle=90,
                    shadow=True,
@@ -832,12 +693,13 @@ class WeatherDataFetcher:
             print(f"Error generating device consumption pie chart: {e}")
             traceback.print_exc()
     
-    def _generate_smart_home_dashboard(self, df, ville_name, viz_dir):
+    @staticmethod
+    def _generate_smart_home_dashboard(data, ville_name, viz_dir):
         """
         Generate a comprehensive smart home dashboard visualization.
         
         Args:
-            df (pandas.DataFrame): DataFrame containing the smart home data
+            data (pandas.DataFrame): Dashboard Types by Datetime (see viz_context.py)
             ville_name (str): Name of the city
             viz_dir (str): Directory to save visualization
             
@@ -852,10 +714,8 @@ class WeatherDataFetcher:
             fig.suptitle(f'Smart Home Dashboard - {ville_name}', fontsize=16)
             
             # 1. Temperature Plot
-            temp_df = df[df['Type'].isin(['TEMPERATURE', 'TEMPERATURE_MIN', 'TEMPERATURE_MAX', 'INDOOR_TEMP'])]
-            if not temp_df.empty:
-                # Pivot data
-                pivot_df = temp_df.pivot(index='Datetime', columns='Type', values='Value')
+            pivot_df = select(data, ['TEMPERATURE', 'TEMPERATURE_MIN', 'TEMPERATURE_MAX', 'INDOOR_TEMP'])
+            if not pivot_df.empty:
                 
                 # Plot outdoor temperatures
                 if 'TEMPERATURE' in pivot_df.columns:
@@ -876,10 +736,8 @@ class WeatherDataFetcher:
                 axs[0].legend(loc='upper right')
             
             # 2. Energy Consumption Plot
-            consumption_df = df[df['Type'].isin(['ELECTRICITY', 'GAS', 'WATER'])]
-            if not consumption_df.empty:
-                # Pivot data
-                pivot_df = consumption_df.pivot(index='Datetime', columns='Type', values='Value')
+            pivot_df = select(data, ['ELECTRICITY', 'GAS', 'WATER'])
+            if not pivot_df.empty:
                 
                 # Plot each consumption type
                 if 'ELECTRICITY' in pivot_df.columns:
@@ -897,15 +755,12 @@ class WeatherDataFetcher:
                 axs[1].legend(loc='upper right')
             
             # 3. Weather Conditions Plot
-            weather_df = df[df['Type'].isin(['PRECIPITATION', 'WIND_SPEED', 'HUMIDITY'])]
-            if not weather_df.empty:
+            pivot_df = select(data, ['PRECIPITATION', 'WIND_SPEED', 'HUMIDITY'])
+            if not pivot_df.empty:
                 # Create twin axis for different scales
                 ax3 = axs[2]
                 ax3_twin = ax3.twinx()
                 
-                # Pivot data
-                pivot_df = weather_df.pivot(index='Datetime', columns='Type', values='Value')
-                
                 # Plot precipitation as bars
                 if 'PRECIPITATION' in pivot_df.columns:
                     ax3.bar(pivot_df.index, pivot_df['PRECIPITATION'], width=0.02, color='skyblue', alpha=0.7, label='Precipitation (mm)')
@@ -928,10 +783,11 @@ class WeatherDataFetcher:
                 lines2, labels2 = ax3_twin.get_legend_handles_labels()
                 ax3.legend(lines1 + lines2, labels1 + labels2, loc='upper right')
             
-            # Format x-axis for all subplots
+            # Format x-axis for all subplots, with about 15 day ticks whatever the window
+            days = (data.index.max() - data.index.min()).days if not data.empty else 0
             for ax in axs:
                 ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-                ax.xaxis.set_major_locator(mdates.DayLocator(interval=1))
+                ax.xaxis.set_major_locator(mdates.DayLocator(interval=max(1, days // 15)))
                 plt.setp(ax.xaxis.get_majorticklabels(), rotation=45)
             
             # Adjust layout
@@ -947,6 +803,17 @@ class WeatherDataFetcher:
             print(f"Error generating smart home dashboard: {e}")
             traceback.print_exc()
 
+def _render_plot(job):
+    """
+    Render one plot of generate_visualizations (process pool worker).
+    
+    Returns:
+        float: Seconds spent rendering
+    """
+    started = time.perf_counter()
+    getattr(WeatherDataFetcher, job['method'])(job['data'], job['ville_name'], job['viz_dir'], **job['options'])
+    return time.perf_counter() - started
+
 def main():
     # Define cities
     villes = [
@@ -957,14 +824,11 @@ def main():
     try:
         fetcher = WeatherDataFetcher()
         
+        # Fetch all cities concurrently
+        results = fetcher.fetch_all_weather_data(villes)
+        
         # Process each city
-        for ville in villes:
-            success = fetcher.fetch_weather_data(
-                ville_name=ville['ville_name'],
-                start_date=ville['start_date'],
-                end_date=ville['end_date']
-            )
-            
+        for ville, success in zip(villes, results):
             if success:
                 # Process weather data
                 fetcher.process_weather_data(ville['ville_name'], f"data/{ville['ville_name']}_{ville['start_date']}_{ville['end_date']}.csv")
@@ -0,0 +1,124 @@
+"""
+Source formats of the weather CSV files.
+
+Each provider is described by a mapping from its columns to history Types, and
+files are converted to the long (Datetime, BAT, Type, Value) format with a
+single melt. Supporting a new provider only needs a new WEATHER_FORMATS entry.
+"""
+
+import pandas as pd
+
+# Providers tried in order; the first one whose 'detect' columns are all present is used,
+# and the one without 'detect' is the fallback. Each entry has:
+#   detect: columns identifying the format
+#   columns: names given to the columns of files without a usable header
+#   date: column holding the day
+#   types: (Type, column or function of the frame, time of day) in output order
+#   optional: columns whose Type is skipped when the file does not have them
+WEATHER_FORMATS = {
+    'open-meteo': {
+        'detect': ['temp_max', 'temp_min'],
+        'date': 'date',
+        'types': [
+            ('TEMPERATURE', 'temp_mean', '12:00:00'),
+            ('TEMPERATURE_MIN', 'temp_min', '00:00:00'),
+            ('TEMPERATURE_MAX', 'temp_max', '00:00:00'),
+            ('WIND_SPEED', 'windspeed', '12:00:00'),
+            ('PRECIPITATION', 'precipitation', '12:00:00'),
+        ],
+    },
+    'visual-crossing': {
+        'detect': ['name', 'datetime'],
+        'date': 'datetime',
+        'types': [
+            ('TEMPERATURE', 'temp', '12:00:00'),
+            ('TEMPERATURE_MIN', 'tempmin', '00:00:00'),
+            ('TEMPERATURE_MAX', 'tempmax', '00:00:00'),
+            ('HUMIDITY', 'humidity', '12:00:00'),
+            ('WIND_SPEED', 'windspeed', '12:00:00'),
+        ],
+        'optional': ['humidity', 'windspeed'],
+    },
+    'historique-meteo': {
+        'columns': ['Date', 'TempMax', 'TempMin', 'WindSpeed', 'WindGust', 'WindDir',
+                    'Precipitation', 'PressureMax', 'PressureMin', 'HumidityMax', 'HumidityMin',
+                    'Visibility', 'CloudCover', 'HeatIndexMax', 'HeatIndexMin', 'DewPointMax',
+                    'DewPointMin', 'WindChillMin', 'Sunrise', 'Sunset', 'MoonriseTime',
+                    'MoonsetTime', 'MoonPhase', 'UVIndex'],
+        'date': 'Date',
+        'types': [
+            ('TEMPERATURE', lambda df: (df['TempMax'] + df['TempMin']) / 2, '12:00:00'),
+            ('TEMPERATURE_MIN', 'TempMin', '00:00:00'),
+            ('TEMPERATURE_MAX', 'TempMax', '00:00:00'),
+            ('HUMIDITY', lambda df: (df['HumidityMax'] + df['HumidityMin']) / 2, '12:00:00'),
+            ('WIND_SPEED', 'WindSpeed', '12:00:00'),
+        ],
+    },
+}
+
+
+def detect_weather_format(df):
+    """
+    Return the name of the WEATHER_FORMATS entry matching a raw frame.
+
+    Args:
+        df (pandas.DataFrame): Frame as read from the CSV file
+
+    Returns:
+        str: Key of WEATHER_FORMATS
+    """
+    fallback = None
+    for name, fmt in WEATHER_FORMATS.items():
+        if 'detect' not in fmt:
+            fallback = fallback or name
+        elif all(column in df.columns for column in fmt['detect']):
+            return name
+
+    if fallback is None:
+        raise ValueError(f"Unknown weather data format with columns {list(df.columns)}")
+    return fallback
+
+
+def to_history_frame(df, ville_name, format_name=None):
+    """
+    Convert a provider frame to long format rows for the history table.
+
+    Rows are ordered by source row, then by the order of the format's types.
+
+    Args:
+        df (pandas.DataFrame): Frame as read from the CSV file
+        ville_name (str): Value of the BAT column
+        format_name (str): Key of WEATHER_FORMATS, detected if not given
+
+    Returns:
+        pandas.DataFrame: Datetime, BAT, Type and Value columns
+    """
+    fmt = WEATHER_FORMATS[format_name or detect_weather_format(df)]
+
+    if 'columns' in fmt:
+        df = df.set_axis(fmt['columns'], axis=1)
+
+    optional = fmt.get('optional', [])
+    types = [
+        (type_name, source, time) for type_name, source, time in fmt['types']
+        if not (isinstance(source, str) and source in optional and source not in df.columns)
+    ]
+
+    # One column per Type, then a single reshape to one row per (day, Type)
+    values = pd.DataFrame(
+        {type_name: df[source] if isinstance(source, str) else source(df) for type_name, source, _ in types},
+        index=df.index
+    )
+    values['_date'] = df[fmt['date']].astype(str)
+
+    long_df = values.melt(id_vars='_date', var_name='Type', value_name='Value', ignore_index=False)
+    long_df = long_df.sort_index(kind='stable').reset_index(drop=True)
+
+    times = long_df['Type'].map({type_name: time for type_name, _, time in types})
+
+    return pd.DataFrame({
+        'Datetime': long_df['_date'] + ' ' + times,
+        'BAT': ville_name,
+        'Type': long_df['Type'],
+        'Value': long_df['Value'],
+    })